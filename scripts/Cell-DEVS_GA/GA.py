@@ -7,42 +7,86 @@
 # 
 # This file uses:
 # - the ScenariosGenerator class to generate different scenarios for CO2 models.
-# - Pypi geneticalgorithm library.
+# - the GeneticAlgorithm class (optimizer.py), which writes a snapshot of the run after every generation.
 # - Cadmium simulator.
 
 # **To run this code:**
 # - export ga.ipuynb and generator.ipynb as executable scripts
 # - from Ubuntu shell of the same directory: (1) make sure there is a results dirctory and (2) run the generated script "python3 ga.py"
 # - the output of the GA will be in GA_ouput.json
+# - if the run stops (e.g. a crash or a reboot), running the script again resumes it from the last snapshot
+#   (GA_vents_checkpoint.json, GA_seats_checkpoint.json)
 # - e.g., [9.0, 8.0, 7.0, 7.0] is the list of values for an objective function for 4 iterations of the GA
 
 # In[21]:
 
 
 import numpy as np
-from geneticalgorithm import geneticalgorithm as ga
+from optimizer import GeneticAlgorithm
 from generator import ScenariosGenerator
 
 #for running Cadmium
 import os
 import subprocess
 
-#for using ArsLab parser to read the log file
-import sys
-sys.path.append('./arslab-converter')
-from parsers.cadmium.structure import CadmiumStructure
-from parsers.cadmium.state import CadmiumState
-from formats.format import Format
+#for reading the last frame of the log file
+from fitness import get_final_type_histogram
+
+#for evaluating whole populations in parallel (with Cadmium) or in one batch (with the Python engine)
+from evaluation import PopulationEvaluator, EngineEvaluator, MultiFidelityEvaluator, get_generator
+
+#for rejecting broken candidates (e.g. vents placed over walls) before they are simulated
+from evaluation import check_candidate
+
+#for scoring candidates with a surrogate of the simulation, so only the most promising ones are simulated
+from evaluation import make_candidate_scenario
+from surrogate import load_surrogate, scenario_sample, select_promising
+
+#for encoding candidates as places where vents or occupants can be put, so no candidate is broken
+from search_space import FreeCellSpace
+
+#for storing the results of simulated scenarios across GA runs
+from cache import FitnessCache, scenario_context
 
 #for storing GA results and others
 import json
 
+#settings shared by the evaluation functions
+#these could also be read from a config file in future versions
+CONFIG_FILE = "in/config.json"
+MODEL_PATH = "../../computer_lab_infection/bin/co2_lab"
+CACHE_FILE = "fitness_cache.sqlite"
+#fraction of the new candidates of a population that are simulated when a surrogate is used (see evaluate_population)
+SURROGATE_FRACTION = 0.3
+#snapshots of the GA runs, written after every generation (see optimizer.py)
+VENTS_CHECKPOINT_FILE = "GA_vents_checkpoint.json"
+SEATS_CHECKPOINT_FILE = "GA_seats_checkpoint.json"
+
+#the number of exposed occupants of every simulated scenario is stored in a database on disk shared by ga_vents, ga_seats
+#and later GA runs. The purpose of this is to avoid running the simulation again for a scenario that has been used before
+#(including the same vents or occupants given in a different order).
+#results are kept apart for each model that produced them (the Cadmium model or the Python engine, see co2_engine.py)
+fitness_caches = dict()
+
+
+# Function: get_fitness_cache
+# Purpose: opens the fitness cache of a model the first time it is needed
+# Arguments: model_path: path of the model the results come from (the Cadmium model by default)
+# Return: the FitnessCache shared by all evaluation functions using that model
+
+def get_fitness_cache(model_path=MODEL_PATH):
+    model_path = os.path.abspath(model_path)
+    if model_path not in fitness_caches:
+        fitness_caches[model_path] = FitnessCache(CACHE_FILE, scenario_context(CONFIG_FILE, model_path))
+    return fitness_caches[model_path]
+
 
 # In[3]:
 
 
 # Function: get_exposed_occupants
 # Purpose: extracts the required data from the log files (That is the the number of occupants who are at higher risk by the end of simulation)
+    #only the last frame of the log is read (backwards from the end of the file)
 # Arguments: log_File: the log file Carmium produce as a result of the simulation ("state.txt")
 # Return:
     #occupants_at_risk: the number of occupants who are of type EXPOSED_CO2_SOURCE = -250
@@ -58,24 +102,9 @@ def get_exposed_occupants(log_file):
     if (not os.path.isfile(log_file)) or (log_file.find("state") == -1):
         return -1
     
-    frame_index = 0
-    parsing_files = ["structure.json", log_file]
-    structure = CadmiumStructure().parse(parsing_files)
-    messages = CadmiumState(structure).parse(parsing_files)
-
-    #Get the number of different time frames we have
-    number_of_frames = messages.size()
-    occupants_at_risk = 0
-    
-    #get the last time frame to know the numbe rof sick occupants at the end of simulation
-    frame = messages.get_frame(str(number_of_frames-1))
-    
-    #loop on the timeframes in each file
-    occupants_at_risk = 0
-    #loop on all the messages at each timeframe 
-    for message in frame:
-        if( int(message.values[2]) == EXPOSED_CO2_SOURCE ):
-            occupants_at_risk = occupants_at_risk + 1
+    #get the type of every cell in the last time frame to know the number of sick occupants at the end of simulation
+    histogram = get_final_type_histogram(log_file)
+    occupants_at_risk = histogram[EXPOSED_CO2_SOURCE]
         
     return occupants_at_risk
 
@@ -90,36 +119,38 @@ def get_exposed_occupants(log_file):
 # Arguments: vent_loc: an numpy array of values sent by the calling GA. For example, vent_loc[0] and vent_loc[1] are the xy coordinates of the first vent.
 # Return:
     #occupants_at_risk: the number of occupants who are of type EXPOSED_CO2_SOURCE = -250
-    
-#a global dictionary where the number of exposed occupants for all simulated scenarios is stored. 
-#The purpose of this is to avoid running the simulation again for a json scenario with vent_loc that has been used again.
-
-vent_results_database = dict()
 
 def evlauate_vent_loc(vent_loc):
-    global vent_results_database
+    cache = get_fitness_cache()
     
     #if the scenario with this vent location has been simulated before
     #do not simulate again
     #return the number of exposed occupants stored from previous simulation
-    if str(vent_loc) in vent_results_database:
-        return vent_results_database[str(vent_loc)]
+    exposed_occupants = cache.get("vents", vent_loc)
+    if exposed_occupants is not None:
+        return exposed_occupants
+    
+    #if the scenario is broken (e.g. a vent over a wall), do not simulate it
+    #the candidate gets a score worse than any simulation (rejected candidates are not cached)
+    rejected_score = check_candidate(CONFIG_FILE, "vents", vent_loc)
+    if rejected_score is not None:
+        return rejected_score
     
     output_file = "state.txt"
     #generate a scenario with this vent location
     #the ScenariosGenerator reads configurations such as initial scenario name, vet size, vent concentration, etc from a configuration file
-    generator = ScenariosGenerator("in/config.json")
+    #it is only created once (get_generator keeps it), so the input scenario is not read again for every candidate
+    generator = get_generator(CONFIG_FILE)
     scenario_name = generator.create_vent_scenario(vent_loc)
 
     #run the simulation
-    #this could also be read froma config file in future versions
-    model_path = "../../computer_lab_infection/bin/co2_lab"
     scenarios_path = "out/" + scenario_name
 
+    exposed_occupants = -1
     if os.path.isfile(scenarios_path):
         #create results directory #the simulator expects a directory named "results" to be available.
         #call simulator
-        subprocess.check_call([model_path, scenarios_path])
+        subprocess.check_call([MODEL_PATH, scenarios_path])
         
         #read the log to get the number of occupants exposed to high CO2 for a long time
         #and therefore are at risk of getting infected!
@@ -127,7 +158,7 @@ def evlauate_vent_loc(vent_loc):
 
     #print("number of sick occuapnst:" + str(exposed_occupants) +",scenrio name: " + scenario_name)
 
-    vent_results_database[str(vent_loc)] = exposed_occupants    
+    cache.put("vents", vent_loc, exposed_occupants)
 
     return exposed_occupants
 
@@ -135,28 +166,62 @@ def evlauate_vent_loc(vent_loc):
 # In[10]:
 
 
+# Function: run_ga
+# Purpose: runs the GA of ga_vents or ga_seats. Every generation is scored at once by evaluate_population: the new
+    #candidates are simulated concurrently by a PopulationEvaluator, each in its own scratch directory.
+# Arguments:
+    #kind: "vents" or "seats"
+    #space: FreeCellSpace the candidates are encoded in
+    #algorithm_param: parameters of the GA (see optimizer.py)
+    #checkpoint_file: snapshot of the run
+    #resume: if True, an unfinished run is resumed from its snapshot
+    #workers: number of simulations run at the same time (None for one per CPU)
+    #surrogate: if True, only the most promising new candidates of a generation are simulated (see surrogate.py)
+    #screen_timesteps: if given, candidates are first simulated for this time and only the ones close to the best are
+        #simulated for the full time (see MultiFidelityEvaluator in evaluation.py)
+# Return: the GeneticAlgorithm after its run
+
+def run_ga(kind, space, algorithm_param, checkpoint_file, resume=True, workers=None, surrogate=False, screen_timesteps=None):
+    evaluator = PopulationEvaluator(kind, CONFIG_FILE, MODEL_PATH, workers=workers)
+    if screen_timesteps is not None:
+        evaluator = MultiFidelityEvaluator(evaluator, screen_timesteps, cache=get_fitness_cache())
+    model_surrogate = None
+    if surrogate:
+        model_surrogate = load_surrogate(CONFIG_FILE, get_generator(CONFIG_FILE).scenario["scenario"]["shape"])
+
+    with evaluator:
+        #the GA sends anchor indices, the simulations need the x y coordinates of the vents or occupants
+        model = GeneticAlgorithm(function=lambda population: evaluate_population(evaluator, [space.decode(indices) for indices in population],
+                                                                                 surrogate=model_surrogate),
+                                 algorithm_parameters=algorithm_param, checkpoint_file=checkpoint_file,
+                                 cache=get_fitness_cache(), space=space)
+        model.run(resume=resume)
+    return model
+
+
 # Function: ga_vents
 # Purpose: Runs the Genetic Algorithm to find best ventilation lcoations.
     #this function is built for a specific scenario. We can make it more general by reading the variables boundaries from a config file.
+# Arguments:
+    #resume: if True, an unfinished run is resumed from its last snapshot (VENTS_CHECKPOINT_FILE)
+    #workers, surrogate, screen_timesteps: how the generations are scored (see run_ga)
 
-def ga_vents():
-    #We have three variables: x coord, y coord, and output
-    varbound=np.array([[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31]])
-    vartype=np.array([['int'],['int'],['int'],['int'],['int'],['int'],['int'],['int']])
+def ga_vents(resume=True, workers=None, surrogate=False, screen_timesteps=None):
+    #each of the 4 vents is encoded as the index of a place in the room where a whole vent fits (see search_space.py),
+    #so no vent is placed over a wall or over another vent
+    space = FreeCellSpace.from_generator(get_generator(CONFIG_FILE), "vents", 4)
 
     algorithm_param = {'max_num_iteration': 30,'population_size':10,'mutation_probability':0.1,'elit_ratio': 0.01,'crossover_probability': 0.9, 
                        'parents_portion': 0.5,'crossover_type':'uniform','max_iteration_without_improv':15}
 
-    model = ga(function=evlauate_vent_loc,dimension=8,variable_type_mixed=vartype,variable_boundaries=varbound, 
-               algorithm_parameters=algorithm_param, function_timeout=3600.0)
-
-    model.run()
+    model = run_ga("vents", space, algorithm_param, VENTS_CHECKPOINT_FILE, resume, workers, surrogate, screen_timesteps)
     
     convergence= model.report
-    solution= model.output_dict
+    solution= dict(model.output_dict, variable=space.decode(model.output_dict["variable"]))
 
     print(convergence)
     print(solution)
+    print("fitness cache:", get_fitness_cache().stats())
 
     json.dump( convergence, open( "GA_Output.json", 'a'))
 
@@ -172,90 +237,206 @@ def ga_vents():
             #the first occupant.
 # Return:
     #occupants_at_risk: the number of occupants who are of type EXPOSED_CO2_SOURCE = -250
-    
-#a global dictionary where the number of exposed occupants for all simulated scenarios is stored. 
-#The purpose of this is to avoid running the simulation again for a json scenario with occupants_loc that has been used again.
 
-seats_results_database = dict()
 counter = 0
 
 def evlauate_seating(occupants_loc):
-    global seats_results_database
     global counter
+    cache = get_fitness_cache()
     
-    #if the scenario with this vent location has been simulated before
+    #if the scenario with these occupant locations has been simulated before
     #do not simulate again
     #return the number of exposed occupants stored from previous simulation
-    if str(occupants_loc) in seats_results_database:
-        return seats_results_database[str(occupants_loc)]
+    exposed_occupants = cache.get("seats", occupants_loc)
+    if exposed_occupants is not None:
+        return exposed_occupants
+    
+    #if the scenario is broken (e.g. two occupants in the same cell), do not simulate it
+    rejected_score = check_candidate(CONFIG_FILE, "seats", occupants_loc)
+    if rejected_score is not None:
+        return rejected_score
     
     output_file = "state.txt"
     #generate a scenario with this vent location
-    generator = ScenariosGenerator("in/config.json")
+    generator = get_generator(CONFIG_FILE)
     counter = counter +1
     scenario_name = generator.create_seats_scenario(occupants_loc, counter)
 
     #run the simulation
-    model_path = "../../computer_lab_infection/bin/co2_lab"
     scenarios_path = "out/" + scenario_name
 
+    exposed_occupants = -1
     if os.path.isfile(scenarios_path):
         #create results directory #the simulator expects a directory named "results"
         #ensure_dir(self.results_path)
         #call simulator
-        subprocess.check_call([model_path, scenarios_path])
+        subprocess.check_call([MODEL_PATH, scenarios_path])
         
         #read the log to get the number of occupants exposed to high CO2 for a long time
         #and therefore are at risk of getting infected!
         exposed_occupants = get_exposed_occupants(output_file)
     
     #print("number of sick occuapnst:" + str(exposed_occupants) +",scenrio name: " + scenario_name)
-    seats_results_database[str(occupants_loc)] = exposed_occupants    
+    cache.put("seats", occupants_loc, exposed_occupants)
     
     return exposed_occupants
 
 
+# Function: evaluate_population
+# Purpose: scores a whole GA population at once. Candidates that were not simulated before are simulated concurrently,
+    #each in its own scratch directory with its own results directory, or together in one batch by the Python engine
+    #(see evaluation.py).
+    #with a surrogate (see surrogate.py), only the fraction of the new candidates with the lowest predicted number of
+    #exposed occupants is simulated; the other candidates get a pessimistic score from the surrogate (worse than every
+    #simulated candidate of the population, not cached).
+    #the new simulation results are added to the training data of the surrogate, which is trained again.
+# Arguments:
+    #evaluator: an open PopulationEvaluator or EngineEvaluator for the kind of candidates in the population ("vents" or "seats")
+    #population: a list (or 2D numpy array) of candidates, e.g. vent_loc or occupants_loc arrays
+    #surrogate: a Surrogate (e.g. from load_surrogate), None to simulate every new candidate
+    #fraction: fraction of the new candidates simulated when a surrogate is used
+# Return:
+    #a list with the number of exposed occupants for each candidate (same order as the population)
+    #broken candidates are not simulated and get a score worse than any simulation (see check_candidate in evaluation.py)
+
+def evaluate_population(evaluator, population, surrogate=None, fraction=SURROGATE_FRACTION):
+    cache = get_fitness_cache(evaluator.model_path)
+    #results are looked up and stored with the simulation time of the evaluator (its fidelity)
+    fidelity = getattr(evaluator, "timesteps", None)
+    
+    #look up every candidate; candidates describing the same scenario share a key and are only simulated once
+    keys = [cache.key(evaluator.kind, candidate, fidelity) for candidate in population]
+    results = dict()
+    not_simulated = dict()
+    #keys of the candidates whose score comes from a simulation (now or stored in the cache)
+    simulated = set()
+    for key, candidate in zip(keys, population):
+        if key in results or key in not_simulated:
+            continue
+        rejected_score = check_candidate(evaluator.config_file, evaluator.kind, candidate)
+        if rejected_score is not None:
+            results[key] = rejected_score
+            continue
+        exposed_occupants = cache.get(evaluator.kind, candidate, fidelity)
+        if exposed_occupants is None:
+            not_simulated[key] = candidate
+        else:
+            results[key] = exposed_occupants
+            simulated.add(key)
+    
+    #the surrogate scores the new candidates, only the most promising ones are simulated
+    samples = dict()
+    predicted = dict()
+    if surrogate is not None and len(not_simulated) > 0:
+        generator = get_generator(evaluator.config_file)
+        for key, candidate in not_simulated.items():
+            scenario = make_candidate_scenario(generator, evaluator.kind, np.asarray(candidate)).to_dict()
+            samples[key] = scenario_sample(scenario, generator.vent_type, generator.occupant_type, name="GA_" + evaluator.kind + "_" + key[:16])
+        if surrogate.is_trained():
+            predictions = surrogate.predict(list(samples.values()))
+            promising = set(select_promising(predictions, fraction))
+            for i, key in enumerate(list(not_simulated.keys())):
+                if i not in promising:
+                    predicted[key] = float(predictions[i])
+                    del not_simulated[key]
+    
+    scores = evaluator.evaluate(list(not_simulated.values()))
+    #a MultiFidelityEvaluator tells which scores come from full runs; the scores of candidates that were not promoted
+    #are not stored (their short-run results are cached by the evaluator itself)
+    fidelities = getattr(evaluator, "fidelities", [fidelity] * len(scores))
+    for (key, candidate), exposed_occupants, score_fidelity in zip(not_simulated.items(), scores, fidelities):
+        results[key] = exposed_occupants
+        simulated.add(key)
+        if score_fidelity != fidelity:
+            samples.pop(key, None)
+            continue
+        cache.put(evaluator.kind, candidate, exposed_occupants, fidelity)
+        if key in samples:
+            samples[key]["at_risk"] = exposed_occupants
+    
+    #a candidate scored by the surrogate is never ranked ahead of (or with) a simulated one, so it cannot become the
+    #solution of the GA: it gets at least one exposed occupant more than the worst simulated candidate of the population
+    #(or than the number of occupants if no candidate was simulated)
+    simulated_scores = [results[key] for key in simulated if results[key] >= 0]
+    for key, prediction in predicted.items():
+        worst = max(simulated_scores) if len(simulated_scores) > 0 else len(samples[key]["occupants"])
+        results[key] = max(prediction, worst + 1)
+    
+    #the new results become training data (failed simulations, with a negative result, are left out by add)
+    if surrogate is not None and len(samples) > 0:
+        surrogate.add([samples[key] for key in not_simulated if key in samples])
+        surrogate.fit()
+        
+    return [results[key] for key in keys]
+
+
+# Example: scoring a population of 10 random vent layouts, using up to 10 simulations at the same time
+    #with PopulationEvaluator("vents", "in/config.json", "../../computer_lab_infection/bin/co2_lab", workers=10) as evaluator:
+    #    population = np.random.randint([4,4,4,4,4,4,4,4], [20,32,20,32,20,32,20,32], size=(10,8))
+    #    scores = evaluate_population(evaluator, population)
+
+# Example: scoring the same population with the Python engine, all 10 candidates advancing together in one batch
+    #with EngineEvaluator("vents", "in/config.json") as evaluator:
+    #    scores = evaluate_population(evaluator, population)
+
+# Example: screening the population with runs of 60 time units, only the candidates within 1 exposed occupant of the
+    #best short-run score are simulated for the full time
+    #engine = EngineEvaluator("vents", "in/config.json")
+    #with MultiFidelityEvaluator(engine, 60, margin=1, cache=get_fitness_cache(engine.model_path)) as evaluator:
+    #    scores = evaluate_population(evaluator, population)
+
+# Example: simulating only the 3 most promising of the 10 candidates according to the surrogate
+    #surrogate = load_surrogate("in/config.json", get_generator("in/config.json").scenario["scenario"]["shape"])
+    #with EngineEvaluator("vents", "in/config.json") as evaluator:
+    #    scores = evaluate_population(evaluator, population, surrogate=surrogate, fraction=0.3)
+
+
 # In[19]:
 
 
 # Function: ga_seats
 # Purpose: Runs the Genetic Algorithm to find best seating arrangement for occupants.
     #this function is built for a specific scenario. We can make it more general by reading the variables boundaries from a config file.
+# Arguments:
+    #resume: if True, an unfinished run is resumed from its last snapshot (SEATS_CHECKPOINT_FILE)
+    #workers, surrogate, screen_timesteps: how the generations are scored (see run_ga)
 
-def ga_seats():
+def ga_seats(resume=True, workers=None, surrogate=False, screen_timesteps=None):
 
-    #assuming all occupants are placed 4 cells away from the boundaries of the model. These variable can be read from a config file if needed.
-    varbound=np.array([[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],
-                       [4,19],[4,31],[4,19],[4,31], [4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],
-                       [4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],[4,19],[4,31],
-                       [4,19],[4,31]])
+    #each of the 25 occupants is encoded as the index of a free cell reachable from a door (see search_space.py),
+    #so no occupant is placed on a wall, on a workstation or on another occupant
+    space = FreeCellSpace.from_generator(get_generator(CONFIG_FILE), "seats", 25)
                   
     algorithm_param = {'max_num_iteration': 30,'population_size':10,'mutation_probability':0.1,'elit_ratio': 0.01,'crossover_probability': 0.9,
                        'parents_portion': 0.5,'crossover_type':'uniform','max_iteration_without_improv':10}
 
-    model=ga(function=evlauate_seating,dimension=50,variable_type='int',variable_boundaries=varbound, algorithm_parameters=algorithm_param, 
-             function_timeout=3600.0)
-
-    model.run()
+    model = run_ga("seats", space, algorithm_param, SEATS_CHECKPOINT_FILE, resume, workers, surrogate, screen_timesteps)
 
     convergence= model.report
-    solution= model.output_dict
+    solution= dict(model.output_dict, variable=space.decode(model.output_dict["variable"]))
 
     print(convergence)
     print(solution)
+    print("fitness cache:", get_fitness_cache().stats())
 
     json.dump( convergence, open( "GA_Output.json", 'a'))
 
 
-# In[17]:
+# In[20]:
 
 
-print("Case Study I: finding best seating arrangement")
-ga_seats()
+#the case studies only run when this file is executed (not when the worker processes used by evaluate_population import it)
+if __name__ == "__main__":
+    print("Case Study I: finding best seating arrangement")
+    ga_seats()
 
-# In[20]:
-print("Case Study II: finding best vents locations")
-ga_vents()
+
+# In[17]:
+
+
+if __name__ == "__main__":
+    print("Case Study II: finding best vents locations")
+    ga_vents()
 
 
 
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** a fitness cache for the GA that is kept on disk (SQLite) and shared by all GA runs.
+#
+# **Project:** CO2 dispersion
+#
+# A result is stored under a hash of the generated scenario rather than of the array sent by the GA:
+# - the coordinate pairs are sorted, so the same vents (or occupants) listed in a different order give the same key,
+# - the key also covers everything else the scenario and its simulation depend on (base scenario file, vent size,
+#   cell types, model), so results from a different setup are never reused.
+#
+# Every result also records its fidelity: the simulation time it was simulated for (NULL for the default time of the
+# model). Results of shorter runs (see MultiFidelityEvaluator in evaluation.py) are stored under their own keys.
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import hashlib
+
+
+# Function: file_hash
+# Purpose: computes the SHA-256 hash of a file's content
+# Arguments: file_path: path of the file
+# Return: hexadecimal digest (None if the file does not exist)
+
+def file_hash(file_path):
+    if not os.path.isfile(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function: scenario_context
+# Purpose: collects the settings (other than the candidate) that the generated scenarios and their results depend on
+# Arguments:
+    #config_file: the configuration file used by the ScenariosGenerator
+    #model_path: path of the co2_lab executable
+# Return: a dictionary describing the context of the cached results
+
+def scenario_context(config_file, model_path):
+    with open(config_file, "r") as f:
+        config = json.loads(f.read())
+    return {
+        "in_scenario": file_hash(config["in_scenario_file"]),
+        "vent_size": config["vent_size"],
+        "vent_type": config["vent_type"],
+        "occupant_type": config["occupant_type"],
+        "model": file_hash(model_path) or os.path.abspath(model_path)
+    }
+
+
+# Class: FitnessCache
+# Purpose: stores the number of exposed occupants of every simulated scenario in a SQLite database
+# Arguments:
+    #db_path: path of the database file (created if it does not exist)
+    #context: dictionary returned by scenario_context (part of every key)
+
+class FitnessCache:
+
+    def __init__(self, db_path, context):
+        self.context = context
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fitness ("
+                                "key TEXT PRIMARY KEY, kind TEXT, candidate TEXT, score INTEGER, created REAL, fidelity INTEGER)")
+        #databases created before the fidelity was recorded only hold results of full runs (fidelity NULL)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(fitness)")]
+        if "fidelity" not in columns:
+            self.connection.execute("ALTER TABLE fitness ADD COLUMN fidelity INTEGER")
+        self.connection.commit()
+
+    # Function: canonical_candidate
+    # Purpose: converts a candidate into its canonical form (sorted list of [x, y] pairs)
+    # Arguments: candidate: numpy array (or list) of x y coordinate pairs sent by the GA
+    # Return: the sorted list of pairs
+
+    @staticmethod
+    def canonical_candidate(candidate):
+        values = [int(value) for value in list(candidate)]
+        return sorted([values[i], values[i+1]] for i in range(0, len(values), 2))
+
+    # Function: key
+    # Purpose: computes the key under which the result of a candidate is stored
+    # Arguments:
+        #kind: "vents" or "seats"
+        #candidate: numpy array of x y coordinate pairs
+        #fidelity: simulation time of the result (None for the default time of the model)
+    # Return: hexadecimal SHA-256 digest of the canonical scenario description
+
+    def key(self, kind, candidate, fidelity=None):
+        description = {"kind": kind, "cells": FitnessCache.canonical_candidate(candidate), "context": self.context}
+        #results of full runs keep the keys they had before fidelities were recorded
+        if fidelity is not None:
+            description["fidelity"] = fidelity
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # Function: get
+    # Purpose: looks up the result of a candidate
+    # Arguments:
+        #kind: "vents" or "seats"
+        #candidate: numpy array of x y coordinate pairs
+        #fidelity: simulation time of the result (None for the default time of the model)
+    # Return: the stored number of exposed occupants (None if the candidate was never simulated for that time)
+
+    def get(self, kind, candidate, fidelity=None):
+        row = self.connection.execute("SELECT score FROM fitness WHERE key = ?", (self.key(kind, candidate, fidelity),)).fetchone()
+        if row is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        return row[0]
+
+    # Function: put
+    # Purpose: stores the result of a candidate (failed simulations, with a negative result, are not stored)
+    # Arguments:
+        #kind: "vents" or "seats"
+        #candidate: numpy array of x y coordinate pairs
+        #score: number of exposed occupants
+        #fidelity: simulation time of the result (None for the default time of the model)
+    # Return: none
+
+    def put(self, kind, candidate, score, fidelity=None):
+        if score is None or score < 0:
+            return
+        self.connection.execute("INSERT OR REPLACE INTO fitness (key, kind, candidate, score, created, fidelity) VALUES (?, ?, ?, ?, ?, ?)",
+                                (self.key(kind, candidate, fidelity), kind, json.dumps(FitnessCache.canonical_candidate(candidate)),
+                                 int(score), time.time(), fidelity))
+        self.connection.commit()
+
+    # Function: stats
+    # Purpose: reports how useful the cache has been in this run
+    # Arguments: none
+    # Return: dictionary with the hits and misses of this run, the number of stored results and the number of stored
+        #results of every fidelity ("full" for the default time of the model)
+
+    def stats(self):
+        entries = self.connection.execute("SELECT COUNT(*) FROM fitness").fetchone()[0]
+        fidelities = dict()
+        for fidelity, count in self.connection.execute("SELECT fidelity, COUNT(*) FROM fitness GROUP BY fidelity"):
+            fidelities["full" if fidelity is None else str(fidelity)] = count
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups > 0 else 0.0,
+            "entries": entries,
+            "fidelities": fidelities
+        }
+
+    # Function: backup
+    # Purpose: copies the stored results to another database file (to a temporary file first, so the copy is never left
+        #half written), e.g. next to a snapshot of a GA run (see optimizer.py)
+    # Arguments: backup_path: path of the copy (replaced if it exists)
+    # Return: none
+
+    def backup(self, backup_path):
+        directory = os.path.dirname(os.path.abspath(backup_path))
+        descriptor, temporary = tempfile.mkstemp(suffix=".sqlite", dir=directory)
+        os.close(descriptor)
+        try:
+            copy = sqlite3.connect(temporary)
+            with copy:
+                self.connection.backup(copy)
+            copy.close()
+            os.replace(temporary, backup_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** a Python reference engine for the CO2 Cell-DEVS model that works on whole-grid NumPy arrays.
+#
+# **Project:** CO2 dispersion
+#
+# The engine applies the local_computation rules of computer_lab_infection/model/co2_lab_cell.hpp to every cell of
+# the grid at once, so a scenario can be evaluated without launching the Cadmium binary, parsing its JSON and writing a
+# text log. It reads the same scenario JSON as the Cadmium model (e.g. the ones created by ScenariosGenerator).
+#
+# How the Cadmium simulation is reproduced:
+# - every cell uses the same transport delay (resp_time), so the simulation advances in steps of resp_time and all the
+#   cells that compute at a step see the states their neighbors had at the previous step,
+# - a cell only computes when it receives a message, i.e. when a cell of its neighborhood (which includes the cell
+#   itself) changed its counter, concentration or type at the previous step (every cell computes at the first step),
+# - integer divisions and the float arithmetic of the C++ code (float config values, truncation when a float result
+#   is stored in an int) are reproduced,
+# - AIR cells take a share of their concentration from the neighbor whose X and Y offsets are the airflow direction. In
+#   3D, several neighbors (one per Z offset) match it and co2_lab_cell.hpp keeps the one it visits last in its unordered
+#   map of neighbor states, an order that is not known here: such scenarios are rejected unless flow_weight is 0.
+#
+# To check the engine against a log recorded by Cadmium for the same scenario:
+#   python3 co2_engine.py scenario.json --check results/state.txt
+# tests/test_co2_engine.py checks the engine against the C++ cell rules on a small scenario, and against co2_lab when it
+# is built (python3 -m unittest discover tests).
+#
+# BatchCO2Engine advances many variants of one scenario (e.g. all the vent layouts of a GA generation) together, as
+# arrays with a leading batch axis, so a whole population is simulated in a single sweep over the grid.
+
+import sys
+import json
+import argparse
+import itertools
+
+import numpy as np
+
+from fitness import is_time_line, parse_state_line
+
+#cell types (CELL_TYPE in co2_lab_cell.hpp)
+AIR = -100
+CO2_SOURCE = -200
+SUSCEPTIBLE_CO2_SOURCE = -250
+IMPERMEABLE_STRUCTURE = -300
+DOOR = -400
+WINDOW = -500
+VENTILATION = -600
+WORKSTATION = -700
+CELL_TYPES = [AIR, CO2_SOURCE, SUSCEPTIBLE_CO2_SOURCE, IMPERMEABLE_STRUCTURE, DOOR, WINDOW, VENTILATION, WORKSTATION]
+
+#type used for the cells outside of the grid (they are not neighbors of anyone)
+OUTSIDE = 0
+
+
+# Function: neighborhood_offsets
+# Purpose: lists the relative positions of the neighbors of a cell (the cell itself included, as in Cadmium)
+# Arguments:
+    #neighborhood: the "neighborhood" list of a scenario
+    #dimensions: number of dimensions of the grid
+# Return: sorted list of offsets (tuples)
+
+def neighborhood_offsets(neighborhood, dimensions):
+    offsets = set()
+    for definition in neighborhood:
+        kind = definition["type"]
+        cell_range = definition.get("range", 1)
+        if kind in ("moore", "von_neumann"):
+            for offset in itertools.product(range(-cell_range, cell_range + 1), repeat=dimensions):
+                if kind == "moore" or sum(abs(o) for o in offset) <= cell_range:
+                    offsets.add(offset)
+        elif kind == "custom":
+            for offset in definition["neighbors"]:
+                offsets.add(tuple(offset))
+        else:
+            raise ValueError("Unsupported neighborhood type: " + str(kind))
+    return sorted(offsets)
+
+
+# Class: CO2Engine
+# Purpose: holds the state of every cell as arrays and advances the whole grid one step at a time
+# Arguments:
+    #scenario: the scenario as a Python dictionary (same format as the JSON read by Cadmium)
+
+class CO2Engine:
+
+    def __init__(self, scenario):
+        description = scenario["scenario"]
+        self.shape = tuple(description["shape"])
+        if description.get("wrapped", False):
+            raise ValueError("Wrapped scenarios are not supported")
+        self.offsets = neighborhood_offsets(description["neighborhood"], len(self.shape))
+        self.pad = max(max(abs(o) for o in offset) for offset in self.offsets)
+        #shape of the state arrays (BatchCO2Engine adds a batch axis in front of the grid axes)
+        self.batch_shape = ()
+        self.array_shape = self.shape
+
+        #configuration (conc in co2_lab_cell.hpp), float members are kept as float32 like in the C++ code
+        config = description["default_config"]["CO2_cell"]
+        #100 * 1000 * 10000 * co2_production is computed in float, the division by pow(cell_size, 3) in double
+        production = float(np.float32(100 * 1000 * 10000) * np.float32(config["co2_production"]))
+        self.concentration_increase = np.float32(production / float(np.float32(config["cell_size"])) ** 3)
+        self.base = int(config["base"])
+        self.resp_time = config["resp_time"]
+        self.window_conc = int(config["window_conc"])
+        self.vent_conc = int(config["vent_conc"])
+        self.breathing_rate = int(config["breathing_rate"])
+        self.time_active = int(config["time_active"])
+        self.start_time = int(config["start_time"])
+        self.risky_concentration = np.float32(config["risky_concentration"])
+        self.risky_exposure_time = int(config["risky_exposure_time"])
+        self.flow_weight = np.float32(config["flow_weight"])
+        self.airflow_dir = (int(config["airflow_dir_x"]), int(config["airflow_dir_y"]))
+        airflow_neighbors = [offset for offset in self.offsets if offset[:2] == self.airflow_dir]
+        if len(airflow_neighbors) > 1 and self.flow_weight != 0:
+            raise ValueError("The airflow direction matches " + str(len(airflow_neighbors)) + " neighbors (3D scenario), "
+                             "the one used by co2_lab depends on the order of its neighbor map")
+
+        #initial state: the default state, replaced by the state of every listed cell
+        #cells whose cell_id does not fit in the shape of the grid are ignored (and counted in ignored_cells)
+        default_state = description["default_state"]
+        self.default_state = default_state
+        self.counter = np.full(self.shape, default_state["counter"], dtype=np.int64)
+        self.concentration = np.full(self.shape, default_state["concentration"], dtype=np.int64)
+        self.type = np.full(self.shape, default_state["type"], dtype=np.int64)
+        self.ignored_cells = 0
+        self.listed = np.zeros(self.shape, dtype=bool)
+        for cell in scenario["cells"]:
+            position = self.cell_position(cell)
+            if position is None:
+                self.ignored_cells = self.ignored_cells + 1
+                continue
+            self.set_cell(position, cell["state"])
+            self.listed[position] = True
+        self.check_types()
+
+        #breathing_counter and exposure_time are not read from the JSON (see from_json in co2_lab_cell.hpp)
+        self.breathing_counter = np.zeros(self.shape, dtype=np.int64)
+        self.exposure_time = np.zeros(self.shape, dtype=np.int64)
+
+        self.active = np.ones(self.shape, dtype=bool)
+        self.steps = 0
+
+    # Function: cell_position
+    # Purpose: returns the position of a cell of the scenario in the grid
+    # Arguments: cell: a cell of the "cells" list of a scenario
+    # Return: tuple of coordinates (None if the cell_id does not fit in the shape of the grid)
+
+    def cell_position(self, cell):
+        position = tuple(cell["cell_id"])
+        if len(position) != len(self.shape) or not all(0 <= p < n for p, n in zip(position, self.shape)):
+            return None
+        return position
+
+    # Function: set_cell
+    # Purpose: sets the initial state of a cell (values missing from the state are taken from the default state)
+    # Arguments:
+        #position: index of the cell in the state arrays
+        #state: the "state" of a cell of the scenario
+    # Return: none
+
+    def set_cell(self, position, state):
+        self.counter[position] = state.get("counter", self.default_state["counter"])
+        self.concentration[position] = state.get("concentration", self.default_state["concentration"])
+        self.type[position] = state.get("type", self.default_state["type"])
+
+    # Function: check_types
+    # Purpose: makes sure that every cell has one of the types handled by the model
+    # Arguments: none
+    # Return: none (raises ValueError for an unknown type)
+
+    def check_types(self):
+        unknown = ~np.isin(self.type, CELL_TYPES)
+        if unknown.any():
+            raise ValueError("Unknown cell type: " + str(self.type[unknown][0]))
+
+    # Function: from_file
+    # Purpose: creates an engine from a JSON scenario file
+    # Arguments: scenario_file: path of the JSON scenario
+    # Return: CO2Engine
+
+    @staticmethod
+    def from_file(scenario_file):
+        with open(scenario_file, "r") as f:
+            return CO2Engine(json.loads(f.read()))
+
+    # Function: time
+    # Purpose: returns the simulation time reached by the engine
+    # Arguments: none
+    # Return: number of steps done multiplied by resp_time
+
+    def time(self):
+        return self.steps * self.resp_time
+
+    # Function: neighbor_view
+    # Purpose: returns, for every cell, the value of an array at the position of the neighbor with a given offset
+    # Arguments:
+        #padded: the array padded with self.pad cells on every side
+        #offset: relative position of the neighbor
+    # Return: array with the shape of the grid
+
+    def neighbor_view(self, padded, offset):
+        batch = tuple(slice(None) for n in self.batch_shape)
+        return padded[batch + tuple(slice(self.pad + o, self.pad + o + n) for o, n in zip(offset, self.shape))]
+
+    # Function: pad_grid
+    # Purpose: pads the grid axes of a state array (the batch axes are not padded)
+    # Arguments:
+        #array: array with the shape of the state arrays
+        #value: value given to the cells added around the grid
+    # Return: the padded array
+
+    def pad_grid(self, array, value):
+        return np.pad(array, [(0, 0)] * len(self.batch_shape) + [(self.pad, self.pad)] * len(self.shape), constant_values=value)
+
+    # Function: step
+    # Purpose: advances the simulation by one step (resp_time)
+    # Arguments: none
+    # Return: boolean array of the cells whose counter, concentration or type changed
+
+    def step(self):
+        counter, concentration, cell_type = self.counter, self.concentration, self.type
+        padded_concentration = self.pad_grid(concentration, 0)
+        padded_type = self.pad_grid(cell_type, OUTSIDE)
+
+        #sums over the neighbors that are not impermeable (neighbors_state in co2_lab_cell.hpp)
+        neighbors_sum = np.zeros(self.array_shape, dtype=np.int64)
+        num_neighbors = np.zeros(self.array_shape, dtype=np.int64)
+        airflow_sum = np.zeros(self.array_shape, dtype=np.int64)
+        flow_concentration = np.zeros(self.array_shape, dtype=np.int64)
+        for offset in self.offsets:
+            neighbor_concentration = self.neighbor_view(padded_concentration, offset)
+            neighbor_type = self.neighbor_view(padded_type, offset)
+            permeable = (neighbor_type != OUTSIDE) & (neighbor_type != IMPERMEABLE_STRUCTURE)
+            permeable_concentration = np.where(permeable, neighbor_concentration, 0)
+            neighbors_sum += permeable_concentration
+            num_neighbors += permeable
+            #AIR cells take a share of their concentration from the neighbor in the airflow direction
+            if offset[:2] == self.airflow_dir:
+                airflow_sum += permeable_concentration
+                flow_concentration = np.where(permeable, (permeable_concentration.astype(np.float32) * self.flow_weight).astype(np.int64), 0)
+        divisor = np.maximum(num_neighbors, 1)
+        average = neighbors_sum // divisor
+
+        new_counter = counter.copy()
+        new_concentration = concentration.copy()
+        new_type = cell_type.copy()
+        new_breathing_counter = self.breathing_counter.copy()
+        new_exposure_time = self.exposure_time.copy()
+        active = self.active
+
+        #boundary cells
+        new_concentration[active & (cell_type == IMPERMEABLE_STRUCTURE)] = 0
+        new_concentration[active & (cell_type == DOOR)] = self.base
+        new_concentration[active & (cell_type == WINDOW)] = self.window_conc
+        new_concentration[active & (cell_type == VENTILATION)] = self.vent_conc
+
+        #AIR: diffusion, optionally weighted towards the airflow direction
+        air = active & (cell_type == AIR)
+        air_sum = neighbors_sum - airflow_sum
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flow_average = ((np.float32(1) - self.flow_weight) * air_sum.astype(np.float32) / (num_neighbors - 1).astype(np.float32)
+                            + flow_concentration.astype(np.float32))
+        flow_average = np.where(np.isfinite(flow_average), flow_average, 0).astype(np.int64)
+        new_concentration[air] = np.where(flow_concentration != 0, flow_average, air_sum // divisor)[air]
+
+        #WORKSTATION: diffusion, the occupant arrives when the counter reaches start_time
+        workstation = active & (cell_type == WORKSTATION)
+        new_concentration[workstation] = average[workstation]
+        new_counter[workstation & (counter <= self.start_time)] += 1
+        arriving = workstation & (counter == self.start_time)
+        new_type[arriving] = CO2_SOURCE
+        new_breathing_counter[arriving] = 0
+
+        #CO2_SOURCE and SUSCEPTIBLE_CO2_SOURCE: diffusion plus one breath every breathing_rate steps
+        source = active & (cell_type == CO2_SOURCE)
+        susceptible = active & (cell_type == SUSCEPTIBLE_CO2_SOURCE)
+        occupied = source | susceptible
+        breathing = occupied & (self.breathing_counter % self.breathing_rate == 0)
+        new_concentration[occupied] = average[occupied]
+        new_concentration[breathing] = (average[breathing].astype(np.float32) + self.concentration_increase).astype(np.int64)
+        new_breathing_counter[occupied] += 1
+        new_counter[occupied] += 1
+        leaving = occupied & (counter == self.time_active)
+        new_type[leaving] = WORKSTATION
+        risky = new_concentration >= self.risky_concentration
+        exposed = source & ~leaving & risky
+        new_exposure_time[exposed] += 1
+        new_type[exposed & (new_exposure_time >= self.risky_exposure_time)] = SUSCEPTIBLE_CO2_SOURCE
+        recovered = susceptible & ~leaving & ~risky
+        new_exposure_time[recovered] = 0
+        new_type[recovered] = CO2_SOURCE
+
+        #only a change of counter, concentration or type is sent to the neighbors (operator != in co2_lab_cell.hpp)
+        changed = (new_counter != counter) | (new_concentration != concentration) | (new_type != cell_type)
+        padded_changed = self.pad_grid(changed, False)
+        self.active = np.zeros(self.array_shape, dtype=bool)
+        for offset in self.offsets:
+            self.active |= self.neighbor_view(padded_changed, offset)
+
+        self.counter, self.concentration, self.type = new_counter, new_concentration, new_type
+        self.breathing_counter, self.exposure_time = new_breathing_counter, new_exposure_time
+        self.steps = self.steps + 1
+        return changed
+
+    # Function: run
+    # Purpose: advances the simulation until a given time (the default simulation time of co2_lab is 180)
+    # Arguments: until: simulation time to reach
+    # Return: none
+
+    def run(self, until=180):
+        while self.time() < until:
+            self.step()
+
+    # Function: count
+    # Purpose: counts the cells of a type
+    # Arguments: cell_type: type code (e.g. SUSCEPTIBLE_CO2_SOURCE to get the number of occupants at risk)
+    # Return: number of cells
+
+    def count(self, cell_type):
+        return int(np.count_nonzero(self.type == cell_type))
+
+    # Function: get_state
+    # Purpose: returns the state of a cell as logged by Cadmium
+    # Arguments: coords: coordinates of the cell (preceded by the index of the variant for a BatchCO2Engine)
+    # Return: list [counter, concentration, type]
+
+    def get_state(self, coords):
+        position = tuple(coords)
+        return [int(self.counter[position]), int(self.concentration[position]), int(self.type[position])]
+
+    # Function: write_frame
+    # Purpose: writes the state of some cells in the format of the Cadmium state log
+    # Arguments:
+        #f: open text file
+        #cells: boolean array of the cells to write (None for all the cells)
+    # Return: none
+
+    def write_frame(self, f, cells=None):
+        f.write(str(self.time()) + "\n")
+        positions = np.argwhere(cells) if cells is not None else np.ndindex(self.shape)
+        for position in positions:
+            position = tuple(int(p) for p in position)
+            counter, concentration, cell_type = self.get_state(position)
+            f.write("State for model co2_lab_(" + ",".join(str(p) for p in position) + ") is <"
+                    + str(counter) + "," + str(concentration) + "," + str(cell_type) + ">\n")
+
+    # Function: compare_with_log
+    # Purpose: runs the engine alongside a state log recorded by Cadmium for the same scenario and compares the states
+    # Arguments:
+        #log_file: path of the state log
+        #lag: number of engine steps between the start of the simulation and the first logged time
+    # Return: dictionary with the number of frames and cells compared, the number of mismatches and the first mismatch
+
+    def compare_with_log(self, log_file, lag=0):
+        summary = {"frames": 0, "cells": 0, "mismatches": 0, "first_mismatch": None}
+        with open(log_file, "r") as f:
+            for line in f:
+                if is_time_line(line):
+                    target = int(line) + lag * self.resp_time
+                    self.run(target)
+                    summary["frames"] = summary["frames"] + 1
+                    continue
+                state = parse_state_line(line)
+                if state is None:
+                    continue
+                coords, values = state
+                summary["cells"] = summary["cells"] + 1
+                expected = self.get_state(coords)
+                if values[:3] != expected:
+                    summary["mismatches"] = summary["mismatches"] + 1
+                    if summary["first_mismatch"] is None:
+                        summary["first_mismatch"] = {"time": self.time(), "cell": list(coords), "log": values[:3], "engine": expected}
+        return summary
+
+
+
+# Class: BatchCO2Engine
+# Purpose: advances a batch of variants of the same scenario together (the state arrays have the shape (batch, x, y[, z]))
+    #the variants share the grid, neighborhood and configuration of the scenario and differ in a few cells, e.g. the vent
+    #layouts of the candidates of a GA generation
+# Arguments:
+    #scenario: the scenario as a Python dictionary (same format as the JSON read by Cadmium)
+    #variants: one list of cells per variant (same format as the "cells" of a scenario), added to the cells of the
+        #scenario in front of them as ScenariosGenerator does; a cell listed in the scenario keeps its state
+
+class BatchCO2Engine(CO2Engine):
+
+    def __init__(self, scenario, variants):
+        CO2Engine.__init__(self, scenario)
+        self.batch_shape = (len(variants),)
+        self.array_shape = self.batch_shape + self.shape
+
+        #every variant starts from the initial state of the scenario
+        self.counter = np.repeat(self.counter[np.newaxis], len(variants), axis=0)
+        self.concentration = np.repeat(self.concentration[np.newaxis], len(variants), axis=0)
+        self.type = np.repeat(self.type[np.newaxis], len(variants), axis=0)
+        self.breathing_counter = np.zeros(self.array_shape, dtype=np.int64)
+        self.exposure_time = np.zeros(self.array_shape, dtype=np.int64)
+        self.active = np.ones(self.array_shape, dtype=bool)
+
+        #the cells of a variant come first in its scenario, so the cells of the scenario are set after them (and win)
+        for index, cells in enumerate(variants):
+            for cell in cells:
+                position = self.cell_position(cell)
+                if position is None or self.listed[position]:
+                    continue
+                self.set_cell((index,) + position, cell["state"])
+        self.check_types()
+
+    # Function: count
+    # Purpose: counts the cells of a type in every variant
+    # Arguments: cell_type: type code (e.g. SUSCEPTIBLE_CO2_SOURCE to get the number of occupants at risk)
+    # Return: list with the number of cells of each variant
+
+    def count(self, cell_type):
+        grid_axes = tuple(range(len(self.batch_shape), len(self.array_shape)))
+        return [int(n) for n in np.count_nonzero(self.type == cell_type, axis=grid_axes)]
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run a CO2 scenario with the Python reference engine")
+    arg_parser.add_argument("scenario", help="path of the JSON scenario")
+    arg_parser.add_argument("time", nargs="?", type=float, default=180, help="simulation time (default: 180, as co2_lab)")
+    arg_parser.add_argument("--log", help="write the states that change at every step to this file (Cadmium state log format)")
+    arg_parser.add_argument("--check", help="compare the engine against a state log recorded by Cadmium for the same scenario")
+    arg_parser.add_argument("--lag", type=int, default=0, help="engine steps between the start and the first logged time (with --check)")
+    args = arg_parser.parse_args()
+
+    engine = CO2Engine.from_file(args.scenario)
+    if args.check is not None:
+        summary = engine.compare_with_log(args.check, lag=args.lag)
+        print(json.dumps(summary))
+        sys.exit(1 if summary["mismatches"] > 0 else 0)
+
+    if args.log is not None:
+        with open(args.log, "w") as log:
+            engine.write_frame(log)
+            while engine.time() < args.time:
+                engine.write_frame(log, engine.step())
+    else:
+        engine.run(args.time)
+    print("occupants at risk: " + str(engine.count(SUSCEPTIBLE_CO2_SOURCE)))
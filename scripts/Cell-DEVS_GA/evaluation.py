@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** evaluate a whole GA population at once by running the Cadmium simulations in parallel.
+#
+# **Project:** CO2 dispersion
+#
+# The Cadmium model always writes its logs to "results/" relative to the directory it is started from, so two
+# simulations started from the same directory overwrite each other's logs. Here every candidate gets its own scratch
+# directory (holding its scenario and its own "results/" folder) and the simulator is started from that directory.
+#
+# EngineEvaluator evaluates a population without Cadmium: the candidates only differ from the base scenario in a few
+# cells, so they are all simulated together by the Python engine (BatchCO2Engine in co2_engine.py).
+#
+# Candidates whose scenario is broken (cells placed over other cells or outside the grid, occupants that cannot be
+# reached from a door) are rejected before they are simulated (see check_candidate and Validator.py).
+#
+# MultiFidelityEvaluator screens a population with short simulations and only runs the full simulation for the
+# candidates whose short-run score is close to the best one.
+
+import os
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from generator import ScenariosGenerator
+from fitness import get_final_type_histogram
+import co2_engine
+from co2_engine import BatchCO2Engine
+from Validator import Validator
+
+EXPOSED_CO2_SOURCE = -250
+CO2_SOURCE = -200
+#default simulation time of co2_lab (results simulated for this time are full-fidelity results)
+DEFAULT_TIMESTEPS = 180
+
+#one ScenariosGenerator per worker process and configuration file (the base scenario is only read once per process)
+generators = dict()
+
+#errors of the base scenario of every configuration file (candidates are only rejected for errors they add)
+base_errors = dict()
+
+
+# Function: get_generator
+# Purpose: returns the ScenariosGenerator of a configuration file, creating it the first time it is needed
+# Arguments: config_file: the configuration file used by the ScenariosGenerator
+# Return: the ScenariosGenerator
+
+def get_generator(config_file):
+    if config_file not in generators:
+        generators[config_file] = ScenariosGenerator(config_file)
+    return generators[config_file]
+
+
+# Function: run_simulation
+# Purpose: runs the Cadmium model on a scenario from a given work directory
+# Arguments:
+    #model_path: path of the co2_lab executable
+    #scenario_path: path of the JSON scenario
+    #work_dir: directory the simulator is started from (its logs are written to work_dir/results)
+    #timesteps: number of time steps to simulate (None to use the simulator's default)
+    #quiet: if True, the output of the simulator is written to work_dir/simulator_output.txt instead of the console
+# Return: path of the state log produced by the simulation
+
+def run_simulation(model_path, scenario_path, work_dir, timesteps=None, quiet=True):
+    results_dir = os.path.join(work_dir, "results")
+    os.makedirs(results_dir, exist_ok=True)
+
+    command = [os.path.abspath(model_path), os.path.abspath(scenario_path)]
+    if timesteps is not None:
+        command.append(str(timesteps))
+
+    if quiet:
+        with open(os.path.join(work_dir, "simulator_output.txt"), "w") as output:
+            subprocess.check_call(command, cwd=work_dir, stdout=output)
+    else:
+        subprocess.check_call(command, cwd=work_dir)
+
+    return os.path.join(results_dir, "state.txt")
+
+
+# Function: make_candidate_scenario
+# Purpose: makes the scenario of a candidate in memory (the base scenario plus the cells of the candidate)
+# Arguments:
+    #generator: the ScenariosGenerator
+    #kind: "vents" or "seats"
+    #candidate: numpy array of x y coordinate pairs sent by the GA
+# Return: OverlayScenario (see generator.py)
+
+def make_candidate_scenario(generator, kind, candidate):
+    if kind == "vents":
+        return generator.make_vent_scenario(candidate)
+    elif kind == "seats":
+        return generator.make_seats_scenario(candidate)
+    raise ValueError("Unknown kind of candidate: " + str(kind))
+
+
+# Function: check_candidate
+# Purpose: checks the scenario of a candidate before it is simulated. Errors that are already in the base scenario are
+    #ignored, so a candidate is only rejected for the cells it adds (e.g. a vent placed over a wall)
+# Arguments:
+    #config_file: the configuration file used by the ScenariosGenerator
+    #kind: "vents" or "seats"
+    #candidate: numpy array of x y coordinate pairs sent by the GA
+# Return:
+    #rejected_score: the score of a rejected candidate (the number of occupants plus one, worse than any simulation),
+    #None if the candidate can be simulated
+
+def check_candidate(config_file, kind, candidate):
+    generator = get_generator(config_file)
+    if config_file not in base_errors:
+        base_errors[config_file] = set((issue["check"], str(issue["cell_id"])) for issue in Validator.getErrors(Validator.validate(generator.scenario)))
+
+    scenario = make_candidate_scenario(generator, kind, np.asarray(candidate)).to_dict()
+    errors = [issue for issue in Validator.getErrors(Validator.validate(scenario))
+              if (issue["check"], str(issue["cell_id"])) not in base_errors[config_file]]
+    if len(errors) == 0:
+        return None
+    return sum(1 for cell in scenario["cells"] if cell["state"]["type"] == CO2_SOURCE) + 1
+
+
+# Function: evaluate_candidate
+# Purpose: (1) generates the scenario of one candidate in a new scratch directory,
+            #(2) runs the simulation from that directory,
+            #(3) counts the occupants who are at risk in the last frame of its log.
+# Arguments:
+    #kind: "vents" (candidate holds vent locations) or "seats" (candidate holds occupant locations)
+    #candidate: numpy array of x y coordinate pairs sent by the GA
+    #config_file: the configuration file used by the ScenariosGenerator
+    #model_path: path of the co2_lab executable
+    #work_root: directory in which the scratch directories are created
+    #keep_dirs: if True, the scratch directory is not deleted after the evaluation
+    #timesteps: simulation time (None for the default time of the model)
+# Return:
+    #occupants_at_risk: the number of occupants who are of type EXPOSED_CO2_SOURCE = -250 (-1 if there is no log)
+
+def evaluate_candidate(kind, candidate, config_file, model_path, work_root, keep_dirs=False, timesteps=None):
+    generator = get_generator(config_file)
+    work_dir = tempfile.mkdtemp(prefix=kind + "_", dir=work_root)
+    try:
+        #the scenario is written to the scratch directory instead of the shared scenarios path
+        scenario_path = os.path.join(work_dir, "scenario.json")
+        make_candidate_scenario(generator, kind, candidate).write(scenario_path)
+
+        log_file = run_simulation(model_path, scenario_path, work_dir, timesteps=timesteps)
+        if not os.path.isfile(log_file):
+            return -1
+        return get_final_type_histogram(log_file)[EXPOSED_CO2_SOURCE]
+    finally:
+        if not keep_dirs:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# Class: PopulationEvaluator
+# Purpose: keeps a pool of worker processes to evaluate GA populations (use it in a "with" statement)
+# Arguments:
+    #kind: "vents" or "seats"
+    #config_file: the configuration file used by the ScenariosGenerator
+    #model_path: path of the co2_lab executable
+    #work_root: directory in which the scratch directories are created
+    #workers: number of worker processes (None to use one per CPU)
+    #keep_dirs: if True, the scratch directories are not deleted
+    #timesteps: simulation time of every simulation (None for the default time of the model)
+
+class PopulationEvaluator:
+
+    def __init__(self, kind, config_file, model_path, work_root="work/", workers=None, keep_dirs=False, timesteps=None):
+        self.kind = kind
+        self.config_file = config_file
+        self.model_path = os.path.abspath(model_path)
+        self.work_root = os.path.abspath(work_root)
+        self.workers = workers
+        self.keep_dirs = keep_dirs
+        self.timesteps = timesteps
+        self.pool = None
+
+    def __enter__(self):
+        os.makedirs(self.work_root, exist_ok=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool.shutdown()
+        self.pool = None
+
+    # Function: evaluate
+    # Purpose: evaluates all the candidates of a population concurrently (identical candidates are only simulated once)
+    # Arguments: population: a list (or 2D numpy array) of candidates
+    # Return: list with the number of occupants at risk for each candidate (same order as the population)
+
+    def evaluate(self, population):
+        futures = dict()
+        keys = []
+        for candidate in population:
+            candidate = np.asarray(candidate)
+            key = str(candidate)
+            keys.append(key)
+            if key not in futures:
+                futures[key] = self.pool.submit(evaluate_candidate, self.kind, candidate, self.config_file,
+                                                self.model_path, self.work_root, self.keep_dirs, self.timesteps)
+        return [futures[key].result() for key in keys]
+
+
+# Class: EngineEvaluator
+# Purpose: evaluates GA populations with the Python engine instead of Cadmium (same interface as PopulationEvaluator)
+    #all the candidates of a population advance together in one BatchCO2Engine, no scenario or log file is written
+# Arguments:
+    #kind: "vents" or "seats"
+    #config_file: the configuration file used by the ScenariosGenerator
+    #until: simulation time (default: 180, the default of co2_lab)
+    #batch_size: maximum number of candidates simulated together (None for the whole population)
+
+class EngineEvaluator:
+
+    def __init__(self, kind, config_file, until=180, batch_size=None):
+        self.kind = kind
+        self.config_file = config_file
+        self.until = until
+        self.batch_size = batch_size
+        #the results are cached under the engine rather than the Cadmium model (see get_fitness_cache in GA.py)
+        self.model_path = os.path.abspath(co2_engine.__file__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    #the simulation time, as for PopulationEvaluator (None for the default time of co2_lab)
+    @property
+    def timesteps(self):
+        return None if self.until == DEFAULT_TIMESTEPS else self.until
+
+    @timesteps.setter
+    def timesteps(self, timesteps):
+        self.until = DEFAULT_TIMESTEPS if timesteps is None else timesteps
+
+    # Function: evaluate
+    # Purpose: evaluates all the candidates of a population (identical candidates are only simulated once)
+    # Arguments: population: a list (or 2D numpy array) of candidates
+    # Return: list with the number of occupants at risk for each candidate (same order as the population)
+
+    def evaluate(self, population):
+        generator = get_generator(self.config_file)
+        candidates = dict()
+        keys = []
+        for candidate in population:
+            candidate = np.asarray(candidate)
+            key = str(candidate)
+            keys.append(key)
+            if key not in candidates:
+                candidates[key] = candidate
+
+        unique_keys = list(candidates.keys())
+        batch_size = self.batch_size if self.batch_size else max(len(unique_keys), 1)
+        results = dict()
+        for start in range(0, len(unique_keys), batch_size):
+            batch = unique_keys[start:start + batch_size]
+            engine = BatchCO2Engine(generator.scenario, [make_candidate_scenario(generator, self.kind, candidates[key]).delta for key in batch])
+            engine.run(self.until)
+            results.update(zip(batch, engine.count(EXPOSED_CO2_SOURCE)))
+        return [results[key] for key in keys]
+
+
+# Class: MultiFidelityEvaluator
+# Purpose: evaluates GA populations in two stages (same interface as PopulationEvaluator):
+    #(1) every candidate is simulated for a short time (screening),
+    #(2) only the candidates whose short-run score is within a margin of the best short-run score seen so far are
+    #simulated for the full time (promotion).
+    #candidates that are not promoted keep their short-run score, raised to at least the worst full-run score seen so
+    #far plus one, so they always rank behind every candidate that was simulated for the full time.
+    #the short-run results are stored in the fitness cache with their fidelity, so they are only simulated once.
+# Arguments:
+    #evaluator: a PopulationEvaluator or EngineEvaluator (its timesteps are changed for each stage)
+    #screen_timesteps: simulation time of the screening runs
+    #margin: number of exposed occupants a short-run score may exceed the best one by and still be promoted
+    #full_timesteps: simulation time of the full runs (None for the default time of the model)
+    #cache: FitnessCache for the short-run results (None to simulate them every time)
+
+class MultiFidelityEvaluator:
+
+    def __init__(self, evaluator, screen_timesteps, margin=1, full_timesteps=None, cache=None):
+        self.evaluator = evaluator
+        self.kind = evaluator.kind
+        self.config_file = evaluator.config_file
+        self.model_path = evaluator.model_path
+        self.screen_timesteps = screen_timesteps
+        self.margin = margin
+        self.timesteps = full_timesteps
+        self.cache = cache
+        #best short-run score seen so far (None until a candidate has been screened)
+        self.best_screen = None
+        #worst full-run score seen so far (None until a candidate has been simulated for the full time)
+        self.worst_full = None
+        #fidelity of every score returned by the last call to evaluate (see evaluate_population in GA.py)
+        self.fidelities = []
+        self.screened = 0
+        self.promoted = 0
+
+    def __enter__(self):
+        self.evaluator.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.evaluator.__exit__(exc_type, exc_value, traceback)
+
+    # Function: run_stage
+    # Purpose: simulates candidates for a given time with the wrapped evaluator
+    # Arguments:
+        #candidates: list of candidates
+        #timesteps: simulation time (None for the default time of the model)
+    # Return: list with the number of occupants at risk for each candidate
+
+    def run_stage(self, candidates, timesteps):
+        if len(candidates) == 0:
+            return []
+        self.evaluator.timesteps = timesteps
+        return self.evaluator.evaluate(candidates)
+
+    # Function: evaluate
+    # Purpose: evaluates all the candidates of a population (see the description of the class)
+    # Arguments: population: a list (or 2D numpy array) of candidates
+    # Return: list with the number of occupants at risk for each candidate (same order as the population)
+
+    def evaluate(self, population):
+        population = [np.asarray(candidate) for candidate in population]
+
+        #screening (short-run scores of earlier evaluations are read from the cache)
+        screen_scores = [None] * len(population)
+        if self.cache is not None:
+            screen_scores = [self.cache.get(self.kind, candidate, self.screen_timesteps) for candidate in population]
+        missing = [i for i, score in enumerate(screen_scores) if score is None]
+        for i, score in zip(missing, self.run_stage([population[i] for i in missing], self.screen_timesteps)):
+            screen_scores[i] = score
+            if self.cache is not None:
+                self.cache.put(self.kind, population[i], score, self.screen_timesteps)
+        self.screened = self.screened + len(population)
+
+        valid = [score for score in screen_scores if score >= 0]
+        if len(valid) > 0:
+            self.best_screen = min(valid) if self.best_screen is None else min(self.best_screen, min(valid))
+
+        #promotion of the candidates close to the best short-run score
+        promoted = [i for i, score in enumerate(screen_scores) if score >= 0 and score <= self.best_screen + self.margin]
+        results = list(screen_scores)
+        self.fidelities = [self.screen_timesteps] * len(population)
+        for i, score in zip(promoted, self.run_stage([population[i] for i in promoted], self.timesteps)):
+            results[i] = score
+            self.fidelities[i] = self.timesteps
+            if score >= 0:
+                self.worst_full = score if self.worst_full is None else max(self.worst_full, score)
+        self.promoted = self.promoted + len(promoted)
+
+        if self.worst_full is not None:
+            for i, fidelity in enumerate(self.fidelities):
+                if fidelity != self.timesteps and results[i] >= 0:
+                    results[i] = max(results[i], self.worst_full + 1)
+        return results
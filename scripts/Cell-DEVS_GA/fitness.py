@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** extract what the GA needs from the Cadmium state log ("state.txt") without parsing the whole log.
+#
+# **Project:** CO2 dispersion
+#
+# A state log is a sequence of frames. Each frame starts with a line holding the simulation time and is followed by
+# one line per logged cell, e.g. "State for model co2_lab_(10,8) is <-1,500,-100>" (the values are counter,
+# concentration and type). The fitness of a scenario only depends on the last frame, so the log is read backwards
+# from the end of the file until the start of that frame is found.
+
+import os
+from collections import Counter
+
+TYPE_INDEX = 2  # position of the cell type in a logged state <counter,concentration,type>
+
+
+# Function: is_time_line
+# Purpose: checks whether a line of the log is a time-step indicator
+# Arguments: line: a line of the log (str or bytes)
+# Return: True if the line only holds a time (an integer, like Parse and StateIndex of Cell-DEVS_co2-charting; "nan"
+    #or "inf" are not times)
+
+def is_time_line(line):
+    try:
+        int(line)
+        return True
+    except ValueError:
+        return False
+
+
+# Function: parse_state_line
+# Purpose: extracts the cell coordinates and the state values from a line of the log
+# Arguments: line: a line of the log (str or bytes)
+# Return:
+    #a tuple (coords, values) where coords is a tuple of ints and values is a list of ints
+    #None if the line does not describe the state of a cell
+
+def parse_state_line(line):
+    if isinstance(line, bytes):
+        line = line.decode("ascii")
+    start = line.find("(")
+    values_start = line.rfind("<")
+    if start == -1 or values_start == -1:
+        return None
+    coords = tuple(int(c) for c in line[start + 1:line.find(")", start)].split(","))
+    values = [int(v) for v in line[values_start + 1:line.rfind(">")].split(",")]
+    return coords, values
+
+
+# Function: read_last_frame
+# Purpose: reads the lines of the last frame of a log, starting from the end of the file and moving backwards
+    #only the last frame is ever held in memory, whatever the length of the simulation
+# Arguments:
+    #log_file: path of the state log
+    #block_size: number of bytes read at a time
+# Return:
+    #the lines (bytes, in file order) that follow the last time-step indicator
+    #all the lines of the file if it has no time-step indicator
+
+def read_last_frame(log_file, block_size=65536):
+    frame = []
+    with open(log_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""  #start of a line that continues in the block that was read before
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b"\n")
+            #the first piece may be the end of a line that starts in an earlier block
+            remainder = lines.pop(0) if position > 0 else b""
+            for line in reversed(lines):
+                if not line.strip():
+                    continue
+                if is_time_line(line):
+                    frame.reverse()
+                    return frame
+                frame.append(line)
+        if remainder.strip() and not is_time_line(remainder):
+            frame.append(remainder)
+    frame.reverse()
+    return frame
+
+
+# Function: get_final_type_histogram
+# Purpose: counts the cells of each type in the last frame of a log
+# Arguments:
+    #log_file: path of the state log
+    #type_index: position of the cell type in the logged state
+# Return:
+    #a Counter mapping each cell type to the number of cells of that type in the last frame
+
+def get_final_type_histogram(log_file, type_index=TYPE_INDEX):
+    histogram = Counter()
+    for line in read_last_frame(log_file):
+        state = parse_state_line(line)
+        if state is not None:
+            histogram[state[1][type_index]] += 1
+    return histogram
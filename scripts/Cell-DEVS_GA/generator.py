@@ -20,8 +20,59 @@ import sys
 import os
 import json
 import copy
+import itertools
 import subprocess
 
+#the scenario writer and the expansion of "cell_boxes" are shared with the create-model tool
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Cell-DEVS_create-model"))
+from ScenarioWriter import ScenarioWriter
+from ConvertTools import ConvertTools
+
+# Class: OverlayScenario
+# Purpose: a scenario made of the base scenario of a ScenariosGenerator plus a few cells (the delta) inserted in front of
+    #its cells. The base scenario is shared by all the overlays and never copied; a full scenario dictionary or file is
+    #only built when it is needed.
+# Arguments:
+    #generator: the ScenariosGenerator holding the base scenario
+    #delta: list of cells inserted in front of the cells of the base scenario
+
+class OverlayScenario:
+
+    def __init__ (self, generator, delta):
+        self.generator = generator
+        self.delta = delta
+
+    # Function: cells
+    # Purpose: lists the cells of the scenario (the delta followed by the cells of the base scenario)
+    # Arguments: none
+    # Return: list of cells (the cells of the base scenario are shared, not copied)
+
+    def cells(self):
+        return self.delta + self.generator.scenario["cells"]
+
+    # Function: to_dict
+    # Purpose: builds the scenario as a dictionary (same format as the JSON read by Cadmium)
+    # Arguments: none
+    # Return: scenario dictionary sharing everything but its "cells" list with the base scenario (do not modify it)
+
+    def to_dict(self):
+        scenario = dict(self.generator.scenario)
+        scenario["cells"] = self.cells()
+        return scenario
+
+    # Function: write
+    # Purpose: writes the scenario to a JSON file (compact, one cell at a time, so no copy of the base scenario is made)
+    # Arguments: file_path: path of the file (its directory is created if needed)
+    # Return: none
+
+    def write(self, file_path):
+        if os.path.dirname(file_path):
+            self.generator.ensure_dir(file_path)
+        scenario = dict(self.generator.scenario)
+        scenario["cells"] = itertools.chain(self.delta, self.generator.scenario["cells"])
+        ScenarioWriter.write(file_path, scenario, compact=True, compress=False)
+
+
 class ScenariosGenerator:
     # Function: __init__
     # Purpose: set variables to generate the scenarios
@@ -46,7 +97,7 @@ class ScenariosGenerator:
 
 
     # Function: loadScenario
-    # Purpose: read the scenario file
+    # Purpose: read the scenario file (cells described with "cell_boxes" by the create-model tool are expanded)
     # Arguments:
         #   scenarioFile: A JSON file that has the model scenario
     # Return:
@@ -62,6 +113,9 @@ class ScenariosGenerator:
             sys.exit(1)
 
         scenario = json.loads(scenario)  # Convert JSON string into dictionary
+        if "cell_boxes" in scenario:
+            scenario["cells"] = ConvertTools.getCells(scenario)
+            del scenario["cell_boxes"]
 
         return scenario    
 
@@ -121,20 +175,12 @@ class ScenariosGenerator:
 
             #generate vent cells to be stored in JSON
             for j in range(self.vent_size):
-                cell = self.make_cell(coords, vent_type, conc)
+                cell = self.make_cell(coords, self.vent_type, conc)
                 vent_cells.append(copy.deepcopy(cell))
                 coords[dimension] = coords[dimension]+1
 
-            #insert the new vent_cells in the original scenario
-            #this deep copy may not be efficient
-            new_scenario = copy.deepcopy(self.scenario)
-
-            new_scenario["cells"] = vent_cells + new_scenario["cells"]
-            
-            #save the scenario dictionary to disk
-            self.ensure_dir(self.scenarios_path)
-            with open(self.scenarios_path + "scenario_" + str(number_of_scenarios)+".json", "w") as f:
-                f.write(json.dumps(new_scenario, indent=4))
+            #insert the new vent_cells in the original scenario and save it to disk
+            OverlayScenario(self, vent_cells).write(self.scenarios_path + "scenario_" + str(number_of_scenarios)+".json")
 
             number_of_scenarios = number_of_scenarios + 1
 
@@ -144,9 +190,33 @@ class ScenariosGenerator:
     # Purpose: Create a scenario-given an input file scenario, create a scenario with the new vent location
     # Arguments: vent_loc_arr: a numpy array containing locations of vents. The pair of values vent_loc_arr[0] and vent_loc_arr[1] for instance are
                 #the x y coordinates of the top left corner of the first vent.
+                #scenarios_path: directory the scenario is written to (default: the scenarios_path of the configuration)
     # Return: name of the newly generated JSON scenario
     
-    def create_vent_scenario(self, vent_loc_arr):
+    def create_vent_scenario(self, vent_loc_arr, scenarios_path=None):
+        overlay = self.make_vent_scenario(vent_loc_arr)
+
+        vent_loc = overlay.delta[-1]["cell_id"] if len(overlay.delta) > 0 else []
+        scenario_name = "scenario_" + str(vent_loc)+"_GA.json"
+        #save the scenario to disk
+        overlay.write((self.scenarios_path if scenarios_path is None else scenarios_path) + scenario_name)
+        
+        return scenario_name
+
+    # Function: make_vent_scenario
+    # Purpose: same as create_vent_scenario, but the scenario is kept in memory instead of being written to disk
+    # Arguments: vent_loc_arr: a numpy array containing locations of vents (see create_vent_scenario)
+    # Return: OverlayScenario (the input scenario with the vent cells inserted in front of its cells)
+
+    def make_vent_scenario(self, vent_loc_arr):
+        return OverlayScenario(self, self.make_vent_cells(vent_loc_arr))
+
+    # Function: make_vent_cells
+    # Purpose: make the cells of the vents of a candidate (the cells create_vent_scenario inserts in the input scenario)
+    # Arguments: vent_loc_arr: a numpy array containing locations of vents (see create_vent_scenario)
+    # Return: list of vent cells
+
+    def make_vent_cells(self, vent_loc_arr):
         #because the genetic algorithm sends the parameter as ndarray
         #the json serialziation is expecting a list
         vents_loc = vent_loc_arr.tolist()
@@ -169,30 +239,40 @@ class ScenariosGenerator:
                 vent_loc[0] = vent_loc[0]-1
                 cell = self.make_cell(vent_loc, self.vent_type, conc)
                 vent_cells.append(copy.deepcopy(cell))
-                    
-        #insert the new vent_cells in the original scenario
-        #this deep copy may not be efficient
-        new_scenario = copy.deepcopy(self.scenario)
-        new_scenario["cells"] = vent_cells + new_scenario["cells"]
 
-        scenario_name = "scenario_" + str(vent_loc)+"_GA.json"
-        #save the scenario dictionary to disk
-        
-        self.ensure_dir(self.scenarios_path)
-        with open(self.scenarios_path + scenario_name, "w") as f:
-            f.write(json.dumps(new_scenario, indent=4))
-        
-        return scenario_name
+        return vent_cells
    
     # Function: create_vent_scenario
     # Purpose:  Create a scenario-given an input file scenario, create a scenario with the new seatings location
     # Arguments: seats_loc_arr: a numpy array containing locations of seats. The pair of values seats_loc_arr[0] and seats_loc_arr[1] for instance are
                         #the x y coordinates of the first occupant.
                 #index: this is appended to the name of the generated scenarios if the caller wants to keep all the scenarios
+                #scenarios_path: directory the scenario is written to (default: the scenarios_path of the configuration)
     # Return: name of the newly generated JSON scenario
    
-    def create_seats_scenario(self, seats_loc_arr, index):
+    def create_seats_scenario(self, seats_loc_arr, index, scenarios_path=None):
+        overlay = self.make_seats_scenario(seats_loc_arr)
+
+        scenario_name = "scenario_seats" + str(index)+".json"
+        #save the scenario to disk
+        overlay.write((self.scenarios_path if scenarios_path is None else scenarios_path) + scenario_name)
 
+        return scenario_name
+
+    # Function: make_seats_scenario
+    # Purpose: same as create_seats_scenario, but the scenario is kept in memory instead of being written to disk
+    # Arguments: seats_loc_arr: a numpy array containing locations of seats (see create_seats_scenario)
+    # Return: OverlayScenario (the input scenario with the occupant cells inserted in front of its cells)
+
+    def make_seats_scenario(self, seats_loc_arr):
+        return OverlayScenario(self, self.make_seats_cells(seats_loc_arr))
+
+    # Function: make_seats_cells
+    # Purpose: make the cells of the occupants of a candidate (the cells create_seats_scenario inserts in the input scenario)
+    # Arguments: seats_loc_arr: a numpy array containing locations of seats (see create_seats_scenario)
+    # Return: list of occupant cells
+
+    def make_seats_cells(self, seats_loc_arr):
         seats_loc = seats_loc_arr.tolist()
         conc = self.get_seats_info()
         seats_cells = []
@@ -205,18 +285,7 @@ class ScenariosGenerator:
             cell = self.make_cell(seat_loc, self.occupant_type, conc)
             seats_cells.append(copy.deepcopy(cell))
 
-        #insert the new vent_cells in the original scenario
-        #this deep copy may not be efficient
-        new_scenario = copy.deepcopy(self.scenario)
-        new_scenario["cells"] = seats_cells + new_scenario["cells"]
-
-        scenario_name = "scenario_seats" + str(index)+".json"
-        #save the scenario dictionary to disk
-        self.ensure_dir(self.scenarios_path)
-        with open(self.scenarios_path + scenario_name, "w") as f:
-            f.write(json.dumps(new_scenario, indent=4))
-
-        return scenario_name
+        return seats_cells
     
     # Function: make_cell
     # Purpose:  make a cell to be inserted in the JSON file
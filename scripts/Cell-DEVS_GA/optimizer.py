@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** the Genetic Algorithm (GA) used by GA.py, with a snapshot of its state written to disk after every
+# generation so that a run stopped by a crash or a reboot can be resumed from where it was.
+#
+# **Project:** CO2 dispersion
+#
+# The algorithm is the one of the Pypi geneticalgorithm library the GA used before (same parameters, selection, crossover
+# and mutation, integer variables only), but:
+# - a whole generation is scored at once, so the scoring function can simulate the new candidates concurrently
+#   (see evaluate_population in GA.py),
+# - the random numbers come from the GA's own generator, whose state is part of the snapshot,
+# - the snapshot (a JSON file replaced atomically) holds the population and its scores, the state of the random number
+#   generator, the best candidates of every generation (elite history) and the convergence report. With a fitness
+#   cache, a copy of the cache is written next to it.
+#
+# With a search space (see search_space.py), the variables are indices into the places where vents or occupants can be
+# put: the first population is sampled from the space and every child is repaired (and mutated) by the space, so no
+# candidate that cannot be simulated is ever scored.
+#
+# Resuming from a snapshot gives the same run as if it had never stopped (for a deterministic scoring function).
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+#parameters of the geneticalgorithm library (and their default values there)
+DEFAULT_PARAMETERS = {
+    "max_num_iteration": 100,
+    "population_size": 100,
+    "mutation_probability": 0.1,
+    "elit_ratio": 0.01,
+    "crossover_probability": 0.5,
+    "parents_portion": 0.3,
+    "crossover_type": "uniform",
+    "max_iteration_without_improv": None
+}
+CROSSOVER_TYPES = ["one_point", "two_point", "uniform"]
+#version of the snapshot format
+SNAPSHOT_VERSION = 1
+
+
+# Class: GeneticAlgorithm
+# Purpose: minimizes a scoring function over integer variables, with a snapshot written after every generation
+# Arguments:
+    #function: scores a population: called with a list of candidates (numpy arrays of integers), returns a list with
+    #one score per candidate (lower is better)
+    #variable_boundaries: list of [lowest, highest] values of every variable (both included)
+    #algorithm_parameters: dictionary with the parameters of the geneticalgorithm library (see DEFAULT_PARAMETERS)
+    #checkpoint_file: path of the snapshot (None to keep the state in memory only)
+    #seed: seed of the random number generator of a new run (None for a random seed)
+    #cache: FitnessCache copied next to the snapshot after every generation (None not to copy a cache)
+    #space: FreeCellSpace the candidates are encoded in (None for variables that can take any value within their
+    #boundaries); its bounds are used instead of variable_boundaries
+
+class GeneticAlgorithm:
+
+    def __init__(self, function, variable_boundaries=None, algorithm_parameters=None, checkpoint_file=None, seed=None, cache=None, space=None):
+        self.function = function
+        self.space = space
+        if space is not None:
+            variable_boundaries = space.bounds()
+        self.bounds = np.array(variable_boundaries, dtype=np.int64).reshape(-1, 2)
+        self.dimension = len(self.bounds)
+        self.param = dict(DEFAULT_PARAMETERS)
+        self.param.update(algorithm_parameters or {})
+        self.checkpoint_file = checkpoint_file
+        self.seed = seed
+        self.cache = cache
+
+        if self.param["crossover_type"] not in CROSSOVER_TYPES:
+            raise ValueError("Unknown crossover type: " + str(self.param["crossover_type"]))
+        if np.any(self.bounds[:, 0] > self.bounds[:, 1]):
+            raise ValueError("A variable boundary has its lowest value above its highest value")
+
+        #sizes computed the way the geneticalgorithm library does (the children are made in pairs)
+        self.population_size = int(self.param["population_size"])
+        self.parents_size = int(self.param["parents_portion"] * self.population_size)
+        if (self.population_size - self.parents_size) % 2 != 0:
+            self.parents_size += 1
+        elites = self.population_size * self.param["elit_ratio"]
+        self.elites_size = 1 if (elites < 1 and self.param["elit_ratio"] > 0) else int(elites)
+        if self.parents_size < self.elites_size:
+            raise ValueError("The number of parents must be greater than the number of elites")
+        self.max_iterations = int(self.param["max_num_iteration"])
+        self.max_without_improvement = self.param["max_iteration_without_improv"]
+        if self.max_without_improvement is None:
+            self.max_without_improvement = self.max_iterations + 1
+
+        self.report = []
+        self.output_dict = None
+
+    # Function: run
+    # Purpose: runs the GA until the maximum number of generations (or of generations without improvement) is reached
+    # Arguments: resume: if True and the snapshot is of an unfinished run, the run continues from the snapshot
+        #(a finished run in the snapshot is replaced by a new run)
+    # Return: dictionary with the best candidate ("variable") and its score ("function"), also kept in output_dict
+
+    def run(self, resume=True):
+        if not (resume and self.load()):
+            self.start()
+            self.save()
+        while not self.finished:
+            if self.generation >= self.max_iterations or self.stopped:
+                self.finish()
+            else:
+                self.next_generation()
+            self.save()
+        self.output_dict = {"variable": self.best_variable.copy(), "function": float(self.best_function)}
+        return self.output_dict
+
+    # Function: start
+    # Purpose: makes and scores the first population of a new run
+    # Arguments: none
+    # Return: none
+
+    def start(self):
+        self.rng = np.random.default_rng(self.seed)
+        if self.space is not None:
+            self.population = np.array([self.space.sample(self.rng) for i in range(self.population_size)], dtype=np.int64)
+        else:
+            self.population = self.rng.integers(self.bounds[:, 0], self.bounds[:, 1] + 1, size=(self.population_size, self.dimension))
+        self.scores = self.score(self.population)
+        self.generation = 0
+        self.without_improvement = 0
+        self.stopped = False
+        self.finished = False
+        self.report = []
+        self.elite_history = []
+        #like the geneticalgorithm library, the last candidate scored is the best one until the first generation is sorted
+        self.best_variable = self.population[-1].copy()
+        self.best_function = self.scores[-1]
+
+    # Function: score
+    # Purpose: scores candidates with the scoring function
+    # Arguments: candidates: 2D numpy array (one candidate per row)
+    # Return: numpy array of scores
+
+    def score(self, candidates):
+        scores = self.function([candidate.copy() for candidate in candidates])
+        if len(scores) != len(candidates):
+            raise ValueError("The scoring function returned " + str(len(scores)) + " scores for " + str(len(candidates)) + " candidates")
+        return np.array(scores, dtype=float)
+
+    # Function: sort
+    # Purpose: sorts the population by score (best first) and keeps the best candidate found so far
+    # Arguments: none
+    # Return: True if the best score improved
+
+    def sort(self):
+        order = np.argsort(self.scores, kind="stable")
+        self.population = self.population[order]
+        self.scores = self.scores[order]
+        if self.scores[0] < self.best_function:
+            self.best_function = self.scores[0]
+            self.best_variable = self.population[0].copy()
+            return True
+        return False
+
+    # Function: next_generation
+    # Purpose: selects the parents of the sorted population (elites first, the others by roulette wheel), makes and
+        #scores their children and records the elites and the best score of the generation
+    # Arguments: none
+    # Return: none
+
+    def next_generation(self):
+        if self.sort():
+            self.without_improvement = 0
+        else:
+            self.without_improvement += 1
+        self.report.append(float(self.scores[0]))
+        self.elite_history.append({
+            "generation": self.generation,
+            "variables": self.population[:max(self.elites_size, 1)].tolist(),
+            "scores": self.scores[:max(self.elites_size, 1)].tolist()
+        })
+
+        #roulette wheel: the lower the score, the more likely the candidate is chosen
+        normalized = self.scores + abs(self.scores[0]) if self.scores[0] < 0 else self.scores.copy()
+        normalized = normalized.max() - normalized + 1
+        cumulative = np.cumsum(normalized / normalized.sum())
+
+        parents = np.empty((self.parents_size, self.dimension), dtype=np.int64)
+        parent_scores = np.empty(self.parents_size)
+        parents[:self.elites_size] = self.population[:self.elites_size]
+        parent_scores[:self.elites_size] = self.scores[:self.elites_size]
+        for k in range(self.elites_size, self.parents_size):
+            index = min(int(np.searchsorted(cumulative, self.rng.random())), self.population_size - 1)
+            parents[k] = self.population[index]
+            parent_scores[k] = self.scores[index]
+
+        #parents taking part in crossovers (at least one)
+        crossing = np.zeros(self.parents_size, dtype=bool)
+        while not crossing.any():
+            crossing = self.rng.random(self.parents_size) <= self.param["crossover_probability"]
+        crossing = parents[crossing]
+
+        children = []
+        for k in range(self.parents_size, self.population_size, 2):
+            first = crossing[self.rng.integers(0, len(crossing))]
+            second = crossing[self.rng.integers(0, len(crossing))]
+            child1, child2 = self.crossover(first, second)
+            if self.space is not None:
+                children.append(self.space.mutate(self.space.repair(child1), self.param["mutation_probability"], self.rng))
+                children.append(self.space.repair(self.mutate_between(child2, first, second)))
+            else:
+                children.append(self.mutate(child1))
+                children.append(self.mutate_between(child2, first, second))
+
+        #the parents keep their scores, only the children are scored
+        self.population = np.concatenate([parents, np.array(children, dtype=np.int64).reshape(-1, self.dimension)])
+        self.scores = np.concatenate([parent_scores, self.score(children) if children else np.empty(0)])
+        self.generation += 1
+
+        if self.without_improvement > self.max_without_improvement:
+            self.stopped = self.scores.min() >= self.best_function
+
+    # Function: finish
+    # Purpose: sorts the last population and records its best score
+    # Arguments: none
+    # Return: none
+
+    def finish(self):
+        self.sort()
+        self.report.append(float(self.scores[0]))
+        self.finished = True
+
+    # Function: crossover
+    # Purpose: makes two children from two parents
+    # Arguments: first, second: numpy arrays of the parents
+    # Return: the two children
+
+    def crossover(self, first, second):
+        child1 = first.copy()
+        child2 = second.copy()
+        if self.param["crossover_type"] == "one_point":
+            swap = np.arange(self.dimension) < self.rng.integers(0, self.dimension)
+        elif self.param["crossover_type"] == "two_point":
+            start = self.rng.integers(0, self.dimension)
+            end = self.rng.integers(start, self.dimension)
+            swap = (np.arange(self.dimension) >= start) & (np.arange(self.dimension) < end)
+        else:
+            swap = self.rng.random(self.dimension) < 0.5
+        child1[swap] = second[swap]
+        child2[swap] = first[swap]
+        return child1, child2
+
+    # Function: mutate
+    # Purpose: replaces variables of a child by random values within their boundaries
+    # Arguments: child: numpy array (changed in place)
+    # Return: the child
+
+    def mutate(self, child):
+        mutated = self.rng.random(self.dimension) < self.param["mutation_probability"]
+        values = self.rng.integers(self.bounds[:, 0], self.bounds[:, 1] + 1)
+        child[mutated] = values[mutated]
+        return child
+
+    # Function: mutate_between
+    # Purpose: replaces variables of a child by random values between the values of its parents (within the boundaries
+        #of the variable where both parents have the same value)
+    # Arguments:
+        #child: numpy array (changed in place)
+        #first, second: numpy arrays of the parents
+    # Return: the child
+
+    def mutate_between(self, child, first, second):
+        mutated = self.rng.random(self.dimension) < self.param["mutation_probability"]
+        low = np.where(first == second, self.bounds[:, 0], np.minimum(first, second))
+        high = np.where(first == second, self.bounds[:, 1] + 1, np.maximum(first, second))
+        values = self.rng.integers(low, high)
+        child[mutated] = values[mutated]
+        return child
+
+    # Function: settings
+    # Purpose: describes the settings a snapshot can only be resumed with
+    # Arguments: none
+    # Return: dictionary of the parameters and variable boundaries (and of the search space, if any)
+
+    def settings(self):
+        settings = {"parameters": self.param, "variable_boundaries": self.bounds.tolist()}
+        if self.space is not None:
+            settings["space"] = self.space.settings()
+        return settings
+
+    # Function: save
+    # Purpose: writes the state of the run to the snapshot (to a temporary file first, so a crash never leaves it half
+        #written) and copies the fitness cache next to it
+    # Arguments: none
+    # Return: none
+
+    def save(self):
+        if self.checkpoint_file is None:
+            return
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "settings": self.settings(),
+            "generation": self.generation,
+            "population": self.population.tolist(),
+            "scores": self.scores.tolist(),
+            "rng_state": self.rng.bit_generator.state,
+            "best_variable": self.best_variable.tolist(),
+            "best_function": float(self.best_function),
+            "without_improvement": self.without_improvement,
+            "stopped": bool(self.stopped),
+            "finished": self.finished,
+            "report": self.report,
+            "elite_history": self.elite_history
+        }
+        if self.cache is not None:
+            self.cache.backup(self.checkpoint_file + ".cache.sqlite")
+
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_file))
+        descriptor, temporary = tempfile.mkstemp(suffix=".json", dir=directory)
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.checkpoint_file)
+
+    # Function: load
+    # Purpose: restores the state of an unfinished run from the snapshot
+    # Arguments: none
+    # Return: True if a run was restored, False if there is no snapshot or its run is finished
+
+    def load(self):
+        if self.checkpoint_file is None or not os.path.isfile(self.checkpoint_file):
+            return False
+        with open(self.checkpoint_file, "r") as f:
+            snapshot = json.loads(f.read())
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported snapshot version in " + self.checkpoint_file)
+        if snapshot["settings"] != json.loads(json.dumps(self.settings())):
+            raise ValueError("The snapshot " + self.checkpoint_file + " was made with other GA settings")
+        if snapshot["finished"]:
+            return False
+
+        self.rng = np.random.default_rng()
+        self.rng.bit_generator.state = snapshot["rng_state"]
+        self.population = np.array(snapshot["population"], dtype=np.int64).reshape(-1, self.dimension)
+        self.scores = np.array(snapshot["scores"], dtype=float)
+        self.generation = snapshot["generation"]
+        self.best_variable = np.array(snapshot["best_variable"], dtype=np.int64)
+        self.best_function = snapshot["best_function"]
+        self.without_improvement = snapshot["without_improvement"]
+        self.stopped = snapshot["stopped"]
+        self.finished = False
+        self.report = snapshot["report"]
+        self.elite_history = snapshot["elite_history"]
+        return True
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** the search space of the GA: the places of the base scenario where vents or occupants can be put, so the
+# GA only makes candidates that can be simulated (no vent over a wall, no occupant over another cell, ...).
+#
+# **Project:** CO2 dispersion
+#
+# A candidate is encoded as indices into the list of valid anchors of the base scenario instead of x y coordinates:
+# - a seat anchor is the cell of an occupant,
+# - a vent anchor is the first cell of a vent, which covers vent_size cells along X on two rows (Y and Y + 1), the way
+#   ScenariosGenerator.make_vent_cells places it.
+# An anchor is valid if all its cells are free: inside the shape of the scenario, not listed in the base scenario (walls,
+# doors, windows, workstations, occupants, ...) and, for occupants, reachable from a door without crossing a wall. These
+# are the checks of the Validator (see check_candidate in evaluation.py), computed once for the whole scenario.
+#
+# The repair and mutation operators keep the anchors of a candidate apart (no two occupants in the same cell, no two
+# vents sharing a cell), so every candidate they give passes the checks.
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Cell-DEVS_create-model"))
+from Reachability import Reachability
+
+AIR = -100
+IMPERMEABLE_STRUCTURE = -300
+DOOR = -400
+KINDS = ["vents", "seats"]
+
+
+# Class: FreeCellSpace
+# Purpose: index of the valid anchors of a base scenario, with the operators the GA uses on candidates encoded as anchor
+    #indices
+# Arguments:
+    #scenario: base scenario dictionary ("cells" and/or "cell_boxes", 2D)
+    #kind: "vents" or "seats"
+    #count: number of vents or occupants in a candidate
+    #vent_size: number of cells of a vent along X (vents only)
+
+class FreeCellSpace:
+
+    def __init__(self, scenario, kind, count, vent_size=1):
+        if kind not in KINDS:
+            raise ValueError("Unknown kind of candidate: " + str(kind))
+        shape = tuple(scenario["scenario"]["shape"])
+        if len(shape) != 2:
+            raise ValueError("Only 2D scenarios are supported (shape " + str(list(shape)) + ")")
+        self.kind = kind
+        self.count = int(count)
+        self.shape = shape
+
+        #free cells: cells of the default type (AIR) that the base scenario does not list
+        types = Reachability.getTypes(scenario)
+        listed = np.zeros(shape, dtype=bool)
+        for cell in scenario.get("cells", []):
+            coords = cell["cell_id"]
+            if len(coords) == 2 and 0 <= coords[0] < shape[0] and 0 <= coords[1] < shape[1]:
+                listed[tuple(coords)] = True
+        for box in scenario.get("cell_boxes", []):
+            listed[tuple(slice(max(start, 0), end + 1) for start, end in zip(box["from"], box["to"]))] = True
+        free = ~listed & (types == AIR)
+
+        if kind == "seats":
+            #occupants need a path to a door (any cell but a wall can be crossed, as in the Validator)
+            doors = (types == DOOR)
+            if doors.any():
+                free &= Reachability.getField(doors, types != IMPERMEABLE_STRUCTURE) >= 0
+            self.offsets = np.array([[0, 0]])
+        else:
+            self.offsets = np.array([[i, row] for row in (0, 1) for i in range(vent_size)])
+
+        #an anchor is valid if all the cells it covers are free (and inside the shape)
+        valid = np.ones(shape, dtype=bool)
+        for dx, dy in self.offsets:
+            shifted = np.zeros(shape, dtype=bool)
+            shifted[:shape[0] - dx, :shape[1] - dy] = free[dx:, dy:]
+            valid &= shifted
+        self.anchors = np.argwhere(valid)
+        #flat indices of the cells covered by every anchor (one row per anchor)
+        covered = self.anchors[:, None, :] + self.offsets[None, :, :]
+        self.footprints = covered[:, :, 0] * shape[1] + covered[:, :, 1]
+        self.positions = dict((tuple(anchor), i) for i, anchor in enumerate(self.anchors.tolist()))
+
+        if len(self.anchors) < self.count:
+            raise ValueError("The scenario has " + str(len(self.anchors)) + " places for " + kind + ", " + str(self.count) + " are needed")
+
+    # Function: from_generator
+    # Purpose: makes the search space of the base scenario of a ScenariosGenerator
+    # Arguments:
+        #generator: the ScenariosGenerator
+        #kind: "vents" or "seats"
+        #count: number of vents or occupants in a candidate
+    # Return: FreeCellSpace
+
+    @staticmethod
+    def from_generator(generator, kind, count):
+        return FreeCellSpace(generator.scenario, kind, count, vent_size=generator.vent_size)
+
+    # Function: bounds
+    # Purpose: gives the boundaries of the variables of an encoded candidate (one anchor index per vent or occupant)
+    # Arguments: none
+    # Return: list of [lowest, highest] indices (both included)
+
+    def bounds(self):
+        return [[0, len(self.anchors) - 1]] * self.count
+
+    # Function: settings
+    # Purpose: describes the search space (part of the settings of a GA snapshot, see optimizer.py)
+    # Arguments: none
+    # Return: dictionary
+
+    def settings(self):
+        return {"kind": self.kind, "count": self.count, "cells": self.offsets.tolist(), "anchors": len(self.anchors)}
+
+    # Function: decode
+    # Purpose: converts an encoded candidate into the x y coordinates sent to the evaluation functions
+    # Arguments: candidate: numpy array (or list) of anchor indices
+    # Return: numpy array of x y coordinate pairs (x and y of the first anchor, then of the second one, ...)
+
+    def decode(self, candidate):
+        return self.anchors[np.asarray(candidate, dtype=np.int64)].ravel()
+
+    # Function: encode
+    # Purpose: converts x y coordinates (e.g. a candidate of an earlier GA run) into anchor indices
+    # Arguments: coords: numpy array (or list) of x y coordinate pairs
+    # Return: numpy array of anchor indices (the candidate may still need a repair if its anchors overlap)
+
+    def encode(self, coords):
+        coords = [int(value) for value in list(coords)]
+        indices = []
+        for i in range(0, len(coords), 2):
+            if (coords[i], coords[i+1]) not in self.positions:
+                raise ValueError("No " + self.kind + " can be placed at " + str(coords[i:i+2]))
+            indices.append(self.positions[(coords[i], coords[i+1])])
+        return np.array(indices, dtype=np.int64)
+
+    # Function: allowed
+    # Purpose: finds the anchors whose cells are all still free
+    # Arguments: occupied: flat boolean array of the cells already covered by the candidate
+    # Return: boolean array with one value per anchor
+
+    def allowed(self, occupied):
+        return ~occupied[self.footprints].any(axis=1)
+
+    # Function: repair
+    # Purpose: makes an encoded candidate valid: the anchors are kept in order, and an anchor that is out of range or
+        #covers a cell of an earlier anchor is replaced by the nearest anchor that does not (the lowest index on ties)
+    # Arguments: candidate: numpy array of anchor indices (e.g. a child made by a crossover)
+    # Return: the repaired candidate (a new array)
+
+    def repair(self, candidate):
+        candidate = np.clip(np.asarray(candidate, dtype=np.int64), 0, len(self.anchors) - 1)
+        occupied = np.zeros(self.shape[0] * self.shape[1], dtype=bool)
+        for i, index in enumerate(candidate.tolist()):
+            if occupied[self.footprints[index]].any():
+                choices = np.flatnonzero(self.allowed(occupied))
+                if len(choices) == 0:
+                    raise ValueError("Not enough room for " + str(self.count) + " " + self.kind)
+                distances = ((self.anchors[choices] - self.anchors[index]) ** 2).sum(axis=1)
+                index = int(choices[np.argmin(distances)])
+                candidate[i] = index
+            occupied[self.footprints[index]] = True
+        return candidate
+
+    # Function: mutate
+    # Purpose: moves anchors of a valid candidate to random anchors that do not cover a cell of the other anchors
+    # Arguments:
+        #candidate: numpy array of anchor indices (valid, e.g. repaired)
+        #probability: probability of moving each anchor
+        #rng: numpy random Generator
+    # Return: the mutated candidate (a new array)
+
+    def mutate(self, candidate, probability, rng):
+        candidate = np.array(candidate, dtype=np.int64)
+        moved = rng.random(self.count) < probability
+        for i in np.flatnonzero(moved).tolist():
+            occupied = np.zeros(self.shape[0] * self.shape[1], dtype=bool)
+            occupied[self.footprints[np.delete(candidate, i)].ravel()] = True
+            choices = np.flatnonzero(self.allowed(occupied))
+            candidate[i] = choices[rng.integers(0, len(choices))]
+        return candidate
+
+    # Function: sample
+    # Purpose: makes a random valid candidate (used for the first population of the GA)
+    # Arguments: rng: numpy random Generator
+    # Return: numpy array of anchor indices
+
+    def sample(self, rng):
+        return self.repair(rng.integers(0, len(self.anchors), size=self.count))
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** a cheap surrogate of the CO2 simulation used to pre-screen GA populations: only the most promising
+# candidates are simulated, the others are scored by the surrogate.
+#
+# **Project:** CO2 dispersion
+#
+# The surrogate is a ridge regression (trained with NumPy, on the CPU) that predicts the number of occupants at risk
+# from the vent and occupant cells of a scenario. The cells are rasterized on the grid of the scenario and pooled into
+# blocks of cells, and a few summaries of the distances between occupants and vents are added.
+#
+# It is trained on the scenarios simulated for the Cell-DEVS_DNN data set (../Cell-DEVS_DNN/training_data.csv) and on
+# the results of earlier GA runs (the "collected_data_sheet" of the configuration file). Every new simulation result
+# is appended to the collected data and the surrogate is trained again.
+
+import os
+import csv
+import json
+import math
+import tempfile
+
+import numpy as np
+
+GA_DIR = os.path.dirname(os.path.abspath(__file__))
+DNN_TRAINING_DATA = os.path.join(GA_DIR, "..", "Cell-DEVS_DNN", "training_data.csv")
+
+#first columns of the training data files, followed by the vent cells (v_0x, v_0y, ...) and the occupants (o_0x, ...)
+#missing cells are written as -1
+DATA_COLUMNS = ["scenario", "number of vent cells", "number of occupants", "occupants at risk"]
+#smallest number of vent cells and occupants in the columns of a new file (the same as the DNN data set)
+MIN_VENT_COLUMNS = 60
+MIN_OCCUPANT_COLUMNS = 20
+
+
+# Function: read_training_data
+# Purpose: reads the simulated scenarios of a training data file (the columns are found by name, so files with
+    #more or fewer vent and occupant columns can be read)
+# Arguments: csv_path: path of the CSV file
+# Return: list of samples, each as a dictionary with "scenario", "vents" and "occupants" (lists of [x, y]) and
+    #"at_risk" (empty list if the file does not exist)
+
+def read_training_data(csv_path):
+    if not os.path.isfile(csv_path):
+        return []
+    samples = []
+    with open(csv_path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            samples.append({
+                "scenario": row["scenario"],
+                "vents": read_cells(row, "v"),
+                "occupants": read_cells(row, "o"),
+                "at_risk": int(row["occupants at risk"])
+            })
+    return samples
+
+
+# Function: read_cells
+# Purpose: reads the coordinates of the cells of a row of a training data file
+# Arguments:
+    #row: dictionary of the row (column name to value)
+    #prefix: "v" for vent cells, "o" for occupants
+# Return: list of [x, y] (the -1 of the missing cells are left out)
+
+def read_cells(row, prefix):
+    cells = []
+    i = 0
+    while (prefix + "_" + str(i) + "x") in row:
+        x = int(row[prefix + "_" + str(i) + "x"])
+        y = int(row[prefix + "_" + str(i) + "y"])
+        if x >= 0 and y >= 0:
+            cells.append([x, y])
+        i = i + 1
+    return cells
+
+
+# Function: append_training_data
+# Purpose: adds samples to a training data file. The rows are appended to the file; the file is only written again
+    #(to a temporary file first, so it is never left half written) when a sample has more vent or occupant cells than
+    #its columns can hold
+# Arguments:
+    #csv_path: path of the CSV file (created if it does not exist)
+    #new_samples: list of samples (see read_training_data)
+# Return: none
+
+def append_training_data(csv_path, new_samples):
+    new_samples = list(new_samples)
+    vent_columns = max([MIN_VENT_COLUMNS] + [len(sample["vents"]) for sample in new_samples])
+    occupant_columns = max([MIN_OCCUPANT_COLUMNS] + [len(sample["occupants"]) for sample in new_samples])
+
+    header = read_header(csv_path)
+    if header is not None:
+        file_vent_columns = count_cell_columns(header, "v")
+        file_occupant_columns = count_cell_columns(header, "o")
+        if header[:len(DATA_COLUMNS)] == DATA_COLUMNS and file_vent_columns >= vent_columns and file_occupant_columns >= occupant_columns:
+            with open(csv_path, "a", newline="") as f:
+                write_samples(csv.writer(f), new_samples, file_vent_columns, file_occupant_columns)
+            return
+
+    samples = read_training_data(csv_path) + new_samples
+    vent_columns = max([vent_columns] + [len(sample["vents"]) for sample in samples])
+    occupant_columns = max([occupant_columns] + [len(sample["occupants"]) for sample in samples])
+
+    header = list(DATA_COLUMNS)
+    for prefix, columns in (("v", vent_columns), ("o", occupant_columns)):
+        for i in range(columns):
+            header += [prefix + "_" + str(i) + "x", prefix + "_" + str(i) + "y"]
+
+    directory = os.path.dirname(os.path.abspath(csv_path))
+    descriptor, temporary = tempfile.mkstemp(suffix=".csv", dir=directory)
+    with os.fdopen(descriptor, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        write_samples(writer, samples, vent_columns, occupant_columns)
+    os.replace(temporary, csv_path)
+
+
+# Function: read_header
+# Purpose: reads the column names of a training data file
+# Arguments: csv_path: path of the CSV file
+# Return: list of column names (None if the file does not exist or is empty)
+
+def read_header(csv_path):
+    if not os.path.isfile(csv_path):
+        return None
+    with open(csv_path, "r", newline="") as f:
+        return next(csv.reader(f), None)
+
+
+# Function: count_cell_columns
+# Purpose: counts the cells a training data file has columns for
+# Arguments:
+    #header: list of column names
+    #prefix: "v" for vent cells, "o" for occupants
+# Return: number of cells (pairs of x and y columns)
+
+def count_cell_columns(header, prefix):
+    columns = set(header)
+    i = 0
+    while (prefix + "_" + str(i) + "x") in columns and (prefix + "_" + str(i) + "y") in columns:
+        i = i + 1
+    return i
+
+
+# Function: write_samples
+# Purpose: writes the rows of samples to a training data file (missing cells are written as -1)
+# Arguments:
+    #writer: csv writer of the file
+    #samples: list of samples (see read_training_data)
+    #vent_columns: number of vent cells the file has columns for
+    #occupant_columns: number of occupants the file has columns for
+# Return: none
+
+def write_samples(writer, samples, vent_columns, occupant_columns):
+    for sample in samples:
+        row = [sample["scenario"], len(sample["vents"]), len(sample["occupants"]), sample["at_risk"]]
+        for cells, columns in ((sample["vents"], vent_columns), (sample["occupants"], occupant_columns)):
+            for cell in cells:
+                row += [cell[0], cell[1]]
+            row += [-1, -1] * (columns - len(cells))
+        writer.writerow(row)
+
+
+# Function: scenario_sample
+# Purpose: makes the sample (vent and occupant cells) of a scenario
+# Arguments:
+    #scenario: scenario dictionary (e.g. OverlayScenario.to_dict())
+    #vent_type: type of the vent cells
+    #occupant_type: type of the occupant cells
+    #name: name of the scenario
+    #at_risk: number of occupants at risk (None if the scenario was not simulated)
+# Return: sample (see read_training_data)
+
+def scenario_sample(scenario, vent_type, occupant_type, name="", at_risk=None):
+    return {
+        "scenario": name,
+        "vents": [list(cell["cell_id"][:2]) for cell in scenario["cells"] if cell["state"]["type"] == vent_type],
+        "occupants": [list(cell["cell_id"][:2]) for cell in scenario["cells"] if cell["state"]["type"] == occupant_type],
+        "at_risk": at_risk
+    }
+
+
+# Class: Surrogate
+# Purpose: predicts the number of occupants at risk of scenarios
+# Arguments:
+    #shape: shape of the grid of the scenarios (x and y)
+    #pool: size of the blocks of cells the rasterized cells are added up over
+    #alpha: strength of the ridge regularization
+    #data_file: CSV file the new results are appended to (None to keep them in memory only)
+
+class Surrogate:
+
+    #distances (in cells) used to summarize how far occupants are from the nearest vent and from each other
+    VENT_DISTANCES = [1.5, 3, 5, 8, 12]
+    OCCUPANT_DISTANCES = [2, 4, 8]
+
+    def __init__(self, shape, pool=4, alpha=10.0, data_file=None):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.pool = pool
+        self.alpha = alpha
+        self.data_file = data_file
+        self.samples = []
+        self.weights = None
+
+    # Function: features
+    # Purpose: computes the features of a sample
+    # Arguments: sample: sample (see read_training_data)
+    # Return: numpy array of features
+
+    def features(self, sample):
+        vents = np.array(sample["vents"], dtype=float).reshape(-1, 2)
+        occupants = np.array(sample["occupants"], dtype=float).reshape(-1, 2)
+
+        #distance from every occupant to the nearest vent cell (no vent: farther than any distance used)
+        if len(vents) > 0 and len(occupants) > 0:
+            nearest_vent = np.sqrt(((occupants[:, None, :] - vents[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+        else:
+            nearest_vent = np.full(len(occupants), float(sum(self.shape)))
+        if len(occupants) > 1:
+            between = np.sqrt(((occupants[:, None, :] - occupants[None, :, :]) ** 2).sum(axis=2))
+            crowding = [((between < d).sum() - len(occupants)) / 2 for d in Surrogate.OCCUPANT_DISTANCES]
+        else:
+            crowding = [0] * len(Surrogate.OCCUPANT_DISTANCES)
+
+        summary = [len(occupants), len(vents), nearest_vent.mean() if len(occupants) > 0 else 0.0]
+        summary += [(nearest_vent > d).sum() for d in Surrogate.VENT_DISTANCES]
+        return np.concatenate([summary, crowding, self.raster(sample["occupants"]), self.raster(sample["vents"])])
+
+    # Function: raster
+    # Purpose: counts the cells in every block of the grid
+    # Arguments: cells: list of [x, y] (cells outside the grid are left out)
+    # Return: flat numpy array with one count per block
+
+    def raster(self, cells):
+        grid = np.zeros(self.shape)
+        for x, y in cells:
+            if 0 <= x < self.shape[0] and 0 <= y < self.shape[1]:
+                grid[x, y] += 1
+        grid = np.add.reduceat(grid, np.arange(0, self.shape[0], self.pool), axis=0)
+        grid = np.add.reduceat(grid, np.arange(0, self.shape[1], self.pool), axis=1)
+        return grid.ravel()
+
+    # Function: add
+    # Purpose: adds simulated samples to the training data (and to the data file); call fit to train again
+    # Arguments:
+        #samples: list of samples with their "at_risk" (see read_training_data)
+        #record: if True, the samples are also appended to the data file
+    # Return: none
+
+    def add(self, samples, record=True):
+        samples = [sample for sample in samples if sample["at_risk"] is not None and sample["at_risk"] >= 0]
+        self.samples += samples
+        if record and self.data_file is not None and len(samples) > 0:
+            append_training_data(self.data_file, samples)
+
+    # Function: fit
+    # Purpose: trains the surrogate on all its samples (features are standardized, the bias is not regularized)
+    # Arguments: none
+    # Return: none
+
+    def fit(self):
+        if len(self.samples) == 0:
+            return
+        features = np.array([self.features(sample) for sample in self.samples])
+        targets = np.array([sample["at_risk"] for sample in self.samples], dtype=float)
+        self.mean = features.mean(axis=0)
+        self.scale = features.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        design = self.design(features)
+        regularization = self.alpha * np.eye(design.shape[1])
+        regularization[0, 0] = 0.0
+        self.weights = np.linalg.solve(design.T @ design + regularization, design.T @ targets)
+
+    # Function: design
+    # Purpose: standardizes features and adds the bias column
+    # Arguments: features: 2D numpy array (one row per sample)
+    # Return: 2D numpy array
+
+    def design(self, features):
+        standardized = (features - self.mean) / self.scale
+        return np.hstack([np.ones((len(standardized), 1)), standardized])
+
+    # Function: is_trained
+    # Purpose: tells whether the surrogate can make predictions
+    # Arguments: none
+    # Return: True if fit was called with samples
+
+    def is_trained(self):
+        return self.weights is not None
+
+    # Function: predict
+    # Purpose: predicts the number of occupants at risk of samples
+    # Arguments: samples: list of samples (their "at_risk" is not used)
+    # Return: numpy array of predictions (never below zero or above the number of occupants)
+
+    def predict(self, samples):
+        features = np.array([self.features(sample) for sample in samples])
+        predictions = self.design(features) @ self.weights
+        return np.clip(predictions, 0, [len(sample["occupants"]) for sample in samples])
+
+
+# Function: select_promising
+# Purpose: chooses the candidates that should be simulated
+# Arguments:
+    #predictions: predicted number of occupants at risk of every candidate
+    #fraction: fraction of the candidates to choose (at least one candidate is chosen)
+# Return: sorted list of the positions of the candidates with the lowest predictions
+
+def select_promising(predictions, fraction):
+    if len(predictions) == 0:
+        return []
+    count = min(len(predictions), max(1, int(math.ceil(fraction * len(predictions)))))
+    return sorted(np.argsort(predictions, kind="stable")[:count].tolist())
+
+
+# Function: load_surrogate
+# Purpose: makes a surrogate for the scenarios of a configuration file, trained on the DNN data set and on the results
+    #collected by earlier GA runs
+# Arguments:
+    #config_file: the configuration file used by the ScenariosGenerator (its "collected_data_sheet" receives the new results;
+        #like the other paths of the configuration, a relative path is taken from the Cell-DEVS_GA directory)
+    #shape: shape of the grid of the scenarios (x and y)
+    #training_files: training data files read in addition to the collected data (default: the DNN data set)
+# Return: trained Surrogate
+
+def load_surrogate(config_file, shape, training_files=(DNN_TRAINING_DATA,)):
+    with open(config_file, "r") as f:
+        config = json.loads(f.read())
+    data_file = config.get("collected_data_sheet")
+    if data_file is not None:
+        data_file = os.path.join(GA_DIR, data_file)
+    surrogate = Surrogate(shape, data_file=data_file)
+    for training_file in training_files:
+        surrogate.add(read_training_data(training_file), record=False)
+    if data_file is not None:
+        surrogate.add(read_training_data(data_file), record=False)
+    surrogate.fit()
+    return surrogate
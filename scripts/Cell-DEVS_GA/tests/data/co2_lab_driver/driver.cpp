@@ -0,0 +1,47 @@
+// Driver of the cell rules of co2_lab_cell.hpp used to make the fixture of tests/test_co2_engine.py
+// (see tests/data/make_co2_engine_state.py, which writes its input and runs it)
+// usage: driver input_file state_log until
+// every cell has the same transport delay (resp_time) and all the cells step together; a cell computes when a cell of
+// its neighborhood changed at the previous step (all cells at the first step); the cells that changed are logged
+#include <iostream>
+#include <fstream>
+#include <memory>
+#include "co2_lab_cell.hpp"
+int main(int argc, char **argv) {
+    std::ifstream in(argv[1]); std::ofstream out(argv[2]); float until = atof(argv[3]);
+    int nx, ny; in >> nx >> ny;
+    conc c; int dx, dy;
+    in >> c.co2_production >> c.cell_size >> c.base >> c.window_conc >> c.vent_conc >> c.resp_time >> c.breathing_rate
+       >> c.time_active >> c.start_time >> c.risky_exposure_time >> c.risky_concentration >> c.flow_weight >> dx >> dy;
+    c.airflow_dir = {dx, dy};
+    int no; in >> no; std::vector<std::vector<int>> offs(no, std::vector<int>(2)); for (auto &o : offs) in >> o[0] >> o[1];
+    std::map<cell_position, std::unique_ptr<co2_lab_cell<float>>> cells;
+    std::map<cell_position, co2> st;
+    for (int i = 0; i < nx * ny; i++) { int x, y, k, cc, t; in >> x >> y >> k >> cc >> t; st[{x, y}] = co2(k, cc, (CELL_TYPE)t, 0); }
+    for (auto &p : st) {
+        cell_map<co2, int> m; m.location = p.first; cell_unordered<int> n;
+        for (auto &o : offs) { int x = p.first[0] + o[0], y = p.first[1] + o[1]; if (x >= 0 && y >= 0 && x < nx && y < ny) n[{x, y}] = 1; }
+        cells[p.first] = std::make_unique<co2_lab_cell<float>>(p.first, n, p.second, m, "transport", c);
+    }
+    auto log = [&](float t, std::map<cell_position, bool> *only) {
+        out << t << "\n";
+        for (auto &p : cells) if (!only || (*only)[p.first]) { auto &s = p.second->state.current_state;
+            out << "State for model co2_lab_(" << p.first[0] << "," << p.first[1] << ") is " << s << "\n"; }
+    };
+    log(0, nullptr);
+    std::map<cell_position, bool> active; for (auto &p : cells) active[p.first] = true;
+    for (int k = 1; k * c.resp_time <= until; k++) {
+        std::map<cell_position, co2> next; std::map<cell_position, bool> changed;
+        for (auto &p : cells) {
+            auto &cell = *p.second; cell.state.neighbors_state.clear();
+            for (auto &n : cell.neighbors) cell.state.neighbors_state[n.first] = cells[n.first]->state.current_state;
+            co2 s = active[p.first] ? cell.local_computation() : cell.state.current_state;
+            changed[p.first] = (s != cell.state.current_state); next[p.first] = s;
+        }
+        std::map<cell_position, bool> nact;
+        for (auto &p : cells) { p.second->state.current_state = next[p.first];
+            if (changed[p.first]) for (auto &n : p.second->neighbors) nact[n.first] = true; }
+        active = nact;
+        log(k * c.resp_time, &changed);
+    }
+}
@@ -0,0 +1,26 @@
+#pragma once
+#include <vector>
+#include <map>
+#include <string>
+#include <cassert>
+namespace cadmium { namespace celldevs {
+using cell_position = std::vector<int>;
+template<typename V> using cell_unordered = std::map<cell_position, V>;
+template<typename S, typename V> struct cell_map {
+    cell_position location;
+    std::vector<int> relative(cell_position const &n) const { std::vector<int> r; for (size_t i = 0; i < n.size(); i++) r.push_back(n[i] - location[i]); return r; }
+};
+template<typename S> struct cell_state { S current_state; std::map<cell_position, S> neighbors_state; };
+template<typename T, typename S, typename V = int> class grid_cell {
+public:
+    T simulation_clock{};
+    cell_state<S> state;
+    cell_map<S, V> map;
+    cell_unordered<V> neighbors;
+    grid_cell() {}
+    grid_cell(cell_position const &id, cell_unordered<V> const &n, S s, cell_map<S, V> const &m, std::string const &) : map(m), neighbors(n) { state.current_state = s; }
+    virtual ~grid_cell() {}
+    virtual S local_computation() const = 0;
+    virtual T output_delay(S const &) const = 0;
+};
+}}
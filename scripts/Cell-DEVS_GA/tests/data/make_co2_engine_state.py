@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** makes the fixture of tests/test_co2_engine.py: co2_engine_scenario.json and its state log
+# co2_engine_state.txt.
+#
+# **Project:** CO2 dispersion
+#
+# The log is not recorded by Cadmium. It is written by co2_lab_driver/driver.cpp, which compiles local_computation of
+# computer_lab_infection/model/co2_lab_cell.hpp unchanged (against the small stand-ins for the Cadmium and nlohmann
+# headers in co2_lab_driver/include) and calls it the way co2_engine.py assumes Cadmium does:
+# - all the cells step together every resp_time, each seeing the states its neighbors had at the previous step,
+# - a cell only computes when a cell of its neighborhood changed at the previous step (all cells at the first step),
+# - the neighbor states are visited in coordinate order (Cadmium uses an unordered map; in a 2D scenario only one
+#   neighbor matches the airflow direction, so the order does not change the results).
+# The test is therefore a regression test of the engine against the C++ cell rules: it catches differences in the
+# rules (integer and float arithmetic, cell types, counters), not differences in the scheduling of Cadmium. With a
+# built co2_lab, test_co2_lab_log checks the engine against a real Cadmium log.
+#
+# To make the fixture again (needs g++), from scripts/Cell-DEVS_GA:
+#   python3 tests/data/make_co2_engine_state.py
+
+import os
+import json
+import shutil
+import tempfile
+import itertools
+import subprocess
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+DRIVER_DIR = os.path.join(DATA_DIR, "co2_lab_driver")
+MODEL_DIR = os.path.join(DATA_DIR, "..", "..", "..", "..", "computer_lab_infection", "model")
+SCENARIO_FILE = os.path.join(DATA_DIR, "co2_engine_scenario.json")
+STATE_LOG_FILE = os.path.join(DATA_DIR, "co2_engine_state.txt")
+#last logged time
+UNTIL = 45
+
+CONFIG_FIELDS = ["co2_production", "cell_size", "base", "window_conc", "vent_conc", "resp_time", "breathing_rate",
+                 "time_active", "start_time", "risky_exposure_time", "risky_concentration", "flow_weight",
+                 "airflow_dir_x", "airflow_dir_y"]
+
+
+# Function: make_scenario
+# Purpose: makes the scenario of the fixture: a 10x8 room with walls around it, a door, a window, a vent (2 cells),
+    #4 occupants and 2 workstations
+# Arguments: none
+# Return: the scenario as a Python dictionary
+
+def make_scenario():
+    nx, ny = 10, 8
+    cells = []
+    def add(x, y, cell_type, counter=-1, concentration=500):
+        cells.append({"cell_id": [x, y], "state": {"counter": counter, "concentration": concentration, "type": cell_type}})
+    for x in range(nx):
+        for y in range(ny):
+            if x in (0, nx - 1) or y in (0, ny - 1):
+                if (x, y) == (0, 3):
+                    add(x, y, -400)
+                elif (x, y) == (nx - 1, 4):
+                    add(x, y, -500, concentration=400)
+                elif (x, y) in ((5, 0), (6, 0)):
+                    add(x, y, -600, concentration=0)
+                else:
+                    add(x, y, -300, concentration=0)
+    for x, y in ((3, 3), (4, 3), (3, 4), (6, 3)):
+        add(x, y, -200, counter=0)
+    add(6, 5, -700, counter=0)
+    add(2, 6, -700, counter=0)
+    config = {"co2_production": 0.0155, "cell_size": 25, "base": 500, "resp_time": 1, "window_conc": 400, "vent_conc": 0,
+              "breathing_rate": 5, "time_active": 40, "start_time": 5, "risky_concentration": 560, "flow_weight": 0.3,
+              "risky_exposure_time": 4, "airflow_dir_x": 1, "airflow_dir_y": 0}
+    return {"scenario": {"shape": [nx, ny], "wrapped": False, "default_delay": "transport", "default_cell_type": "CO2_cell",
+                         "default_state": {"counter": -1, "concentration": 500, "type": -100, "breathing_counter": 0},
+                         "default_config": {"CO2_cell": config},
+                         "neighborhood": [{"type": "moore", "range": 1}]},
+            "cells": cells}
+
+
+# Function: write_driver_input
+# Purpose: writes the input of the driver: shape, configuration, neighborhood offsets and the state of every cell
+# Arguments:
+    #scenario: the scenario (2D, Moore neighborhood of range 1)
+    #input_file: path of the file to write
+# Return: none
+
+def write_driver_input(scenario, input_file):
+    description = scenario["scenario"]
+    nx, ny = description["shape"]
+    config = description["default_config"]["CO2_cell"]
+    default_state = description["default_state"]
+    states = dict(((x, y), default_state) for x in range(nx) for y in range(ny))
+    for cell in scenario["cells"]:
+        states[tuple(cell["cell_id"])] = cell["state"]
+    with open(input_file, "w") as f:
+        f.write(str(nx) + " " + str(ny) + "\n")
+        f.write(" ".join(str(config[field]) for field in CONFIG_FIELDS) + "\n")
+        offsets = list(itertools.product([-1, 0, 1], repeat=2))
+        f.write(str(len(offsets)) + "\n")
+        for offset in offsets:
+            f.write(str(offset[0]) + " " + str(offset[1]) + "\n")
+        for (x, y), state in sorted(states.items()):
+            f.write(" ".join(str(value) for value in [x, y, state["counter"], state["concentration"], state["type"]]) + "\n")
+
+
+if __name__ == "__main__":
+    scenario = make_scenario()
+    with open(SCENARIO_FILE, "w") as f:
+        f.write(json.dumps(scenario, indent=4) + "\n")
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        driver = os.path.join(work_dir, "driver")
+        subprocess.check_call(["g++", "-std=c++17", "-O2", "-I", os.path.join(DRIVER_DIR, "include"), "-I", MODEL_DIR,
+                               os.path.join(DRIVER_DIR, "driver.cpp"), "-o", driver])
+        input_file = os.path.join(work_dir, "in.txt")
+        write_driver_input(scenario, input_file)
+        subprocess.check_call([driver, input_file, STATE_LOG_FILE, str(UNTIL)])
+    finally:
+        shutil.rmtree(work_dir)
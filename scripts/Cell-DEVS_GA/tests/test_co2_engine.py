@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# **Purpose:** checks the Python reference engine (co2_engine.py) against state logs of the CO2 model.
+#
+# **Project:** CO2 dispersion
+#
+# data/co2_engine_scenario.json is a 10x8 room (walls, a door, a window, a vent, 4 occupants and 2 workstations) and
+# data/co2_engine_state.txt its state log for times 0 to 45, in the Cadmium log format. The log covers occupants being
+# exposed and recovering (-200 <-> -250) and workstations whose occupants leave (time_active).
+# test_cell_rules_log is a regression test: the log is not a Cadmium recording but the output of the C++ cell rules of
+# co2_lab_cell.hpp under the same scheduling as the engine (all the cells step together), made by
+# data/make_co2_engine_state.py. It catches changes in the cell rules, not differences with the scheduling of Cadmium.
+# If the co2_lab executable is built, test_co2_lab_log runs the scenario with Cadmium and checks the engine against its log.
+#
+# To run the tests (from scripts/Cell-DEVS_GA):
+#   python3 -m unittest discover tests
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+from co2_engine import CO2Engine, SUSCEPTIBLE_CO2_SOURCE
+from fitness import is_time_line
+
+SCENARIO_FILE = os.path.join(TESTS_DIR, "data", "co2_engine_scenario.json")
+STATE_LOG_FILE = os.path.join(TESTS_DIR, "data", "co2_engine_state.txt")
+MODEL_PATH = os.path.join(TESTS_DIR, "..", "..", "..", "computer_lab_infection", "bin", "co2_lab")
+
+
+class CO2EngineLogTest(unittest.TestCase):
+
+    def test_cell_rules_log(self):
+        summary = CO2Engine.from_file(SCENARIO_FILE).compare_with_log(STATE_LOG_FILE)
+        self.assertEqual(summary["frames"], 46)
+        self.assertGreater(summary["cells"], 0)
+        self.assertEqual(summary["mismatches"], 0, summary["first_mismatch"])
+
+    def test_changed_log(self):
+        #a log that differs from the engine in one cell is reported
+        with open(STATE_LOG_FILE, "r") as f:
+            lines = f.readlines()
+        changed = [i for i, line in enumerate(lines) if line.endswith(",-250>\n")][0]
+        lines[changed] = lines[changed].replace(",-250>", ",-200>")
+        work_dir = tempfile.mkdtemp()
+        try:
+            log_file = os.path.join(work_dir, "state.txt")
+            with open(log_file, "w") as f:
+                f.writelines(lines)
+            summary = CO2Engine.from_file(SCENARIO_FILE).compare_with_log(log_file)
+        finally:
+            shutil.rmtree(work_dir)
+        self.assertEqual(summary["mismatches"], 1)
+        self.assertEqual(summary["first_mismatch"]["log"][2], -200)
+        self.assertEqual(summary["first_mismatch"]["engine"][2], SUSCEPTIBLE_CO2_SOURCE)
+
+    def test_3d_airflow(self):
+        #in 3D, the airflow direction matches one neighbor per Z offset and co2_lab uses one of them in an unknown order
+        with open(SCENARIO_FILE, "r") as f:
+            scenario = json.loads(f.read())
+        scenario["scenario"]["shape"] = scenario["scenario"]["shape"] + [3]
+        for cell in scenario["cells"]:
+            cell["cell_id"] = cell["cell_id"] + [1]
+        self.assertRaises(ValueError, CO2Engine, scenario)
+        #without airflow, the neighbor is not needed
+        scenario["scenario"]["default_config"]["CO2_cell"]["flow_weight"] = 0
+        CO2Engine(scenario).run(10)
+
+    def test_time_lines(self):
+        #only integer lines are time-steps
+        for line in ["0\n", "45", b"12\n", " 7 "]:
+            self.assertTrue(is_time_line(line), line)
+        for line in ["nan\n", "inf", b"-Infinity", "1.5", "", "State for model co2_lab_(0,0) is <-1,0,-300>"]:
+            self.assertFalse(is_time_line(line), line)
+
+    @unittest.skipUnless(os.path.isfile(MODEL_PATH), "co2_lab is not built")
+    def test_co2_lab_log(self):
+        from evaluation import run_simulation
+        work_dir = tempfile.mkdtemp()
+        try:
+            log_file = run_simulation(MODEL_PATH, SCENARIO_FILE, work_dir, timesteps=45)
+            summary = CO2Engine.from_file(SCENARIO_FILE).compare_with_log(log_file)
+        finally:
+            shutil.rmtree(work_dir)
+        self.assertEqual(summary["mismatches"], 0, summary["first_mismatch"])
+
+
+if __name__ == "__main__":
+    unittest.main()
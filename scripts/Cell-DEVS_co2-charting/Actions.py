@@ -3,6 +3,7 @@
 
 from Parse import Parse
 from Graph import Graph
+from StateIndex import StateIndex
 import time
 import threading
 
@@ -19,7 +20,7 @@ class Actions:
     #     graphicalElements: dictionary of elements from a GUI which can be modified within the thread
     #     filename: name of the file from which to obtain graphing data (transient mode only)
     #     coords: coordinates for which to generate a graph
-    #     cellDict: dictionary of cells read from the file (non-transient mode only)
+    #     cellDict: CellStore (or dictionary) of cells read from the file (non-transient mode only)
     class GraphThread(threading.Thread):
         def __init__ (self, graphicalElements, filename="", coords=None, cellDict=None):
             super().__init__(daemon=True)
@@ -46,8 +47,7 @@ class Actions:
     #     self: enclosing instance (automatic, not user specified)
     #     graphicalElements: dictionary of elements from a GUI which can be modified within the thread
     #     filename: name of the file from which to obtain coordinate data
-    #     coords: coordinates for which to generate a graph
-    #     cellDict: dictionary used to store coordinates
+    #     cellDict: CellStore used to store coordinates
     class LoadThread(threading.Thread):
         def __init__ (self, graphicalElements, filename="", cellDict=None):
             super().__init__(daemon=True)
@@ -59,13 +59,13 @@ class Actions:
         def run (self):
             self.graphicalElements["fileButton"]["state"] = "disable"
             self.graphicalElements["graphButton"]["state"] = "disable"
-            result = Actions.getAllCellStates (self.filename)
-            self.cellDict.clear()
-            for key in result[0]:
-                self.cellDict[key] = result[0][key]
+            result = Actions.loadCellStore(self.filename, self.cellDict)
             self.graphicalElements["fileButton"]["state"] = "normal"
             self.graphicalElements["graphButton"]["state"] = "normal"
 
+            if (not result[0]):
+                self.graphicalElements["statusLabel"].set("File too large for store mode")
+                return
             self.graphicalElements["statusLabel"].set(f"Storage populated (elapsed: {round(result[1], 2)}s)")
             print("Storage populated")
 
@@ -88,7 +88,7 @@ class Actions:
             return [False, 0]
 
     # Function: generateGraph_transient
-    # Purpose: generate a graph directly from a file (displays in a web browser)
+    # Purpose: generate a graph directly from a file using its byte-offset index (displays in a web browser)
     # Arguments:
     #     filename: name of the file from which to obtain graphing data
     #     coords: coordinates for which to generate a graph
@@ -99,7 +99,7 @@ class Actions:
         print(f"Parsing file ({filename}) for coords: {coords}")
 
         startTime = time.monotonic()
-        dataPoints = Parse.getCellStates(filename, coords)
+        dataPoints = StateIndex.load(filename).getCellStates(coords)
         endTime = time.monotonic()
 
         print(f"Parse complete")
@@ -118,7 +118,7 @@ class Actions:
     # Function: generateGraph_query
     # Purpose: generate a graph from a dictionary of coordinates
     # Arguments:
-    #     cellDict: dictionary to be used to generate a graph
+    #     cellDict: CellStore (or dictionary) to be used to generate a graph
     #     coords: coordinates for which to generate a graph
     # Return:
     #     list containing the success/failure and the time elapsed
@@ -160,4 +160,21 @@ class Actions:
         endTime = time.monotonic()
         timeElapsed = endTime - startTime
         print(f"Time taken: {timeElapsed}s")
-        return [states, timeElapsed]
\ No newline at end of file
+        return [states, timeElapsed]
+
+    # Function: loadCellStore
+    # Purpose: load the state of every cell in a file into a CellStore
+    # Arguments:
+    #     filename: name of the file from which to obtain coordinate data
+    #     cellStore: CellStore to be populated (its previous contents are replaced)
+    # Return:
+    #     list containing the success/failure and the time elapsed
+    @staticmethod
+    def loadCellStore (filename, cellStore):
+        print(f"Parsing file ({filename})...")
+        startTime = time.monotonic()
+        success = cellStore.load(filename)
+        endTime = time.monotonic()
+        timeElapsed = endTime - startTime
+        print(f"Time taken: {timeElapsed}s")
+        return [success, timeElapsed]
\ No newline at end of file
@@ -0,0 +1,244 @@
+# Carleton University (ARSLab)
+
+from DataPoint import DataPoint
+from StateIndex import StateIndex
+import numpy as np
+
+# Class: CellStore
+# Purpose: compact in-memory storage of every cell's state over time (store mode)
+# Arguments:
+#     self: enclosing instance (automatic, not user specified)
+#     times: time-steps present in the loaded file (axis 0 of the arrays)
+#     concentrations: array of concentrations with shape (time, x, y, z)
+#     types: array of cell type codes with the same shape as concentrations
+#     present: array with shape (x, y, z) indicating which coordinates appear in the loaded file
+#     synthesized: array with shape (x, y, z) containing the number of time-steps filled in for each coordinate
+#     dim: number of coordinates used by the loaded file (2 or 3)
+class CellStore:
+
+    # Value used to mark samples that have not been read from the file
+    missing = np.iinfo(np.int32).min
+
+    # Largest number of bytes that load will allocate (larger files should be graphed in transient mode)
+    maxSize = 2 * 1024 ** 3
+
+    # Constructor for the CellStore class
+    def __init__ (self):
+        self.clear()
+
+    # Function: clear
+    # Purpose: remove all stored data
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     none
+    def clear (self):
+        self.times = np.zeros(0, dtype=np.int64)
+        self.concentrations = np.zeros((0, 0, 0, 0), dtype=np.int32)
+        self.types = np.zeros((0, 0, 0, 0), dtype=np.int16)
+        self.present = np.zeros((0, 0, 0), dtype=bool)
+        self.synthesized = np.zeros((0, 0, 0), dtype=np.int32)
+        self.dim = 0
+
+    # Function: load
+    # Purpose: load the state of every cell from a file (replaces any data already stored)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     filename: name of the file to be loaded
+    # Return:
+    #     whether or not the file was loaded (False if storing it would exceed maxSize)
+    def load (self, filename):
+        index = StateIndex.load(filename)
+
+        # Use the index to size the arrays before reading any state
+        cellPositions = {}
+        for key in index.getCoordsStrings():
+            cellPositions[key] = tuple(int(element) for element in key.split(","))
+        self.dim = max((len(coords) for coords in cellPositions.values()), default=0)
+        shape = [0, 0, 1]
+        for coords in cellPositions.values():
+            for axis, coord in enumerate(coords):
+                shape[axis] = max(shape[axis], coord + 1)
+        if (self.dim < 3):
+            cellPositions = {key: coords + (0,) * (3 - len(coords)) for key, coords in cellPositions.items()}
+
+        # Refuse files that do not fit in the allowed amount of memory (before anything is allocated)
+        numSteps = max(len(index.times), 1)
+        size = CellStore.getSize(numSteps, shape)
+        if (size > CellStore.maxSize):
+            print(f"ERROR: Storing {numSteps} time-steps of a {shape} grid requires {size} bytes (limit is {CellStore.maxSize} bytes), use transient mode instead")
+            self.clear()
+            return False
+
+        self.times = np.array(index.times if len(index.times) > 0 else [0], dtype=np.int64)
+        print(f"Allocating storage for {numSteps} time-steps of a {shape} grid ({size} bytes)")
+        self.concentrations = np.full([numSteps] + shape, CellStore.missing, dtype=np.int32)
+        self.types = np.zeros([numSteps] + shape, dtype=np.int16)
+        self.present = np.zeros(shape, dtype=bool)
+
+        # Position of each coordinate string in a flattened time-step
+        cellIndices = {key: int(np.ravel_multi_index(coords, shape)) for key, coords in cellPositions.items()}
+
+        # Read every cell line once, storing each time-step as a whole
+        # (lines before the first time-step indicator belong to the first time-step)
+        step = -1
+        positions = []
+        values = []
+        with open(filename, "rb") as f:
+            for line in f:
+                start = line.find(b"(")
+                if (start < 0):
+                    try:
+                        int(line)
+                    except ValueError:
+                        continue
+                    self.storeStep(max(step, 0), positions, values)
+                    step += 1
+                    positions = []
+                    values = []
+                    continue
+
+                positions.append(cellIndices[line[start + 1:line.find(b")", start)].replace(b" ", b"").decode("ascii")])
+                values.append(line[line.rfind(b"<") + 1:line.rfind(b">")].split(b",", 3)[1:3])
+        self.storeStep(max(step, 0), positions, values)
+
+        print("Filling missing time-steps...")
+        self.fillMissing()
+        self.printSynthesized()
+        return True
+
+    # Function: storeStep
+    # Purpose: store the states read for one time-step (a cell that appears more than once keeps its last state)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     step: index of the time-step in the arrays
+    #     positions: list of flattened array positions of the cells (one per line)
+    #     values: list of [concentration, type] byte strings (parallel to positions)
+    # Return:
+    #     none
+    def storeStep (self, step, positions, values):
+        if (len(positions) == 0):
+            return
+        positions = np.array(positions, dtype=np.intp)
+        values = np.array(values).astype(np.int32)
+
+        # The first occurrence in the reversed lines is the last state of each cell
+        last = len(positions) - 1 - np.unique(positions[::-1], return_index=True)[1]
+        positions = positions[last]
+        self.concentrations[step].reshape(-1)[positions] = values[last, 0]
+        self.types[step].reshape(-1)[positions] = values[last, 1]
+        self.present.reshape(-1)[positions] = True
+
+    # Function: fillMissing
+    # Purpose: repeat the previous state of a cell for time-steps in which it did not appear
+    #          (time-steps before a cell's first appearance use its first state)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     none
+    def fillMissing (self):
+        numSteps = len(self.concentrations)
+        self.synthesized = np.count_nonzero(self.concentrations == CellStore.missing, axis=0).astype(np.int32)
+        self.synthesized[~self.present] = 0
+        for step in range(1, numSteps):
+            gaps = self.concentrations[step] == CellStore.missing
+            self.concentrations[step][gaps] = self.concentrations[step - 1][gaps]
+            self.types[step][gaps] = self.types[step - 1][gaps]
+        for step in range(numSteps - 2, -1, -1):
+            gaps = self.concentrations[step] == CellStore.missing
+            if (not gaps.any()):
+                break
+            self.concentrations[step][gaps] = self.concentrations[step + 1][gaps]
+            self.types[step][gaps] = self.types[step + 1][gaps]
+
+    # Function: printSynthesized
+    # Purpose: print how many samples had to be filled in (indicates how sparse the loaded file is)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     none
+    def printSynthesized (self):
+        numCells = len(self)
+        if (numCells == 0):
+            return
+        numSamples = len(self.times)
+        total = int(self.synthesized.sum())
+        sparsest = np.unravel_index(np.argmax(self.synthesized), self.synthesized.shape)
+        coordsString = ",".join(str(coord) for coord in sparsest[:self.dim])
+        print(f"Synthesized samples: {total} of {numCells * numSamples} ({round(total * 100 / (numCells * numSamples), 2)}%)")
+        print(f"Sparsest coordinates: {coordsString} ({self.synthesized[sparsest]} of {numSamples} synthesized)")
+
+    # Function: getSize
+    # Purpose: get the number of bytes needed to store a file
+    # Arguments:
+    #     numSteps: number of time-steps in the file
+    #     shape: dimensions of the grid (x, y, z)
+    # Return:
+    #     number of bytes used by the concentration and type arrays
+    @staticmethod
+    def getSize (numSteps, shape):
+        numSamples = numSteps * shape[0] * shape[1] * shape[2]
+        return numSamples * (np.dtype(np.int32).itemsize + np.dtype(np.int16).itemsize)
+
+    # Function: getPosition
+    # Purpose: convert a coordinate string into an index of the arrays
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     coordsString: coordinates as a string (as created by Parse.getCoordsString)
+    # Return:
+    #     tuple of array indices (None if the coordinates are not stored)
+    def getPosition (self, coordsString):
+        try:
+            coords = tuple(int(element) for element in coordsString.split(","))
+        except ValueError:
+            return None
+        if (len(coords) != self.dim):
+            return None
+        coords += (0,) * (3 - len(coords))
+        for axis, coord in enumerate(coords):
+            if (coord < 0 or coord >= self.present.shape[axis]):
+                return None
+        if (not self.present[coords]):
+            return None
+        return coords
+
+    # Function: getConcentrations
+    # Purpose: get the concentration of a cell at every time-step
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     coordsString: coordinates as a string
+    # Return:
+    #     array of concentrations (None if the coordinates are not stored)
+    def getConcentrations (self, coordsString):
+        position = self.getPosition(coordsString)
+        if (position is None):
+            return None
+        return self.concentrations[(slice(None),) + position]
+
+    # Function: getTypes
+    # Purpose: get the type of a cell at every time-step
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     coordsString: coordinates as a string
+    # Return:
+    #     array of cell types (None if the coordinates are not stored)
+    def getTypes (self, coordsString):
+        position = self.getPosition(coordsString)
+        if (position is None):
+            return None
+        return self.types[(slice(None),) + position]
+
+    # Determine whether a set of coordinates is stored (same as a dictionary of coordinate strings)
+    def __contains__ (self, coordsString):
+        return self.getPosition(coordsString) is not None
+
+    # Get the number of stored coordinates
+    def __len__ (self):
+        return int(np.count_nonzero(self.present))
+
+    # Get the DataPoint objects of a set of coordinates (created only when requested)
+    def __getitem__ (self, coordsString):
+        concentrations = self.getConcentrations(coordsString)
+        if (concentrations is None):
+            raise KeyError(coordsString)
+        return [DataPoint(int(time), int(conc)) for time, conc in zip(self.times, concentrations)]
@@ -2,6 +2,7 @@
 # Thomas Roller
 
 from Actions import Actions
+from CellStore import CellStore
 import tkinter.filedialog
 import tkinter as tk
 
@@ -21,7 +22,7 @@ class Interface (tk.Frame):
         self.loadThread = None  # used when loading in cell data (non-transient mode only)
         self.filename = filename
         self.transient = transient
-        self.cellDict = {}
+        self.cellDict = CellStore()
         self.master = master
         self.master.title("Graph Generator")
         self.pack()
@@ -59,30 +59,70 @@ class Parse:
                 dataPoint = Parse.getDataPoint(currTime, line)
                 if (currCoords not in dataPoints):
                     dataPoints[currCoords] = [dataPoint]
-                elif (dataPoint not in dataPoints[currCoords]):
+                elif (dataPoints[currCoords][-1] != dataPoint):  # lines are in time order, so only the last DataPoint can match
                     dataPoints[currCoords].append(dataPoint)
 
         print("Cleaning data points...")
-        return Parse.cleanDataPoints(filename, dataPoints, currTime)
+        synthesized = {}
+        dataPoints = Parse.cleanDataPoints(filename, dataPoints, currTime, synthesized)
+        Parse.printSynthesized(synthesized, currTime)
+        return dataPoints
 
     # Function: cleanDataPoints
     # Purpose: adds missing DataPoint objects that could not parsed from a file
+    #          (each missing time-step repeats the previous concentration, or the first one for leading time-steps)
     # Arguments:
     #     filename: name of file from which the DataPoint objects were parsed
     #     dataPoints: dictionary of dataPoints before being cleaned
+    #     numSteps: number of time-steps to fill (0 to numSteps - 1, DataPoints of later time-steps are kept after them)
+    #     synthesized: dictionary in which to record the number of DataPoint objects added for each coordinate (optional)
     # Return:
     #     dictionary containing complete set of DataPoints
     @staticmethod
-    def cleanDataPoints (filename, dataPoints, numSteps):
+    def cleanDataPoints (filename, dataPoints, numSteps, synthesized=None):
         for key in dataPoints:
+            # Place the parsed DataPoints at the index of their time-step
+            samples = [None] * numSteps
+            later = []
+            for dataPoint in dataPoints[key]:
+                time = dataPoint.getTime()
+                if (0 <= time < numSteps):
+                    if (samples[time] is None):
+                        samples[time] = dataPoint
+                else:
+                    later.append(dataPoint)
+
+            # Fill the gaps in a single forward pass
+            previous = next((dataPoint for dataPoint in samples if dataPoint is not None), dataPoints[key][0])
+            count = 0
             for i in range(0, numSteps):
-                if (i < len(dataPoints[key])):
-                    if (dataPoints[key][i].getTime() != i):
-                        dataPoints[key].insert(i, DataPoint(i, dataPoints[key][i - 1].getConcentration()))
+                if (samples[i] is None):
+                    samples[i] = DataPoint(i, previous.getConcentration())
+                    count += 1
                 else:
-                    dataPoints[key].append(DataPoint(i, dataPoints[key][-1].getConcentration()))
+                    previous = samples[i]
+
+            dataPoints[key] = samples + later
+            if (synthesized is not None):
+                synthesized[key] = count
         return dataPoints
 
+    # Function: printSynthesized
+    # Purpose: print how many DataPoint objects had to be added while cleaning (indicates how sparse a file is)
+    # Arguments:
+    #     synthesized: dictionary containing the number of DataPoint objects added for each coordinate
+    #     numSamples: number of time-steps filled for each coordinate
+    # Return:
+    #     none
+    @staticmethod
+    def printSynthesized (synthesized, numSamples):
+        if (len(synthesized) == 0 or numSamples == 0):
+            return
+        total = sum(synthesized.values())
+        sparsest = max(synthesized, key=synthesized.get)
+        print(f"Synthesized data points: {total} of {len(synthesized) * numSamples} ({round(total * 100 / (len(synthesized) * numSamples), 2)}%)")
+        print(f"Sparsest coordinates: {sparsest} ({synthesized[sparsest]} of {numSamples} synthesized)")
+
     # Function: matchCoords
     # Purpose: determine whether a line contains information about a set of  coordinates
     # Arguments:
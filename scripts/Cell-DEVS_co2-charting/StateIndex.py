@@ -0,0 +1,264 @@
+# Carleton University (ARSLab)
+
+from DataPoint import DataPoint
+from Parse import Parse
+from array import array
+from bisect import bisect_right
+import json
+import os
+
+# Class: StateIndex
+# Purpose: byte-offset index of a Cadmium output file (built in a single pass and kept on disk as JSON)
+# Arguments:
+#     self: enclosing instance (automatic, not user specified)
+#     filename: name of the indexed file
+#     fileSize: size of the indexed file when the index was built
+#     fileTime: modification time of the indexed file when the index was built
+#     times: list of time-steps in the order they appear in the file
+#     timeOffsets: file offset of each time-step indicator (parallel to times)
+#     cellOffsets: dictionary mapping coordinate strings to the file offsets of their lines
+class StateIndex:
+
+    # Version of the on-disk index (increment when the layout changes)
+    version = 2
+
+    # Extension added to the name of the indexed file to get the name of the index file
+    extension = ".index"
+
+    # Indexes that have already been loaded (key is the name of the indexed file)
+    loaded = {}
+
+    # Constructor for the StateIndex class
+    def __init__ (self, filename, fileSize=0, fileTime=0, times=None, timeOffsets=None, cellOffsets=None):
+        self.filename = filename
+        self.fileSize = fileSize
+        self.fileTime = fileTime
+        self.times = times if times is not None else array("q")
+        self.timeOffsets = timeOffsets if timeOffsets is not None else array("q")
+        self.cellOffsets = cellOffsets if cellOffsets is not None else {}
+
+    # Function: load
+    # Purpose: get the index of a file (reusing the index on disk if it is still valid, otherwise building and saving it)
+    # Arguments:
+    #     filename: name of the file to be indexed
+    #     save: whether or not to write a newly built index to disk
+    # Return:
+    #     StateIndex instance for the file
+    @staticmethod
+    def load (filename, save=True):
+        index = StateIndex.loaded.get(filename)
+        if (index is not None and index.isCurrent()):
+            return index
+
+        index = StateIndex.read(filename)
+        if (index is None):
+            index = StateIndex.build(filename)
+            if (save):
+                index.write()
+
+        StateIndex.loaded[filename] = index
+        return index
+
+    # Function: build
+    # Purpose: scan a file once and record the offset of every time-step indicator and every cell line
+    # Arguments:
+    #     filename: name of the file to be indexed
+    # Return:
+    #     StateIndex instance for the file
+    @staticmethod
+    def build (filename):
+        stat = os.stat(filename)
+        index = StateIndex(filename, stat.st_size, stat.st_mtime_ns)
+        offset = 0
+        with open(filename, "rb") as f:
+            for line in f:
+                start = line.find(b"(")
+                if (start < 0):
+                    # Lines without coordinates are either time-step indicators or ignored
+                    try:
+                        time = int(line)
+                    except ValueError:
+                        time = None
+                    if (time is not None):
+                        index.times.append(time)
+                        index.timeOffsets.append(offset)
+                else:
+                    key = line[start + 1:line.find(b")", start)].replace(b" ", b"").decode("ascii")
+                    offsets = index.cellOffsets.get(key)
+                    if (offsets is None):
+                        offsets = index.cellOffsets[key] = array("q")
+                    offsets.append(offset)
+                offset += len(line)
+        return index
+
+    # Function: read
+    # Purpose: read the index of a file from disk
+    # Arguments:
+    #     filename: name of the indexed file
+    # Return:
+    #     StateIndex instance for the file (None if there is no index, it is not a valid index or it no longer matches the file)
+    @staticmethod
+    def read (filename):
+        try:
+            with open(StateIndex.getIndexFilename(filename), "r", encoding="ascii") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            if (data.get("version") != StateIndex.version):
+                return None
+
+            # The offsets are only trusted if the file has the size and modification time it had when it was indexed
+            index = StateIndex(filename, data["fileSize"], data["fileTime"])
+            if (not isinstance(index.fileSize, int) or not isinstance(index.fileTime, int) or not index.isCurrent()):
+                return None
+
+            index.times = array("q", data["times"])
+            index.timeOffsets = array("q", data["timeOffsets"])
+            index.cellOffsets = {key : array("q", offsets) for key, offsets in data["cellOffsets"].items()}
+        except (AttributeError, KeyError, TypeError, OverflowError):
+            return None
+
+        if (len(index.times) != len(index.timeOffsets)):
+            return None
+        for offsets in [index.timeOffsets] + list(index.cellOffsets.values()):
+            if (len(offsets) > 0 and (min(offsets) < 0 or max(offsets) >= index.fileSize)):
+                return None
+        return index
+
+    # Function: isCurrent
+    # Purpose: determine whether the indexed file is unchanged since the index was built
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     whether or not the index still matches the file
+    def isCurrent (self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        return stat.st_size == self.fileSize and stat.st_mtime_ns == self.fileTime
+
+    # Function: write
+    # Purpose: write the index to disk (next to the indexed file)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     none
+    def write (self):
+        data = {
+            "version" : StateIndex.version,
+            "fileSize" : self.fileSize,
+            "fileTime" : self.fileTime,
+            "times" : self.times.tolist(),
+            "timeOffsets" : self.timeOffsets.tolist(),
+            "cellOffsets" : {key : offsets.tolist() for key, offsets in self.cellOffsets.items()}
+        }
+        indexFilename = StateIndex.getIndexFilename(self.filename)
+        try:
+            with open(indexFilename + ".tmp", "w", encoding="ascii") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(indexFilename + ".tmp", indexFilename)
+        except OSError:
+            print(f"WARNING: Could not write index file ({indexFilename})")
+
+    # Function: getIndexFilename
+    # Purpose: get the name of the index file that belongs to a file
+    # Arguments:
+    #     filename: name of the indexed file
+    # Return:
+    #     name of the index file
+    @staticmethod
+    def getIndexFilename (filename):
+        return filename + StateIndex.extension
+
+    # Function: getTimes
+    # Purpose: get the time-steps present in the file
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     list of time-steps (in file order)
+    def getTimes (self):
+        return list(self.times)
+
+    # Function: getTimeOffset
+    # Purpose: get the file offset of a time-step indicator
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     time: time-step being searched for
+    # Return:
+    #     offset of the time-step indicator (None if the time-step is not in the file)
+    def getTimeOffset (self, time):
+        position = bisect_right(self.times, time) - 1
+        if (position < 0 or self.times[position] != time):
+            return None
+        return self.timeOffsets[position]
+
+    # Function: getCoordsStrings
+    # Purpose: get every set of coordinates present in the file
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     list of coordinate strings
+    def getCoordsStrings (self):
+        return list(self.cellOffsets.keys())
+
+    # Function: getTimeAt
+    # Purpose: get the time-step that a line of the file belongs to
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     offset: file offset of the line
+    # Return:
+    #     time-step of the line (0 if the line comes before the first time-step indicator)
+    def getTimeAt (self, offset):
+        position = bisect_right(self.timeOffsets, offset) - 1
+        if (position < 0):
+            return 0
+        return self.times[position]
+
+    # Function: getCellStates
+    # Purpose: get data on a coordinate by seeking directly to its lines (same results as Parse.getCellStates)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     coords: coordinates for which to get information
+    # Return:
+    #     list of DataPoint objects
+    def getCellStates (self, coords):
+        offsets = self.cellOffsets.get(Parse.getCoordsString(coords))
+        if (offsets is None):
+            return []
+
+        dataPoints = []
+        currTime = 0
+        timePosition = 0
+        with open(self.filename, "rb") as f:
+            for offset in offsets:
+                # Apply the time-step indicators that precede this line
+                while (timePosition < len(self.timeOffsets) and self.timeOffsets[timePosition] < offset):
+                    currTime = StateIndex.advanceTime(dataPoints, currTime, self.times[timePosition])
+                    timePosition += 1
+
+                f.seek(offset)
+                dataPoint = Parse.getDataPoint(currTime, f.readline().decode("ascii"))
+                if (len(dataPoints) == 0 or dataPoints[-1] != dataPoint):
+                    dataPoints.append(dataPoint)
+
+        # Apply the remaining time-step indicators
+        for position in range(timePosition, len(self.times)):
+            currTime = StateIndex.advanceTime(dataPoints, currTime, self.times[position])
+        return dataPoints
+
+    # Function: advanceTime
+    # Purpose: move to the next time-step, repeating the previous concentration if the cell was absent from the current one
+    # Arguments:
+    #     dataPoints: list of DataPoint objects gathered so far
+    #     currTime: time-step being left
+    #     nextTime: time-step being entered
+    # Return:
+    #     the new current time-step
+    @staticmethod
+    def advanceTime (dataPoints, currTime, nextTime):
+        if (currTime > 0 and len(dataPoints) > 0 and dataPoints[-1].getTime() != currTime):
+            dataPoints.append(DataPoint(currTime, dataPoints[-1].getConcentration()))
+        return nextTime
@@ -11,15 +11,17 @@
 # === Transient Mode ===
 # Transient mode causes the program to consult the output file each time a new graph is requested.
 # This process results in quicker initial loading times and a smaller memory footprint (especially
-# for larger output files) but requires more time to generate the graph as the entire file must
-# be parsed each time.
+# for larger output files). The first request scans the file once and saves a byte-offset index
+# next to it ("<filename>.index"); every request after that (including in later sessions, as long
+# as the output file is unchanged) seeks directly to the lines of the requested coordinates.
 #
 # == Store Mode ===
-# Store mode causes the program to load the entire output file into memory. There are no checks
-# to ensure that the file will fit into memory and the program may crash for exceedingly large
-# files. This mode also results in significant initial loading times. However, once the file is
-# loaded, subsequent requests for graphs will be very quick as the program only needs to do a
-# quick dictionary search.
+# Store mode causes the program to load the entire output file into memory. The states are kept in
+# dense NumPy arrays (a 32-bit concentration and a 16-bit cell type per cell per time-step), so the
+# memory required is known before loading starts (it is printed when the storage is allocated, and
+# files that would need more than CellStore.maxSize bytes are refused before anything is allocated).
+# This mode also results in significant initial loading times. However, once the file is loaded,
+# subsequent requests for graphs will be very quick as the program only needs to index an array.
 
 from Interface import Interface
 import sys
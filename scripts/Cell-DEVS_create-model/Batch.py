@@ -0,0 +1,213 @@
+# Converting many files at once with a pool of processes
+# Carleton University (ARSLab)
+
+import os
+import sys
+import copy
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Tools for batch conversions
+class Batch:
+
+    # Extensions of the files converted when a directory is given
+    inputFormats = ["bmp", "jpg", "jpeg", "png", "json"]
+
+    # Extension of the file (next to each output file) holding the hash of what the output was made from
+    hashExtension = ".hash"
+
+    # Function: start
+    # Purpose: convert every file of a manifest or directory, skipping outputs that are up to date
+    # Arguments:
+    #     args: arguments given by the argparse module (args.batch is the manifest or directory)
+    #     config: the configuration file given on the command line as a Python dictionary
+    # Return:
+    #     none
+    @staticmethod
+    def start (args, config):
+        critMsg = not args.no_crit_msg
+        jobs = Batch.getJobs(args.batch, config, args, critMsg=critMsg)
+
+        results = []
+        pending = []
+        with ProcessPoolExecutor(max_workers=getattr(args, "jobs", None)) as pool:
+            for job in jobs:
+                if (not getattr(args, "force", False) and Batch.isCurrent(job)):
+                    results.append([job, "skipped", 0.0, ""])
+                    continue
+                pending.append([job, pool.submit(Batch.runJob, job)])
+            for job, future in pending:
+                status, elapsed, message = future.result()
+                results.append([job, status, elapsed, message])
+
+        Batch.printSummary(results)
+        if (any(result[1] == "failed" for result in results)):
+            sys.exit(1)
+
+    # Function: getJobs
+    # Purpose: list the conversions to be done
+    # Arguments:
+    #     source: a manifest (JSON list of conversions) or a directory (every image or JSON file in it is converted)
+    #             each conversion of a manifest has an "input" and an "output", and may have a "config" (name of a
+    #             configuration file) and "dimensions"; relative paths are relative to the manifest
+    #     config: the configuration file given on the command line as a Python dictionary (default configuration)
+    #     args: arguments given by the argparse module (options shared by all the conversions)
+    #     critMsg: whether or not to show critical messages
+    # Return:
+    #     list of jobs, each as a dictionary holding the "config" (with its input and output files) and the "args"
+    @staticmethod
+    def getJobs (source, config, args, critMsg=False):
+        entries = []
+        if (os.path.isdir(source)):
+            outputDir = getattr(args, "output_dir", None) or os.path.dirname(config["files"]["output"]) or "."
+            extension = ".json.gz" if getattr(args, "gzip", False) else ".json"
+            for filename in sorted(os.listdir(source)):
+                name, fileExtension = os.path.splitext(filename)  # only the last extension (plan.v2.png gives plan.v2)
+                if (fileExtension[1:].lower() in Batch.inputFormats):
+                    entries.append({"input" : os.path.join(source, filename), "output" : os.path.join(outputDir, name + extension)})
+        else:
+            try:
+                with open(source, "r") as f:
+                    manifest = json.loads(f.read())
+            except FileNotFoundError:
+                if (critMsg): print(f"ERROR: Could not load manifest file {source}")
+                sys.exit(1)
+            base = os.path.dirname(source)
+            for entry in manifest:
+                entry = dict(entry)
+                for key in ("input", "output", "config"):
+                    if (key in entry):
+                        entry[key] = os.path.join(base, entry[key])
+                entries.append(entry)
+
+        Batch.checkOutputs(entries, critMsg)
+
+        configs = {}
+        jobs = []
+        for entry in entries:
+            jobConfig = config
+            if ("config" in entry):
+                if (entry["config"] not in configs):
+                    with open(entry["config"], "r") as f:
+                        configs[entry["config"]] = json.loads(f.read())
+                jobConfig = configs[entry["config"]]
+            jobConfig = copy.deepcopy(jobConfig)
+            jobConfig["files"]["input"] = entry["input"]
+            jobConfig["files"]["output"] = entry["output"]
+
+            jobArgs = argparse.Namespace(**vars(args))
+            jobArgs.dim = entry.get("dimensions", args.dim)
+            jobArgs.prog_msg = False  # progress messages of concurrent conversions would be mixed
+            jobs.append({"config" : jobConfig, "args" : jobArgs})
+        return jobs
+
+    # Function: checkOutputs
+    # Purpose: stop before anything is converted if conversions would overwrite each other's output or an input file
+    #          (e.g. foo.png and foo.json of a directory are both converted to foo.json)
+    # Arguments:
+    #     entries: list of conversions, each with an "input" and an "output"
+    #     critMsg: whether or not to show critical messages
+    # Return:
+    #     none
+    @staticmethod
+    def checkOutputs (entries, critMsg=False):
+        outputs = {}
+        for entry in entries:
+            outputs.setdefault(os.path.normcase(os.path.abspath(entry["output"])), []).append(entry["input"])
+        inputs = set(os.path.normcase(os.path.abspath(entry["input"])) for entry in entries)
+
+        conflicts = [[output, sources] for output, sources in outputs.items() if (len(sources) > 1 or output in inputs)]
+        if (len(conflicts) > 0):
+            if (critMsg):
+                for output, sources in conflicts:
+                    if (len(sources) > 1):
+                        print(f"ERROR: {', '.join(sources)} would all be converted to {output}")
+                    else:
+                        print(f"ERROR: The conversion of {sources[0]} would overwrite the input file {output}")
+            sys.exit(1)
+
+    # Function: getHash
+    # Purpose: get the hash of everything an output is made from (input file, configuration and options)
+    # Arguments:
+    #     job: a job (see getJobs)
+    # Return:
+    #     hexadecimal SHA-256 digest (None if the input file does not exist)
+    @staticmethod
+    def getHash (job):
+        inputFile = job["config"]["files"]["input"]
+        if (not os.path.isfile(inputFile)):
+            return None
+        digest = hashlib.sha256()
+        with open(inputFile, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        options = {
+            "config" : job["config"],
+            "dimensions" : job["args"].dim,
+            "boxes" : getattr(job["args"], "boxes", False),
+            "compact" : getattr(job["args"], "compact", False),
+            "gzip" : getattr(job["args"], "gzip", False),
+            "validate" : getattr(job["args"], "validate", False)
+        }
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    # Function: isCurrent
+    # Purpose: check whether the output of a job was made from its current input, configuration and options
+    # Arguments:
+    #     job: a job (see getJobs)
+    # Return:
+    #     True if the output does not need to be converted again
+    @staticmethod
+    def isCurrent (job):
+        outputFile = job["config"]["files"]["output"]
+        hashFile = outputFile + Batch.hashExtension
+        if (not os.path.isfile(outputFile) or not os.path.isfile(hashFile)):
+            return False
+        with open(hashFile, "r") as f:
+            return f.read().strip() == Batch.getHash(job)
+
+    # Function: runJob
+    # Purpose: convert one file (run by the processes of the pool)
+    # Arguments:
+    #     job: a job (see getJobs)
+    # Return:
+    #     list containing the status ("converted" or "failed"), the time taken (seconds) and an error message
+    @staticmethod
+    def runJob (job):
+        from Control import Control  # imported here since Control imports Batch
+
+        start = time.perf_counter()
+        try:
+            outputDir = os.path.dirname(job["config"]["files"]["output"])
+            if (outputDir != ""):
+                os.makedirs(outputDir, exist_ok=True)
+            Control.convert(job["config"], job["args"])
+        except SystemExit:
+            return ["failed", time.perf_counter() - start, "conversion stopped (see the messages above)"]
+        except Exception as error:
+            return ["failed", time.perf_counter() - start, f"{type(error).__name__}: {error}"]
+
+        with open(job["config"]["files"]["output"] + Batch.hashExtension, "w") as f:
+            f.write(Batch.getHash(job))
+        return ["converted", time.perf_counter() - start, ""]
+
+    # Function: printSummary
+    # Purpose: print the status and time taken by every conversion
+    # Arguments:
+    #     results: list of [job, status, time taken, message]
+    # Return:
+    #     none
+    @staticmethod
+    def printSummary (results):
+        width = max([len(result[0]["config"]["files"]["input"]) for result in results] + [5])
+        print(f"{'input'.ljust(width)}  {'status'.ljust(9)}  {'time (s)':>9}")
+        for job, status, elapsed, message in results:
+            line = f"{job['config']['files']['input'].ljust(width)}  {status.ljust(9)}  {elapsed:9.2f}"
+            print(line + (f"  {message}" if message else ""))
+        counts = {status : sum(1 for result in results if result[1] == status) for status in ("converted", "skipped", "failed")}
+        print(f"{counts['converted']} converted, {counts['skipped']} skipped, {counts['failed']} failed, "
+              f"{sum(result[2] for result in results):.2f} s of conversion time")
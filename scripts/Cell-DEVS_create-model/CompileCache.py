@@ -0,0 +1,148 @@
+# Cache of the intermediate products of image conversions (grids), kept on disk between runs
+# Carleton University (ARSLab)
+
+# Note that the Python module "NumPy" is required
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+# Class: CompileCache
+# Purpose: store the grids made by the stages of an image conversion (classified, scaled and extruded grids) so a
+#          conversion whose input and settings only changed for a later stage starts from that stage
+# Arguments:
+#     self: enclosing instance (automatic, not user specified)
+#     directory: directory holding the cached grids (created if needed)
+#     maxSize: maximum total size of the cached grids in bytes (the least recently used grids are removed first)
+#
+# Every grid is stored under a key that hashes everything it was made from: the key of the previous stage (or the
+# content of the image) and the settings of its own stage. Other arrays made from a scenario (e.g. the distance fields
+# of Reachability) can be stored the same way.
+class CompileCache:
+
+    extension = ".npz"
+
+    # Constructor for the CompileCache class
+    def __init__ (self, directory, maxSize=512 * 2**20):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # Function: hashFile
+    # Purpose: get the hash of a file's content
+    # Arguments:
+    #     filename: name of the file
+    # Return:
+    #     hexadecimal SHA-256 digest
+    @staticmethod
+    def hashFile (filename):
+        digest = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # Function: getKey
+    # Purpose: get the key of a stage's grid
+    # Arguments:
+    #     stage: name of the stage (e.g. "grid", "scaled", "extruded")
+    #     parts: everything the grid is made from (the key of the previous stage, settings, ...), JSON serializable
+    # Return:
+    #     hexadecimal SHA-256 digest
+    @staticmethod
+    def getKey (stage, *parts):
+        return hashlib.sha256(json.dumps([stage, parts], sort_keys=True).encode("utf-8")).hexdigest()
+
+    # Function: getFilename
+    # Purpose: get the name of the file holding a grid
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     key: key of the grid
+    # Return:
+    #     name of the file
+    def getFilename (self, key):
+        return os.path.join(self.directory, key + CompileCache.extension)
+
+    # Function: get
+    # Purpose: get a cached grid
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     key: key of the grid
+    # Return:
+    #     grid of cell states (see ConvertTools.gridToCells) or dictionary of the arrays stored, None if it is not cached
+    def get (self, key):
+        filename = self.getFilename(key)
+        try:
+            with np.load(filename) as data:
+                grid = {field : data[field] for field in data.files}
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(filename)  # mark as recently used
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return grid
+
+    # Function: put
+    # Purpose: cache a grid (and remove the least recently used grids if the cache is too large)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     key: key of the grid
+    #     grid: grid of cell states (or any dictionary of arrays)
+    # Return:
+    #     none
+    def put (self, key, grid):
+        # Written to a temporary file first, so other processes never read a partial file
+        descriptor, temporary = tempfile.mkstemp(suffix=CompileCache.extension, dir=self.directory)
+        with os.fdopen(descriptor, "wb") as f:
+            np.savez(f, **grid)
+        os.replace(temporary, self.getFilename(key))
+        self.evict()
+
+    # Function: evict
+    # Purpose: remove the least recently used grids until the cache is not larger than its maximum size
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     none
+    def evict (self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if (not filename.endswith(CompileCache.extension)):
+                continue
+            try:
+                status = os.stat(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append([status.st_mtime, status.st_size, filename])
+
+        total = sum(entry[1] for entry in entries)
+        for modified, size, filename in sorted(entries):
+            if (total <= self.maxSize):
+                break
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # Function: getStage
+    # Purpose: get a stage's grid from the cache, or make it and cache it
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     key: key of the grid
+    #     make: function (without arguments) that makes the grid
+    # Return:
+    #     grid of cell states
+    def getStage (self, key, make):
+        grid = self.get(key)
+        if (grid is None):
+            grid = make()
+            self.put(key, grid)
+        return grid
@@ -1,11 +1,35 @@
 # Class which controls the flow of the program
 # Thomas Roller
 
+import os
 import sys
 import json
 from ImageTools import ImageTools
 from ConvertTools import ConvertTools
 from GeneralTools import GeneralTools
+from ScenarioWriter import ScenarioWriter
+from Batch import Batch
+
+# NumPy is optional (without it, cells are processed one by one and the features below are not available)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# CompileCache and Validator need NumPy (any other import error is a real error)
+try:
+    from CompileCache import CompileCache
+except ImportError as error:
+    if (error.name != "numpy"):
+        raise
+    CompileCache = None
+
+try:
+    from Validator import Validator
+except ImportError as error:
+    if (error.name != "numpy"):
+        raise
+    Validator = None
 
 class Control:
 
@@ -17,8 +41,23 @@ class Control:
     #     none
     @staticmethod
     def start (args):
-        configFile = args.config
+        config = Control.loadConfig(args.config)
+
+        # Many files are converted by a pool of processes (see Batch)
+        if (getattr(args, "batch", None) is not None):
+            Batch.start(args, config)
+            return
 
+        Control.convert(config, args)
+
+    # Function: loadConfig
+    # Purpose: load a configuration file
+    # Arguments:
+    #     configFile: name of the configuration file
+    # Return:
+    #     configuration as a Python dictionary
+    @staticmethod
+    def loadConfig (configFile):
         config = ""
         try:
             # Load configuration from file
@@ -28,12 +67,27 @@ class Control:
             print("ERROR: Could not load configuation file")
             sys.exit(1)
 
+        return json.loads(config)  # Convert JSON string into dictionary
+
+    # Function: convert
+    # Purpose: convert the input file of a configuration and export the result to its output file
+    # Arguments:
+    #     config: the configuration file as a Python dictionary
+    #     args: arguments given by the argparse module (options of the conversion)
+    # Return:
+    #     none
+    @staticmethod
+    def convert (config, args):
         # Prepare command line arguments for later use
         debug = args.prog_msg
         imgMsg = args.img_msg
         critMsg = not args.no_crit_msg
+        boxes = getattr(args, "boxes", False)
 
-        config = json.loads(config)  # Convert JSON string into dictionary
+        # Grids made by earlier conversions are reused if a cache directory is given (see CompileCache)
+        cache = None
+        if (getattr(args, "cache_dir", None) is not None and np is not None):
+            cache = CompileCache(args.cache_dir, maxSize=int(getattr(args, "cache_size", None) or 512) * 2**20)
 
         # Ensure the types of files given are valid
         convertType = Control.convertType(config["files"], args.dim, critMsg=critMsg)
@@ -44,17 +98,45 @@ class Control:
         model = None
         # Input model is an image with matching dimensions
         if (convertType == "exact_image"):
-            model = Control.process_image(config, debug=debug, imgMsg=imgMsg)
+            model = Control.process_image(config, debug=debug, imgMsg=imgMsg, boxes=boxes, cache=cache)
         # Input model is an image with mismatched dimensions (guessing required)
         elif (convertType == "interpolate_image"):
-            model = Control.process_image(config, outDim=args.dim, debug=debug, imgMsg=imgMsg)
+            model = Control.process_image(config, outDim=args.dim, debug=debug, imgMsg=imgMsg, boxes=boxes, cache=cache)
         # Input model is a JSON
         elif (convertType == "json"):
-            model = Control.process_json_2Dto3D(config)
+            model = Control.process_json_2Dto3D(config, boxes=boxes)
+
+        # Check the scenario before it is written (see Validator)
+        if (getattr(args, "validate", False)):
+            model = Control.validate(model, debug=debug, critMsg=critMsg)
 
-        # Export the JSON string
+        # Export the scenario (written one cell at a time, compact and/or compressed if requested)
         if (debug): print("Exporting data to file...")
-        GeneralTools.export(config["files"]["output"], ConvertTools.getString(model))
+        ScenarioWriter.write(config["files"]["output"], model, compact=getattr(args, "compact", False),
+                             compress=(True if getattr(args, "gzip", False) else None))
+
+    # Function: validate
+    # Purpose: check a scenario and stop if it has errors (see Validator)
+    # Arguments:
+    #     model: final scenario as a Python dictionary
+    #     debug: whether or not to show debug messages
+    #     critMsg: whether or not to show critical messages
+    # Return:
+    #     the scenario (its cells are listed, since the cells made while writing can only be read once)
+    @staticmethod
+    def validate (model, debug=False, critMsg=False):
+        if (np is None):
+            if (critMsg): print("ERROR: NumPy is required to validate scenarios")
+            sys.exit(1)
+        if (debug): print("Validating scenario...")
+        if ("cells" in model and not isinstance(model["cells"], list)):
+            model["cells"] = list(model["cells"])
+        issues = Validator.validate(model)
+        if (critMsg): Validator.printIssues(issues)
+        if (len(Validator.getErrors(issues)) > 0):
+            if (critMsg): print("ERROR: The scenario has errors (it was not written)")
+            sys.exit(1)
+        return model
 
     # Function: getExtension
     # Purpose: get the extension of a file
@@ -64,6 +146,7 @@ class Control:
     #     the file's extension (lowercase)
     @staticmethod
     def getExtension (filename):
+        filename = os.path.basename(filename)  # dots in the directories are not part of the extension
         loc = filename.find(".")
         if (loc < 0 or loc >= len(filename) - 1):
             return None
@@ -105,19 +188,83 @@ class Control:
     #     debug: whether or not to show debug messages
     #     imgMsg: whether or not to show image/colour related messages
     #     critMsg: whether or not to show critical messages
+    #     boxes: whether or not to describe the cells with boxes of identical cells (see ConvertTools.gridToBoxes)
+    #     cache: CompileCache holding the grids of earlier conversions (None to make every grid)
     # Return:
     #     final scenario as a Python dictionary
     @staticmethod
-    def process_image (config, outDim=None, debug=False, imgMsg=False, critMsg=False):
+    def process_image (config, outDim=None, debug=False, imgMsg=False, critMsg=False, boxes=False, cache=None):
         if (debug): print("Preparing tools...")
         image = ImageTools(config)  # Prepare the image tools
         if (debug): print("Loading image...")
         image.load(critMsg)         # Load the image
-        if (debug): print("Making cells...")
-        cells = image.makeCells(debug=imgMsg, showProgress=debug)  # Make cells out of the image
 
         width, length = image.getWidth(), image.getLength()
 
+        # If the physical size of a pixel is known, the image can be scaled to the physical size of the cells (both in cm)
+        if (outDim is None and "pixel_size" in config["image"] and "cell_size" in config["model"]):
+            outDim = ConvertTools.getPhysicalDim([width, length], config["image"]["pixel_size"], config["model"]["cell_size"])
+            if ([width, length] == outDim):
+                outDim = None
+
+        # Grids (classified image, scaled grid, extrusion into 3D, kept in the cache) require NumPy
+        # (otherwise, or if messages about individual pixels are wanted, cells are processed one by one)
+        scaling = config["image"].get("scaling", "cells")
+        if (scaling not in ConvertTools.scalingModes):
+            if (critMsg): print(f"ERROR: Unknown scaling mode (\"{scaling}\")")
+            sys.exit(1)
+        useGrid = (np is not None and not imgMsg)
+        if (debug and np is None): print("NOTE: NumPy is not available (cells will be processed one by one)")
+        if (debug and not useGrid and scaling != "cells"): print(f"NOTE: Cells will be scaled one by one (\"{scaling}\" scaling requires grids)")
+
+        if (useGrid):
+            # Without a cache, every stage is made
+            stage = lambda key, make: make() if (cache is None) else cache.getStage(key, make)
+            key = None
+            if (cache is not None):
+                key = CompileCache.getKey("grid", CompileCache.hashFile(config["files"]["input"]),
+                                          [config["image"][setting] for setting in ("colourTolerance", "alphaTolerance", "colours")],
+                                          config["model"]["counter"])
+
+            if (debug): print("Making grid...")
+            grid = stage(key, image.makeGrid)
+
+            # If scaling is required ("cells" scales the cells of the grid one by one, the other modes by blocks)
+            if (outDim is not None):
+                if (debug): print("NOTE: Image dimensions do not match provided dimensions (inexact image interpolation will take place)")
+                if (debug): print("Scaling grid...")
+                key = None if (cache is None) else CompileCache.getKey("scaled", key, list(outDim), scaling)
+                if (scaling == "cells"):
+                    orgDim = [width, length]
+                    grid = stage(key, lambda: ConvertTools.cellsToGrid(ConvertTools.scaleCells(ConvertTools.gridToCells(grid), orgDim, outDim,
+                                                                                               debug=debug, critMsg=critMsg), list(outDim)))
+                else:
+                    grid = stage(key, lambda: ConvertTools.scaleGrid(grid, outDim, mode=scaling, debug=debug, critMsg=critMsg))
+                width, length = outDim
+
+            # Generate the head of the model
+            head = ConvertTools.createHead(width, length, config["model"])
+
+            # If the model is 3D, extrude the grid (floor and ceiling included)
+            if (config["model"]["height"] > 1):
+                if (debug): print("Extruding grid...")
+                key = None if (cache is None) else CompileCache.getKey("extruded", key,
+                    [config["model"][setting] for setting in ("height", "heights", "walls_only")])
+                grid = stage(key, lambda: ConvertTools.extrudeGrid(config["model"], grid))
+
+            if (debug and cache is not None): print(f"| Cached grids used: {cache.hits} of {cache.hits + cache.misses}")
+
+            if (boxes):
+                if (debug): print("Making boxes...")
+                return ConvertTools.createBoxStructure(head, ConvertTools.gridToBoxes(grid))
+
+            # The cells are only made while they are written to the output file
+            cells = ConvertTools.iterCells(grid)
+            return ConvertTools.createStructure(head, cells)  # Combine the head and the cells
+
+        if (debug): print("Making cells...")
+        cells = image.makeCells(debug=imgMsg, showProgress=debug)  # Make cells out of the image
+
         # If scaling is required
         if (outDim is not None):
             if (debug): print("NOTE: Image dimensions do not match provided dimensions (inexact image interpolation will take place)")
@@ -135,6 +282,10 @@ class Control:
             if (debug): print("Adding floor and ceiling...")
             cells = ConvertTools.addFloorCeiling(width, length, config["model"]["height"], cells, showProgress=debug)
 
+        if (boxes):
+            if (debug): print("Making boxes...")
+            return Control.makeBoxStructure(head, cells, critMsg=critMsg)
+
         return ConvertTools.createStructure(head, cells)  # Combine the head and the cells
 
     # Function: process_json_2Dto3D
@@ -142,10 +293,11 @@ class Control:
     # Arguments:
     #     config: the configuration file as a Python dictionary
     #     critMsg: whether or not to show critical messages
+    #     boxes: whether or not to describe the cells with boxes of identical cells (see ConvertTools.gridToBoxes)
     # Return:
     #     final scenario as a Python dictionary
     @staticmethod
-    def process_json_2Dto3D (config, critMsg=False):
+    def process_json_2Dto3D (config, critMsg=False, boxes=False):
         # Get 2D JSON
         data = ""
         inputFile = config["files"]["input"]
@@ -164,12 +316,41 @@ class Control:
         # Generate the head of the model
         head = ConvertTools.createHead(width, length, config["model"])
 
-        # Extract the cells
-        cells = data["cells"]
+        # Extract the cells (including the cells described by boxes, if any)
+        cells = ConvertTools.getCells(data)
 
         # If the model is 3D, extend the walls and add a floor and ceiling
         if (config["model"]["height"] > 1):
-            cells = ConvertTools.getExtendedCells(config["model"], cells)
-            cells = ConvertTools.addFloorCeiling(width, length, config["model"]["height"], cells)
+            # A grid holds one state per cell, so scenarios listing a cell more than once (or outside the shape) are
+            # extended cell by cell
+            inShape = all(len(cell["cell_id"]) == 2 and 0 <= cell["cell_id"][0] < width and 0 <= cell["cell_id"][1] < length for cell in cells)
+            if (np is not None and inShape and len(set(tuple(cell["cell_id"]) for cell in cells)) == len(cells)):
+                grid = ConvertTools.cellsToGrid(cells, [width, length])
+                cells = ConvertTools.gridToCells(ConvertTools.extrudeGrid(config["model"], grid))
+            else:
+                cells = ConvertTools.getExtendedCells(config["model"], cells)
+                cells = ConvertTools.addFloorCeiling(width, length, config["model"]["height"], cells)
+
+        if (boxes):
+            return Control.makeBoxStructure(head, cells, critMsg=critMsg)
 
-        return ConvertTools.createStructure(head, cells)  # Combine the head and the cells
\ No newline at end of file
+        return ConvertTools.createStructure(head, cells)  # Combine the head and the cells
+
+    # Function: makeBoxStructure
+    # Purpose: combine the head and a list of cells described with boxes of identical cells
+    # Arguments:
+    #     head: the head of the scenario (as generated by ConvertTools.createHead)
+    #     cells: list of cells
+    #     critMsg: whether or not to show critical messages
+    # Return:
+    #     final scenario as a Python dictionary
+    @staticmethod
+    def makeBoxStructure (head, cells, critMsg=False):
+        if (np is None):
+            if (critMsg): print("ERROR: NumPy is required to describe the cells with boxes")
+            sys.exit(1)
+        if (len(set(tuple(cell["cell_id"]) for cell in cells)) != len(cells)):
+            if (critMsg): print("ERROR: Cells listed more than once cannot be described with boxes")
+            sys.exit(1)
+        grid = ConvertTools.cellsToGrid(cells, head["scenario"]["shape"])
+        return ConvertTools.createBoxStructure(head, ConvertTools.gridToBoxes(grid))
\ No newline at end of file
@@ -3,17 +3,31 @@
 
 import sys
 import json
+import itertools
 from GeneralTools import GeneralTools
 
+# The Python module "NumPy" is required by the grid (array) functions, only
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Tools to bring the 2D model into 3D
 class ConvertTools:
 
+    # Cell types in order of preference when several cells are scaled into one
+    # (SOURCE over WORKSTATIONS over VENTS over DOORS over WINDOWS over WALLS over AIR)
+    cellTypes = [-200, -700, -600, -400, -500, -300, -100]
+
+    # Scaling modes: "priority" and "majority" work on a grid (see scaleGrid), "cells" uses scaleCells
+    scalingModes = ["priority", "majority", "cells"]
+
     # Function: createHead
     # Purpose: create the head of the scenario
     # Arguments:
     #     length: length of the final scenario
     #     width: width of the final scenario
-    #     modelConfig: model section of the configuration file
+    #     modelConfig: model section of the configuration file (its "cell_size" must be in cm, as read by the CO2 model)
     # Return:
     #     head of the final scenario
     @staticmethod
@@ -37,7 +51,7 @@ class ConvertTools:
                 "default_config": {
                     "CO2_cell": {
                         "co2_production": 0.026,
-                        "cell_size": 25,
+                        "cell_size": modelConfig.get("cell_size", 25),
                         "base" : 500,
                         "resp_time" : 1,
                         "window_conc": 400,
@@ -237,9 +251,311 @@ class ConvertTools:
     @staticmethod
     def getBestCell (cells):
         # Prefer SOURCE over WORKSTATIONS over VENTS over DOORS over WINDOWS over WALLS over AIR
-        cellTypes = [-200, -700, -600, -400, -500, -300, -100]  # in order of preference
+        cellTypes = ConvertTools.cellTypes  # in order of preference
         bestCell = cells[0]
         for cell in cells:
             if (cellTypes.index(cell["state"]["type"]) < cellTypes.index(bestCell["state"]["type"])):
                 bestCell = cell
-        return bestCell
\ No newline at end of file
+        return bestCell
+
+    # Function: gridToCells
+    # Purpose: turn a grid of cell states into a list of cells
+    # Arguments:
+    #     grid: dictionary of arrays indexed by coordinates: "type" (0 where there is no cell), "concentration", "counter"
+    #     showProgress: whether or not to show progress messages
+    # Return:
+    #     list of cells (ordered by X, then by Y[, then by Z])
+    @staticmethod
+    def gridToCells (grid, showProgress=False):
+        present = (grid["type"] != 0)
+        coords = np.argwhere(present).tolist()
+        types = grid["type"][present].tolist()
+        concentrations = grid["concentration"][present].tolist()
+        counters = grid["counter"][present].tolist()
+        if (not showProgress):
+            return [GeneralTools.makeCell(*state) for state in zip(coords, concentrations, types, counters)]
+        maxStep = len(coords)
+        cells = []
+        for i in range(0, maxStep):
+            GeneralTools.printProgress(i + 1, maxStep)
+            cells.append(GeneralTools.makeCell(coords[i], concentrations[i], types[i], counters[i]))
+        return cells
+
+    # Function: iterCells
+    # Purpose: make the cells of a grid one at a time (same cells, in the same order, as gridToCells)
+    #          only the cells of one X coordinate are prepared at a time, so the whole list is never held in memory
+    # Arguments:
+    #     grid: grid of cell states (see gridToCells)
+    # Return:
+    #     iterator of cells
+    @staticmethod
+    def iterCells (grid):
+        for x in range(0, grid["type"].shape[0]):
+            present = (grid["type"][x] != 0)
+            coords = np.argwhere(present).tolist()
+            types = grid["type"][x][present].tolist()
+            concentrations = grid["concentration"][x][present].tolist()
+            counters = grid["counter"][x][present].tolist()
+            for i in range(0, len(coords)):
+                yield GeneralTools.makeCell([x] + coords[i], concentrations[i], types[i], counters[i])
+
+    # Function: cellsToGrid
+    # Purpose: turn a list of cells into a grid of cell states (the reverse of gridToCells)
+    # Arguments:
+    #     cells: list of cells
+    #     dim: dimensions of the scenario
+    # Return:
+    #     dictionary of arrays with the shape dim: "type" (0 where there is no cell), "concentration", "counter"
+    @staticmethod
+    def cellsToGrid (cells, dim):
+        grid = {
+            "type" : np.zeros(dim, dtype=np.int32),
+            "concentration" : np.zeros(dim, dtype=np.int32),
+            "counter" : np.zeros(dim, dtype=np.int32)
+        }
+        for cell in cells:
+            coords = tuple(cell["cell_id"])
+            grid["type"][coords] = cell["state"]["type"]
+            grid["concentration"][coords] = cell["state"]["concentration"]
+            grid["counter"][coords] = cell["state"]["counter"]
+        return grid
+
+    # Function: getPhysicalDim
+    # Purpose: get the dimensions of a scenario whose cells have a given physical size
+    # Arguments:
+    #     orgDim: dimensions of the original scenario (or image)
+    #     pixelSize: physical size of a cell (or pixel) of the original scenario in cm
+    #     cellSize: physical size of a cell of the desired scenario in cm
+    # Return:
+    #     dimensions of the desired scenario
+    @staticmethod
+    def getPhysicalDim (orgDim, pixelSize, cellSize):
+        return [max(1, round(length * pixelSize / cellSize)) for length in orgDim]
+
+    # Function: getBlockStarts
+    # Purpose: split a dimension into blocks, one for each element of the scaled dimension
+    #          (element i of the original dimension goes to block floor(i * newLength / orgLength))
+    # Arguments:
+    #     orgLength: length of the original dimension
+    #     newLength: length of the scaled dimension (not larger than orgLength)
+    # Return:
+    #     array containing the first original element of every block
+    @staticmethod
+    def getBlockStarts (orgLength, newLength):
+        return (np.arange(newLength, dtype=np.int64) * orgLength + newLength - 1) // newLength
+
+    # Function: getTypeRanks
+    # Purpose: get the preference of every cell of a grid (see cellTypes)
+    # Arguments:
+    #     types: array of cell types (0 where there is no cell)
+    # Return:
+    #     array of ranks, from 0 (no cell) to len(cellTypes) (most preferred type)
+    @staticmethod
+    def getTypeRanks (types):
+        ranks = np.zeros(types.shape, dtype=np.int64)
+        for i, cellType in enumerate(ConvertTools.cellTypes):
+            ranks[types == cellType] = len(ConvertTools.cellTypes) - i
+        unknown = (ranks == 0) & (types != 0)
+        if (unknown.any()):
+            raise ValueError(f"Unknown cell type: {types[unknown][0]}")
+        return ranks
+
+    # Function: scaleGrid
+    # Purpose: scale a 2D grid down by reducing blocks of cells into one cell (every cell of the original grid belongs
+    #          to exactly one block, so no cell is lost at the borders)
+    # Arguments:
+    #     grid: grid of cell states (see gridToCells)
+    #     newDim: dimensions of the desired scenario
+    #     mode: "priority" (the most preferred type of the block, see cellTypes) or
+    #           "majority" (the most common type of the block, empty space included; ties go to the most preferred type)
+    #     debug: whether or not to show debug messages
+    #     critMsg: whether or not to show critical messages
+    # Return:
+    #     grid of cell states with the dimensions newDim (the state of a cell is the one of the first cell of its block,
+    #     by X then by Y, having the chosen type)
+    @staticmethod
+    def scaleGrid (grid, newDim, mode="priority", debug=False, critMsg=False):
+        types = grid["type"]
+        orgDim = list(types.shape)
+        if (orgDim[0] < newDim[0] or orgDim[1] < newDim[1]):
+            if (critMsg): print("ERROR: At least one input dimension is smaller than its respective output dimension (cannot extrapolate)")
+            sys.exit(1)
+        if (debug):
+            print(f"| Image dimensions: {orgDim}")
+            print(f"| Final dimensions: {list(newDim)}")
+            print(f"| Scaling mode: {mode}")
+
+        startsX = ConvertTools.getBlockStarts(orgDim[0], newDim[0])
+        startsY = ConvertTools.getBlockStarts(orgDim[1], newDim[1])
+        blockMax = lambda values: np.maximum.reduceat(np.maximum.reduceat(values, startsX, axis=0), startsY, axis=1)
+
+        ranks = ConvertTools.getTypeRanks(types)
+        size = types.size
+        # Larger for cells that come first (by X, then by Y)
+        first = size - 1 - np.arange(size, dtype=np.int64).reshape(types.shape)
+
+        if (mode == "priority"):
+            best = blockMax(ranks * size + first)
+            positions = size - 1 - (best % size)
+        elif (mode == "majority"):
+            numRanks = len(ConvertTools.cellTypes) + 1
+            blockSum = lambda values: np.add.reduceat(np.add.reduceat(values, startsX, axis=0), startsY, axis=1)
+            votes = np.stack([blockSum((ranks == rank).astype(np.int64)) * numRanks + rank for rank in range(0, numRanks)])
+            chosen = votes.argmax(axis=0)
+            # Give every original cell the rank chosen for its block, then find the first cell of that rank
+            blockSizesX = np.diff(np.append(startsX, orgDim[0]))
+            blockSizesY = np.diff(np.append(startsY, orgDim[1]))
+            chosen = np.repeat(np.repeat(chosen, blockSizesX, axis=0), blockSizesY, axis=1)
+            positions = size - 1 - blockMax(np.where(ranks == chosen, first, -1))
+        else:
+            raise ValueError(f"Unknown scaling mode: {mode}")
+
+        return {key : grid[key].reshape(-1)[positions] for key in ("type", "concentration", "counter")}
+
+    # Function: extrudeGrid
+    # Purpose: bring a 2D grid into 3D (same cells as getExtendedCells followed by addFloorCeiling)
+    #          every cell type is placed between the heights given by getHeights, DOOR and WINDOW columns are walls
+    #          elsewhere, and the floor and ceiling are walls wherever no other cell is placed
+    # Arguments:
+    #     modelConfig: model section of the configuration file
+    #     grid: 2D grid of cell states (see gridToCells)
+    # Return:
+    #     3D grid of cell states with the shape (width, length, height)
+    @staticmethod
+    def extrudeGrid (modelConfig, grid):
+        height = modelConfig["height"]
+        types = grid["type"]
+        kept = (types == -300) if (modelConfig["walls_only"]) else (types != 0)
+
+        # Lowest and highest level of each column (broadcast against the levels below)
+        lowest = np.zeros(types.shape, dtype=np.int64)
+        highest = np.full(types.shape, -1, dtype=np.int64)
+        for cellType in np.unique(types[kept]).tolist():
+            column = kept & (types == cellType)
+            lowest[column], highest[column] = ConvertTools.getHeights(height, modelConfig["heights"], cellType)
+
+        levels = np.arange(height, dtype=np.int64)
+        inside = kept[..., None] & (levels >= lowest[..., None]) & (levels <= highest[..., None])
+        # DOOR and WINDOW cells require walls above/below them
+        wall = (kept & ((types == -400) | (types == -500)))[..., None] & ~inside
+
+        volume = {
+            "type" : np.where(inside, types[..., None], np.where(wall, -300, 0)).astype(np.int32),
+            "concentration" : np.where(inside, grid["concentration"][..., None], 0).astype(np.int32),
+            "counter" : np.where(inside, grid["counter"][..., None], np.where(wall, -1, 0)).astype(np.int32)
+        }
+
+        # Floor and ceiling (only where there is no cell yet)
+        for level in (0, height - 1):
+            empty = (volume["type"][..., level] == 0)
+            volume["type"][..., level][empty] = -300
+            volume["concentration"][..., level][empty] = 0
+            volume["counter"][..., level][empty] = -1
+        return volume
+
+    # Function: gridToBoxes
+    # Purpose: describe a grid with boxes of identical cells (the "cell_boxes" of a scenario, see expandBoxes)
+    #          runs of identical cells along the last axis are found first, then runs with the same extent are merged
+    #          along the second axis and the resulting rectangles are merged along the first axis (greedily)
+    # Arguments:
+    #     grid: grid of cell states (see gridToCells)
+    # Return:
+    #     list of boxes, each as a dictionary with "from" and "to" (coordinates of the first and last cell, inclusive)
+    #     and "state"
+    @staticmethod
+    def gridToBoxes (grid):
+        is2D = (grid["type"].ndim == 2)
+        fields = [grid[key] if not is2D else grid[key][..., None] for key in ("type", "concentration", "counter")]
+        width, length, height = fields[0].shape
+        flat = [field.reshape(-1) for field in fields]
+
+        # Runs along the last axis: a run starts at the bottom of a column or where the state changes
+        starts = np.zeros(flat[0].shape, dtype=bool)
+        starts[::height] = True
+        for field in flat:
+            starts[1:] |= (field[1:] != field[:-1])
+        first = np.flatnonzero(starts)
+        last = np.append(first[1:], flat[0].size) - 1
+        present = (flat[0][first] != 0)
+        first, last = first[present], last[present]
+        xs, ys, zs = np.unravel_index(first, (width, length, height))
+        runs = zip(xs.tolist(), ys.tolist(), zs.tolist(), (zs + last - first).tolist(),
+                   flat[0][first].tolist(), flat[1][first].tolist(), flat[2][first].tolist())
+
+        # Merge runs with the same extent and state along the second axis, then along the first axis
+        rectangles = []
+        growing = {}
+        for x, y, z0, z1, cellType, concentration, counter in runs:
+            key = (x, z0, z1, cellType, concentration, counter)
+            rectangle = growing.get(key)
+            if (rectangle is not None and rectangle[2] == y - 1):
+                rectangle[2] = y
+            else:
+                rectangle = [x, y, y, z0, z1, cellType, concentration, counter]
+                growing[key] = rectangle
+                rectangles.append(rectangle)
+
+        boxes = []
+        growing = {}
+        for x, y0, y1, z0, z1, cellType, concentration, counter in rectangles:
+            key = (y0, y1, z0, z1, cellType, concentration, counter)
+            box = growing.get(key)
+            if (box is not None and box[1][0] == x - 1):
+                box[1][0] = x
+            else:
+                box = [[x, y0, z0], [x, y1, z1], {"concentration" : concentration, "type" : cellType, "counter" : counter}]
+                growing[key] = box
+                boxes.append(box)
+
+        dims = 2 if is2D else 3
+        return [{"from" : box[0][:dims], "to" : box[1][:dims], "state" : box[2]} for box in boxes]
+
+    # Function: createBoxStructure
+    # Purpose: combines the head and the boxes of identical cells (instead of the cells, see gridToBoxes)
+    # Arguments:
+    #     head: the head of the scenario (as generated by createHead)
+    #     boxes: list of boxes
+    # Return:
+    #     scenario as a Python dictionary (Cadmium cannot read it before its boxes are expanded, see expandScenario)
+    @staticmethod
+    def createBoxStructure (head, boxes):
+        head.pop("cells", None)
+        head["cell_boxes"] = boxes
+        return head
+
+    # Function: expandBoxes
+    # Purpose: turn boxes of identical cells into cells (the reverse of gridToBoxes)
+    # Arguments:
+    #     boxes: list of boxes, each as a dictionary with "from" and "to" (inclusive) and "state"
+    # Return:
+    #     iterator of cells (ordered by box, then by X, then by Y[, then by Z])
+    @staticmethod
+    def expandBoxes (boxes):
+        for box in boxes:
+            state = box["state"]
+            ranges = [range(start, end + 1) for start, end in zip(box["from"], box["to"])]
+            for coords in itertools.product(*ranges):
+                yield GeneralTools.makeCell(list(coords), state["concentration"], state["type"], state["counter"])
+
+    # Function: getCells
+    # Purpose: get all the cells of a scenario, including the cells described by its "cell_boxes"
+    # Arguments:
+    #     scenario: scenario as a Python dictionary
+    # Return:
+    #     list of cells
+    @staticmethod
+    def getCells (scenario):
+        return scenario.get("cells", []) + list(ConvertTools.expandBoxes(scenario.get("cell_boxes", [])))
+
+    # Function: expandScenario
+    # Purpose: turn a scenario described with "cell_boxes" into a scenario that Cadmium can read (only "cells")
+    # Arguments:
+    #     scenario: scenario as a Python dictionary
+    # Return:
+    #     scenario whose cells are given as an iterator (e.g. for ScenarioWriter), with the "cell_boxes" expanded
+    @staticmethod
+    def expandScenario (scenario):
+        expanded = {key : value for key, value in scenario.items() if key != "cell_boxes"}
+        expanded["cells"] = itertools.chain(scenario.get("cells", []), ConvertTools.expandBoxes(scenario.get("cell_boxes", [])))
+        return expanded
+
@@ -2,10 +2,17 @@
 # Thomas Roller
 
 # Note that the Python module "Pillow" is required
+# The Python module "NumPy" is optional (when it is available, images are converted much faster)
 
 import sys
 from PIL import Image
 from GeneralTools import GeneralTools
+from ConvertTools import ConvertTools
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Tools for handling images
 class ImageTools:
@@ -23,6 +30,7 @@ class ImageTools:
         self.colours = config["image"]["colours"]
         self.airColour = self.getAirColour()
         self.inputFile = config["files"]["input"]
+        self.image = None
         self.pixels = []
         self.width = self.length = 0
         self.randomGen = GeneralTools.RandomNumber(config["model"]["counter"]["seed"],
@@ -53,7 +61,31 @@ class ImageTools:
             sys.exit(1)
 
         self.width, self.length = image.size
-        self.pixels = list(image.getdata())
+        self.image = image
+        self.pixels = None  # only built if the pixel-by-pixel conversion is used (see getPixels)
+
+    # Function: getPixels
+    # Purpose: get the pixels of the loaded image as a list (in the order of image.getdata())
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     list of pixels (as tuples of RGB and maybe alpha values)
+    def getPixels (self):
+        if (self.pixels is None):
+            self.pixels = list(self.image.getdata())
+        return self.pixels
+
+    # Function: getPixelArray
+    # Purpose: get the pixels of the loaded image as an array (images without RGB values are converted first)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     array with the shape (length, width, channels), where channels is 3 (RGB) or 4 (RGBA)
+    def getPixelArray (self):
+        image = self.image
+        if (image.mode not in ("RGB", "RGBA")):
+            image = image.convert("RGBA" if ("transparency" in image.info or "A" in image.mode) else "RGB")
+        return np.asarray(image)
 
     # Function: correctColour
     # Purpose: correct colours that are not solid using the tolerance level from the configuration file
@@ -107,6 +139,11 @@ class ImageTools:
     # Return:
     #     list of cells
     def makeCells (self, debug=False, showProgress=False):
+        # Messages about individual pixels are only available pixel by pixel
+        if (np is not None and not debug):
+            return self.makeCellsVectorized(showProgress=showProgress)
+
+        pixels = self.getPixels()
         maxStep = self.width * self.length
         cells = []
         for x in range (0, self.width):
@@ -114,7 +151,7 @@ class ImageTools:
                 if (showProgress):
                     currStep = ((x + 1) * self.length) + (y + 1)
                     GeneralTools.printProgress(currStep, maxStep)
-                pixel = self.pixels[(self.width * y) + x]
+                pixel = pixels[(self.width * y) + x]
                 colour = self.getColourString(pixel, debug=debug)
                 if (colour == self.airColour):
                     continue
@@ -129,6 +166,64 @@ class ImageTools:
                 ))
         return cells
 
+    # Function: makeCellsVectorized
+    # Purpose: turn the image's pixels into cells using arrays (same cells, in the same order, as the pixel-by-pixel path)
+    # Arguments:
+    #     self: enclosing intance (automatic, not user specified)
+    #     showProgress: whether or not to show progress messages
+    # Return:
+    #     list of cells
+    def makeCellsVectorized (self, showProgress=False):
+        return ConvertTools.gridToCells(self.makeGrid(), showProgress=showProgress)
+
+    # Function: makeGrid
+    # Purpose: turn the image's pixels into a grid of cell states (one element per pixel, see ConvertTools.gridToCells)
+    #          colours are corrected by thresholding every channel at once, after which only 8 colours are possible,
+    #          so their properties are looked up in a table indexed by the packed RGB value (one bit per channel)
+    # Arguments:
+    #     self: enclosing intance (automatic, not user specified)
+    # Return:
+    #     dictionary of arrays with the shape (width, length): "type" (0 where no cell is made), "concentration", "counter"
+    def makeGrid (self):
+        pixels = self.getPixelArray()
+        rgb = pixels[..., :3].astype(np.int16)
+
+        # Same correction as correctColour: 0 or 255 within the tolerance, otherwise the closest of the two
+        solid = (rgb >= 255 - self.colourTolerance) | ((rgb > self.colourTolerance) & (rgb >= 255 / 2))
+        solid &= ~(rgb <= self.colourTolerance)
+        packed = (solid[..., 0].astype(np.uint8) << 2) | (solid[..., 1].astype(np.uint8) << 1) | solid[..., 2].astype(np.uint8)
+
+        # Lookup tables of the properties of each corrected colour (unknown colours get the properties of air)
+        types = np.zeros(8, dtype=np.int32)
+        concentrations = np.zeros(8, dtype=np.int32)
+        counters = np.zeros(8, dtype=np.int32)
+        for index in range(0, 8):
+            colour = ",".join("255" if (index >> shift) & 1 else "0" for shift in (2, 1, 0))
+            if (colour == self.airColour):
+                continue  # type 0: no cell
+            colourProperties = self.getColourProperties(colour)
+            types[index] = colourProperties["type"]
+            concentrations[index] = colourProperties["concentration"]
+            counters[index] = colourProperties["counter"]
+
+        # The grid is indexed by X, then by Y (the image is indexed by Y, then by X)
+        packed = packed.T
+        grid = {
+            "type" : types[packed],
+            "concentration" : concentrations[packed],
+            "counter" : counters[packed]
+        }
+
+        # Pixels that are skipped: transparent pixels and pixels whose alpha is neither 0 nor 255 (see getColourString)
+        if (pixels.shape[-1] == 4):
+            alpha = pixels[..., 3].T
+            grid["type"][(alpha <= self.alphaTolerance) | ((alpha != 0) & (alpha != 255))] = 0
+
+        # Each WORKSTATION gets a random counter, drawn in the order of the pixel-by-pixel path (by X, then by Y)
+        workstations = (grid["type"] == -700)
+        grid["counter"][workstations] = [self.randomGen.getInt() for i in range(0, int(np.count_nonzero(workstations)))]
+        return grid
+
     # Function: getColourProperties
     # Purpose: get the properties associated with the specified colour (designated in the configuration file)
     # Arguments:
@@ -0,0 +1,192 @@
+# Distances from the doors of a floorplan to its workstations (precomputed for the pedestrian models)
+# Carleton University (ARSLab)
+
+# Note that the Python module "NumPy" is required
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# Class: Reachability
+# Purpose: compute how far every cell of a scenario is from the nearest door, the way the pedestrian models
+#          (computer_lab_*_pedestrian_behavior, apartment_*_occupants_behavior) move occupants: one step at a time
+#          between cells sharing a face, through AIR cells only, until the destination (a WORKSTATION or a DOOR) is
+#          a neighbour
+# Arguments:
+#     self: enclosing instance (automatic, not user specified)
+#     scenario: scenario as a Python dictionary ("cells" and/or "cell_boxes")
+#     layer: for 3D scenarios, the Z coordinate of the layer occupants walk on (None to search the whole volume)
+#     cache: CompileCache keeping the distance fields on disk (None to keep them in memory only)
+#
+# Distances are numbers of steps, -1 for cells that cannot be reached. The distance field only depends on the
+# floorplan (which cells can be walked on and where the doors are), so it is computed once per floorplan and reused
+# by scenarios that only differ in the position of occupants or vents.
+class Reachability:
+
+    # Occupants (CO2_SOURCE, EXPOSED_CO2_SOURCE) only stand on AIR cells, which they leave when they move
+    walkableTypes = [-100, -200, -250]
+    doorType = -400
+    workstationType = -700
+
+    # Distance fields of the last floorplans (in memory, most recently used last)
+    fields = OrderedDict()
+    maxFields = 64
+
+    # Constructor for the Reachability class
+    def __init__ (self, scenario, layer=None, cache=None):
+        self.types = Reachability.getTypes(scenario)
+        if (layer is not None and self.types.ndim == 3):
+            self.types = self.types[:, :, layer]
+        doors = (self.types == Reachability.doorType)
+        walkable = np.isin(self.types, Reachability.walkableTypes)
+
+        self.distances = Reachability.getField(doors, walkable, cache=cache)
+        # Workstations are not walked on: they are reached from a neighbouring cell
+        self.distances = Reachability.getTargetDistances(self.distances, self.types == Reachability.workstationType)
+
+    # Function: getTypes
+    # Purpose: get the type of every cell of a scenario
+    # Arguments:
+    #     scenario: scenario as a Python dictionary ("cells" and/or "cell_boxes")
+    # Return:
+    #     array of types with the shape of the scenario (cells outside the shape are ignored)
+    @staticmethod
+    def getTypes (scenario):
+        shape = scenario["scenario"]["shape"]
+        types = np.full(shape, scenario["scenario"].get("default_state", {}).get("type", -100), dtype=np.int32)
+        for cell in scenario.get("cells", []):
+            coords = cell["cell_id"]
+            if (len(coords) == len(shape) and all(0 <= coord < length for coord, length in zip(coords, shape))):
+                types[tuple(coords)] = cell["state"]["type"]
+        for box in scenario.get("cell_boxes", []):
+            types[tuple(slice(max(start, 0), end + 1) for start, end in zip(box["from"], box["to"]))] = box["state"]["type"]
+        return types
+
+    # Function: getDistances
+    # Purpose: breadth-first search from a set of cells, one wavefront of cells at a time (every cell is visited once)
+    # Arguments:
+    #     sources: boolean array of the cells the search starts from (distance 0)
+    #     passable: boolean array of the cells the search can step on
+    # Return:
+    #     array of distances (number of steps between cells sharing a face, -1 for cells that are not reached)
+    @staticmethod
+    def getDistances (sources, passable):
+        shape = sources.shape
+        distances = np.full(sources.size, -1, dtype=np.int32)
+        passable = passable.ravel()
+        frontier = np.flatnonzero(sources)
+        distances[frontier] = 0
+        strides = [int(np.prod(shape[axis + 1:])) for axis in range(0, len(shape))]
+        # Keeps one copy of the cells reached from several cells of the wavefront (without sorting)
+        first = np.zeros(sources.size, dtype=np.int64)
+        distance = 0
+        while (frontier.size > 0):
+            distance += 1
+            coords = np.unravel_index(frontier, shape)
+            neighbours = []
+            # Neighbours sharing a face, without crossing the edges of the grid
+            for axis in range(0, len(shape)):
+                neighbours.append(frontier[coords[axis] > 0] - strides[axis])
+                neighbours.append(frontier[coords[axis] < shape[axis] - 1] + strides[axis])
+            neighbours = np.concatenate(neighbours)
+            neighbours = neighbours[passable[neighbours] & (distances[neighbours] < 0)]
+            # (of the positions written for a cell, only one is kept, and only that position matches)
+            order = np.arange(neighbours.size)
+            first[neighbours] = order
+            frontier = neighbours[first[neighbours] == order]
+            distances[frontier] = distance
+        return distances.reshape(shape)
+
+    # Function: getTargetDistances
+    # Purpose: give cells that cannot be stepped on (e.g. workstations) the distance of their nearest neighbour plus one
+    # Arguments:
+    #     distances: array of distances (see getDistances)
+    #     targets: boolean array of the cells to be given a distance
+    # Return:
+    #     array of distances (a copy)
+    @staticmethod
+    def getTargetDistances (distances, targets):
+        unreached = np.iinfo(np.int32).max
+        padded = np.pad(np.where(distances < 0, unreached, distances), 1, constant_values=unreached)
+        nearest = np.full(distances.shape, unreached, dtype=np.int64)
+        centre = tuple(slice(1, length + 1) for length in distances.shape)
+        for axis in range(0, distances.ndim):
+            for offset in (-1, 1):
+                view = list(centre)
+                view[axis] = slice(1 + offset, distances.shape[axis] + 1 + offset)
+                nearest = np.minimum(nearest, padded[tuple(view)])
+        distances = distances.copy()
+        update = targets & (distances < 0) & (nearest < unreached)
+        distances[update] = nearest[update] + 1
+        return distances
+
+    # Function: getField
+    # Purpose: get the distance field of a floorplan, computed only if it is not in memory (or in the cache)
+    # Arguments:
+    #     sources: boolean array of the cells the search starts from
+    #     passable: boolean array of the cells the search can step on
+    #     cache: CompileCache keeping the distance fields on disk (None to keep them in memory only)
+    # Return:
+    #     array of distances (see getDistances), shared with later calls (do not modify it)
+    @staticmethod
+    def getField (sources, passable, cache=None):
+        digest = hashlib.sha256(str(sources.shape).encode("utf-8"))
+        digest.update(np.packbits(sources).tobytes())
+        digest.update(np.packbits(passable).tobytes())
+        key = digest.hexdigest()
+
+        if (key in Reachability.fields):
+            Reachability.fields.move_to_end(key)
+            return Reachability.fields[key]
+
+        arrays = None if (cache is None) else cache.get(key)
+        if (arrays is not None):
+            distances = arrays["distances"]
+        else:
+            distances = Reachability.getDistances(sources, passable)
+            if (cache is not None):
+                cache.put(key, {"distances" : distances})
+
+        Reachability.fields[key] = distances
+        if (len(Reachability.fields) > Reachability.maxFields):
+            Reachability.fields.popitem(last=False)
+        return distances
+
+    # Function: getWorkstations
+    # Purpose: get the distance from the nearest door to every workstation
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     list of [cell_id, distance] (distance -1 if the workstation cannot be reached), ordered by cell_id
+    def getWorkstations (self):
+        coords = np.argwhere(self.types == Reachability.workstationType)
+        return [[position, int(self.distances[tuple(position)])] for position in coords.tolist()]
+
+    # Function: getUnreachable
+    # Purpose: get the workstations that cannot be reached from a door
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     list of cell_ids
+    def getUnreachable (self):
+        return [position for position, distance in self.getWorkstations() if distance < 0]
+
+    # Function: isFeasible
+    # Purpose: check whether every workstation can be reached from a door
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    # Return:
+    #     True if the layout is feasible
+    def isFeasible (self):
+        return len(self.getUnreachable()) == 0
+
+    # Function: write
+    # Purpose: write the distance field and the types of the cells to a NumPy file (.npz)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     filename: name of the file to be created
+    # Return:
+    #     none
+    def write (self, filename):
+        with open(filename, "wb") as f:
+            np.savez_compressed(f, distances=self.distances, types=self.types)
@@ -0,0 +1,92 @@
+# Writing scenarios to files without building the whole JSON document in memory
+# Carleton University (ARSLab)
+
+import json
+import gzip
+
+# Tools for writing scenarios (the cells are serialized and written one at a time)
+class ScenarioWriter:
+
+    # Function: write
+    # Purpose: write a scenario to a file
+    #          in the indented format, the file is identical to json.dumps(scenario, indent=4)
+    # Arguments:
+    #     filename: name of the file to be created (compressed with gzip if the name ends with ".gz")
+    #     scenario: scenario as a Python dictionary (its lists, such as "cells", may also be iterators of cells)
+    #     compact: whether or not to leave out all whitespace (smaller files that are faster to parse)
+    #     compress: whether or not to compress the file with gzip (None to decide from the file name)
+    # Return:
+    #     none
+    @staticmethod
+    def write (filename, scenario, compact=False, compress=None):
+        if (compress is None):
+            compress = filename.endswith(".gz")
+        if (compress):
+            with gzip.open(filename, "wt", encoding="utf-8") as f:
+                ScenarioWriter.dump(f, scenario, compact=compact)
+        else:
+            with open(filename, "w") as f:
+                ScenarioWriter.dump(f, scenario, compact=compact)
+
+    # Function: dump
+    # Purpose: write a scenario to an open text file
+    # Arguments:
+    #     f: file (or any object with a write method)
+    #     scenario: scenario as a Python dictionary (its lists, such as "cells", may also be iterators of cells)
+    #     compact: whether or not to leave out all whitespace
+    # Return:
+    #     none
+    @staticmethod
+    def dump (f, scenario, compact=False):
+        if (len(scenario) == 0):
+            f.write("{}")
+            return
+        # The same layout as json.dumps(indent=4): one entry per line, nested values indented by 4 more spaces
+        indent = "" if compact else "\n    "
+        keySeparator = ":" if compact else ": "
+
+        f.write("{")
+        first = True
+        for key, value in scenario.items():
+            f.write(("" if first else ",") + indent + json.dumps(key) + keySeparator)
+            first = False
+            if (isinstance(value, (dict, str, int, float, bool)) or value is None):
+                f.write(ScenarioWriter.getString(value, indent, compact))
+            else:
+                ScenarioWriter.dumpList(f, value, indent, compact)
+        f.write("}" if compact else "\n}")
+
+    # Function: dumpList
+    # Purpose: write a list (or the items of an iterator) one item at a time
+    # Arguments:
+    #     f: file (or any object with a write method)
+    #     items: list or iterator of items
+    #     indent: newline and indentation of the line holding the list (empty if compact)
+    #     compact: whether or not to leave out all whitespace
+    # Return:
+    #     none
+    @staticmethod
+    def dumpList (f, items, indent, compact):
+        itemIndent = indent + ("" if compact else "    ")
+        first = True
+        for item in items:
+            f.write(("[" if first else ",") + itemIndent + ScenarioWriter.getString(item, itemIndent, compact))
+            first = False
+        if (first):
+            f.write("[]")  # empty list
+        else:
+            f.write(indent + "]")
+
+    # Function: getString
+    # Purpose: get the JSON string of a value nested in the scenario
+    # Arguments:
+    #     value: value to be serialized
+    #     indent: newline and indentation of the line holding the value (empty if compact)
+    #     compact: whether or not to leave out all whitespace
+    # Return:
+    #     JSON string
+    @staticmethod
+    def getString (value, indent, compact):
+        if (compact):
+            return json.dumps(value, separators=(",", ":"))
+        return json.dumps(value, indent=4).replace("\n", indent)
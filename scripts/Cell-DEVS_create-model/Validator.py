@@ -0,0 +1,127 @@
+# Checking scenarios for mistakes that are otherwise only found after a simulation
+# Carleton University (ARSLab)
+
+# Note that the Python module "NumPy" is required
+
+import numpy as np
+from ConvertTools import ConvertTools
+from Reachability import Reachability
+
+# Tools for checking scenarios
+#
+# The cells are placed in a dense grid index (the position of the cell listed at every coordinate), so every check is
+# one pass over the cells or over the grid:
+#     "bounds": cell_id with the wrong number of coordinates or outside the shape of the scenario
+#     "duplicate": coordinates listed more than once (e.g. a vent or occupant placed over a wall)
+#     "type": cell type unknown to the CO2 model
+#     "unreachable": occupant or workstation that cannot be reached from a door without crossing a wall
+class Validator:
+
+    # Types known to the CO2 model (EXPOSED_CO2_SOURCE is only produced by the simulation, but is accepted)
+    knownTypes = ConvertTools.cellTypes + [-250]
+
+    wallType = -300
+    doorType = -400
+    # Occupants (CO2_SOURCE, EXPOSED_CO2_SOURCE) and WORKSTATION cells need a path to a door
+    reachableTypes = [-200, -250, -700]
+
+    # Function: validate
+    # Purpose: check a scenario
+    # Arguments:
+    #     scenario: scenario as a Python dictionary ("cells" and/or "cell_boxes")
+    #     checks: names of the checks to run (all of them by default)
+    # Return:
+    #     list of issues, each as a dictionary with a "level" ("error" or "warning"), a "check", a "cell_id" (None if
+    #     the issue is not about one cell) and a "message"
+    @staticmethod
+    def validate (scenario, checks=("bounds", "duplicate", "type", "unreachable")):
+        shape = list(scenario["scenario"]["shape"])
+        defaultType = scenario["scenario"].get("default_state", {}).get("type", -100)
+        cells = ConvertTools.getCells(scenario)
+        issues = []
+
+        # Grid index: position (in cells) of the last cell listed at every coordinate, -1 where no cell is listed
+        index = np.full(shape, -1, dtype=np.int64)
+        types = np.full(shape, defaultType, dtype=np.int64)
+        for i, cell in enumerate(cells):
+            coords = cell["cell_id"]
+            if (len(coords) != len(shape) or any(coord < 0 or coord >= length for coord, length in zip(coords, shape))):
+                if ("bounds" in checks):
+                    issues.append(Validator.makeIssue("error", "bounds", coords,
+                                                      f"outside the shape {shape} of the scenario"))
+                continue
+            coords = tuple(coords)
+            cellType = cell["state"]["type"]
+            if (index[coords] >= 0 and "duplicate" in checks):
+                issues.append(Validator.makeIssue("error", "duplicate", list(coords),
+                                                  f"listed more than once (types {cells[index[coords]]['state']['type']} and {cellType})"))
+            if (cellType not in Validator.knownTypes and "type" in checks):
+                issues.append(Validator.makeIssue("error", "type", list(coords), f"unknown cell type {cellType}"))
+            index[coords] = i
+            types[coords] = cellType
+
+        if ("unreachable" in checks):
+            issues += Validator.checkReachable(types)
+        return issues
+
+    # Function: checkReachable
+    # Purpose: find the occupants and workstations that cannot be reached from a door without crossing a wall
+    # Arguments:
+    #     types: array of the type of every cell of the scenario
+    # Return:
+    #     list of issues
+    @staticmethod
+    def checkReachable (types):
+        doors = (types == Validator.doorType)
+        targets = np.isin(types, Validator.reachableTypes)
+        if (not targets.any()):
+            return []
+        if (not doors.any()):
+            return [Validator.makeIssue("warning", "unreachable", None, "no door (the occupants and workstations were not checked)")]
+        # Any cell but a wall can be crossed (the distance field is shared by scenarios with the same walls and doors)
+        reached = (Reachability.getField(doors, types != Validator.wallType) >= 0)
+        return [Validator.makeIssue("error", "unreachable", coords, f"type {types[tuple(coords)]} cannot be reached from a door")
+                for coords in np.argwhere(targets & ~reached).tolist()]
+
+    # Function: makeIssue
+    # Purpose: make an issue found by a check
+    # Arguments:
+    #     level: "error" (the scenario should not be simulated) or "warning"
+    #     check: name of the check
+    #     coords: coordinates of the cell concerned (None if the issue is not about one cell)
+    #     message: description of the issue
+    # Return:
+    #     issue as a dictionary
+    @staticmethod
+    def makeIssue (level, check, coords, message):
+        return {"level" : level, "check" : check, "cell_id" : coords, "message" : message}
+
+    # Function: getErrors
+    # Purpose: keep the errors of a list of issues
+    # Arguments:
+    #     issues: list of issues (see validate)
+    # Return:
+    #     list of the issues whose level is "error"
+    @staticmethod
+    def getErrors (issues):
+        return [issue for issue in issues if issue["level"] == "error"]
+
+    # Function: printIssues
+    # Purpose: print a list of issues (the issues of each check are counted, only the first ones are printed)
+    # Arguments:
+    #     issues: list of issues (see validate)
+    #     limit: maximum number of issues printed for each check
+    # Return:
+    #     none
+    @staticmethod
+    def printIssues (issues, limit=10):
+        printed = {}
+        for issue in issues:
+            printed[issue["check"]] = printed.get(issue["check"], 0) + 1
+            if (printed[issue["check"]] > limit):
+                continue
+            location = "" if issue["cell_id"] is None else f" {issue['cell_id']}"
+            print(f"{issue['level'].upper()}: {issue['check']}{location}: {issue['message']}")
+        for check, count in printed.items():
+            if (count > limit):
+                print(f"| {count - limit} more {check} issues")
@@ -43,9 +43,77 @@ argParser.add_argument("--no-crit-msg",
                        help="turn off critical messages",
                        dest="no_crit_msg")
 
-args = argParser.parse_args()
+argParser.add_argument("--compact",
+                       "-m",
+                       action="store_true",
+                       help="write the output scenario without whitespace (smaller and faster to parse)",
+                       dest="compact")
+
+argParser.add_argument("--gzip",
+                       "-z",
+                       action="store_true",
+                       help="compress the output scenario with gzip (also done when the output file name ends with \".gz\")",
+                       dest="gzip")
+
+argParser.add_argument("--boxes",
+                       "-b",
+                       action="store_true",
+                       help="describe the cells with boxes of identical cells (\"cell_boxes\", use expand.py before simulating)",
+                       dest="boxes")
+
+argParser.add_argument("--validate",
+                       "-v",
+                       action="store_true",
+                       help="check the output scenario (duplicate cells, cells outside the shape, unreachable occupants) and do not write it if it has errors",
+                       dest="validate")
+
+argParser.add_argument("--batch",
+                       type=str,
+                       action="store",
+                       help="convert every file of a manifest (JSON list of conversions) or directory, in parallel",
+                       metavar="path",
+                       dest="batch")
+
+argParser.add_argument("--output-dir",
+                       type=str,
+                       action="store",
+                       help="directory of the output scenarios when a directory is given to --batch",
+                       metavar="path",
+                       dest="output_dir")
+
+argParser.add_argument("--jobs",
+                       "-j",
+                       type=int,
+                       action="store",
+                       help="number of conversions done at the same time with --batch (default: one per CPU)",
+                       metavar="int",
+                       dest="jobs")
+
+argParser.add_argument("--force",
+                       "-f",
+                       action="store_true",
+                       help="with --batch, convert files whose output is up to date",
+                       dest="force")
+
+argParser.add_argument("--cache-dir",
+                       type=str,
+                       action="store",
+                       help="directory in which the grids made by conversions are kept and reused by later conversions",
+                       metavar="path",
+                       dest="cache_dir")
+
+argParser.add_argument("--cache-size",
+                       type=int,
+                       action="store",
+                       help="maximum size of the cache directory in MB (default: 512)",
+                       metavar="int",
+                       dest="cache_size")
+
+# The processes used by --batch may import this file, so the conversion only starts when the program is run
+if __name__ == "__main__":
+    args = argParser.parse_args()
 
-try:
-    Control.start(args)
-except KeyboardInterrupt:
-    if (not args.no_crit_msg): print("Caught interrupt")
\ No newline at end of file
+    try:
+        Control.start(args)
+    except KeyboardInterrupt:
+        if (not args.no_crit_msg): print("Caught interrupt")
\ No newline at end of file
@@ -0,0 +1,66 @@
+# Program to compute the distances from the doors of a scenario to its workstations (pedestrian models)
+# Carleton University (ARSLab)
+
+import sys
+import json
+import gzip
+import argparse
+from Reachability import Reachability
+from CompileCache import CompileCache
+
+argParser = argparse.ArgumentParser(description="Compute the distances from the doors of a CO2 scenario to its workstations",
+                                    allow_abbrev=False)
+
+argParser.add_argument("input",
+                       type=str,
+                       action="store",
+                       help="path to the scenario (compressed if the name ends with \".gz\")")
+
+argParser.add_argument("--layer",
+                       "-l",
+                       type=int,
+                       action="store",
+                       help="Z coordinate of the layer occupants walk on in 3D scenarios (default: the whole volume)",
+                       metavar="int",
+                       dest="layer")
+
+argParser.add_argument("--output",
+                       "-o",
+                       type=str,
+                       action="store",
+                       help="write the distance field and the types of the cells to a NumPy file (.npz)",
+                       metavar="path",
+                       dest="output")
+
+argParser.add_argument("--cache-dir",
+                       type=str,
+                       action="store",
+                       help="directory in which the distance fields are kept and reused for scenarios with the same floorplan",
+                       metavar="path",
+                       dest="cache_dir")
+
+args = argParser.parse_args()
+
+try:
+    with (gzip.open(args.input, "rt", encoding="utf-8") if args.input.endswith(".gz") else open(args.input, "r")) as f:
+        scenario = json.loads(f.read())
+except FileNotFoundError:
+    print(f"ERROR: Could not load input file {args.input}")
+    sys.exit(1)
+
+cache = None if (args.cache_dir is None) else CompileCache(args.cache_dir)
+reachability = Reachability(scenario, layer=args.layer, cache=cache)
+
+workstations = reachability.getWorkstations()
+for position, distance in workstations:
+    print(f"{position}: {distance if distance >= 0 else 'unreachable'}")
+unreachable = reachability.getUnreachable()
+print(f"{len(workstations)} workstations, {len(unreachable)} unreachable")
+
+if (args.output is not None):
+    reachability.write(args.output)
+
+# The exit status tells scripts whether the layout is feasible
+if (not reachability.isFeasible()):
+    print("ERROR: The layout is not feasible (workstations cannot be reached from a door)")
+    sys.exit(1)
@@ -0,0 +1,39 @@
+# Program to expand the boxes of identical cells ("cell_boxes") of a scenario into the cells read by Cadmium
+# Carleton University (ARSLab)
+
+import sys
+import json
+import gzip
+import argparse
+from ConvertTools import ConvertTools
+from ScenarioWriter import ScenarioWriter
+
+argParser = argparse.ArgumentParser(description="Expand the \"cell_boxes\" of a scenario into \"cells\"",
+                                    allow_abbrev=False)
+
+argParser.add_argument("input",
+                       type=str,
+                       action="store",
+                       help="path to the scenario with boxes (compressed if the name ends with \".gz\")")
+
+argParser.add_argument("output",
+                       type=str,
+                       action="store",
+                       help="path to the expanded scenario (compressed if the name ends with \".gz\")")
+
+argParser.add_argument("--compact",
+                       "-m",
+                       action="store_true",
+                       help="write the output scenario without whitespace",
+                       dest="compact")
+
+args = argParser.parse_args()
+
+try:
+    with (gzip.open(args.input, "rt", encoding="utf-8") if args.input.endswith(".gz") else open(args.input, "r")) as f:
+        scenario = json.loads(f.read())
+except FileNotFoundError:
+    print(f"ERROR: Could not load input file {args.input}")
+    sys.exit(1)
+
+ScenarioWriter.write(args.output, ConvertTools.expandScenario(scenario), compact=args.compact)
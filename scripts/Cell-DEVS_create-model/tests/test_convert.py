@@ -0,0 +1,116 @@
+# Tests of image conversions (run from scripts/Cell-DEVS_create-model: python3 -m unittest discover tests)
+# Carleton University (ARSLab)
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, MODEL_DIR)
+from Control import Control
+from CompileCache import CompileCache
+from Batch import Batch
+
+CONFIG_FILE = os.path.join(MODEL_DIR, "config", "config.json")
+IMAGE_FILE = os.path.join(MODEL_DIR, "input", "computer_lab_image.bmp")
+
+# Function: makeConfig
+# Purpose: get the shipped configuration, converting the shipped image into a file of a temporary directory
+# Arguments:
+#     workDir: temporary directory
+# Return:
+#     configuration as a Python dictionary
+def makeConfig (workDir):
+    config = Control.loadConfig(CONFIG_FILE)
+    config["files"]["input"] = IMAGE_FILE
+    config["files"]["output"] = os.path.join(workDir, "scenario.json")
+    return config
+
+# Function: makeArgs
+# Purpose: get the arguments of convert.py for a conversion
+# Arguments:
+#     options: arguments that differ from the defaults of convert.py
+# Return:
+#     argparse namespace
+def makeArgs (**options):
+    args = {"dim" : None, "prog_msg" : False, "img_msg" : False, "no_crit_msg" : False, "compact" : True, "gzip" : False,
+            "boxes" : False, "validate" : False, "batch" : None, "cache_dir" : None, "cache_size" : None}
+    args.update(options)
+    return argparse.Namespace(**args)
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp (self):
+        self.workDir = tempfile.mkdtemp()
+
+    def tearDown (self):
+        shutil.rmtree(self.workDir)
+
+    def test_default_config_fills_cache (self):
+        # The shipped configuration uses the default ("cells") scaling
+        config = makeConfig(self.workDir)
+        self.assertNotIn("scaling", config["image"])
+        cacheDir = os.path.join(self.workDir, "cache")
+        Control.convert(config, makeArgs(cache_dir=cacheDir))
+        self.assertTrue(os.path.isfile(config["files"]["output"]))
+        # Classified and extruded grids (the shipped model is 3D)
+        self.assertEqual(len(os.listdir(cacheDir)), 2)
+
+    def test_second_conversion_uses_cache (self):
+        cacheDir = os.path.join(self.workDir, "cache")
+        first = CompileCache(cacheDir)
+        model = Control.process_image(makeConfig(self.workDir), cache=first)
+        cells = list(model["cells"])
+        self.assertEqual([first.hits, first.misses], [0, 2])
+
+        # A new cache on the same directory (another run of convert.py) finds both grids
+        second = CompileCache(cacheDir)
+        model = Control.process_image(makeConfig(self.workDir), cache=second)
+        self.assertEqual([second.hits, second.misses], [2, 0])
+        self.assertEqual(list(model["cells"]), cells)
+
+    def test_grid_path_matches_cell_path (self):
+        # The grids (classification, "cells" scaling, ConvertTools.extrudeGrid) give the cells of the pixel-by-pixel conversion
+        # (getExtendedCells and addFloorCeiling)
+        for outDim in (None, [20, 30]):
+            grid = Control.process_image(makeConfig(self.workDir), outDim=outDim)
+            cells = Control.process_image(makeConfig(self.workDir), outDim=outDim, imgMsg=True)
+            self.assertEqual(grid["scenario"], cells["scenario"])
+            gridCells = sorted(json.dumps(cell, sort_keys=True) for cell in grid["cells"])
+            self.assertEqual(gridCells, sorted(json.dumps(cell, sort_keys=True) for cell in cells["cells"]))
+
+class BatchTest(unittest.TestCase):
+
+    def setUp (self):
+        self.workDir = tempfile.mkdtemp()
+        self.inputDir = os.path.join(self.workDir, "input")
+        os.mkdir(self.inputDir)
+
+    def tearDown (self):
+        shutil.rmtree(self.workDir)
+
+    def getOutputs (self):
+        config = makeConfig(self.workDir)
+        jobs = Batch.getJobs(self.inputDir, config, makeArgs(batch=self.inputDir, output_dir=os.path.join(self.workDir, "output")))
+        return [os.path.basename(job["config"]["files"]["output"]) for job in jobs]
+
+    def test_output_names (self):
+        # Only the last extension is replaced
+        for filename in ("plan.v2.png", "lab.BMP", "notes.txt"):
+            shutil.copy(IMAGE_FILE, os.path.join(self.inputDir, filename))
+        self.assertEqual(self.getOutputs(), ["lab.json", "plan.v2.json"])
+
+    def test_duplicate_outputs (self):
+        # foo.png and foo.json would both be converted to foo.json
+        for filename in ("foo.png", "foo.json"):
+            shutil.copy(IMAGE_FILE, os.path.join(self.inputDir, filename))
+        with self.assertRaises(SystemExit):
+            self.getOutputs()
+
+if __name__ == "__main__":
+    unittest.main()
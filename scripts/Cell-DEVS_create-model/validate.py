@@ -0,0 +1,49 @@
+# Program to check scenarios for mistakes before simulating them
+# Carleton University (ARSLab)
+
+import sys
+import json
+import gzip
+import argparse
+from Validator import Validator
+
+argParser = argparse.ArgumentParser(description="Check CO2 scenarios (duplicate cells, cells outside the shape, unknown types, unreachable occupants)",
+                                    allow_abbrev=False)
+
+argParser.add_argument("input",
+                       type=str,
+                       action="store",
+                       nargs="+",
+                       help="path to the scenarios (compressed if the name ends with \".gz\")")
+
+argParser.add_argument("--limit",
+                       "-l",
+                       type=int,
+                       action="store",
+                       default=10,
+                       help="maximum number of issues printed for each check (default: 10)",
+                       metavar="int",
+                       dest="limit")
+
+args = argParser.parse_args()
+
+failed = False
+for filename in args.input:
+    try:
+        with (gzip.open(filename, "rt", encoding="utf-8") if filename.endswith(".gz") else open(filename, "r")) as f:
+            scenario = json.loads(f.read())
+    except FileNotFoundError:
+        print(f"ERROR: Could not load input file {filename}")
+        sys.exit(1)
+    if ("scenario" not in scenario or "shape" not in scenario["scenario"]):
+        print(f"ERROR: {filename} is not a scenario (no shape)")
+        sys.exit(1)
+
+    issues = Validator.validate(scenario)
+    errors = Validator.getErrors(issues)
+    print(f"{filename}: {len(errors)} errors, {len(issues) - len(errors)} warnings")
+    Validator.printIssues(issues, limit=args.limit)
+    failed = failed or len(errors) > 0
+
+# The exit status tells scripts whether every scenario can be simulated
+sys.exit(1 if failed else 0)
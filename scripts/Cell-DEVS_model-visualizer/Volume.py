@@ -0,0 +1,209 @@
+# Dense type volume of a scenario, rendered as text or images
+# Carleton University (ARSLab)
+
+# Note that the Python module "NumPy" is required
+
+import json
+import gzip
+import zlib
+import struct
+import numpy as np
+
+# Class: Volume
+# Purpose: hold the type of every cell of a scenario in one array and render layers or slices of it
+# Arguments:
+#     self: enclosing instance (automatic, not user specified)
+#     scenario: scenario as a Python dictionary ("cells" and/or "cell_boxes")
+#
+# The array has the shape (x, y, z); 2D scenarios have a single layer (z = 0).
+class Volume:
+
+    symbols = {
+        -100 : " ",  # AIR
+        -200 : "C",  # CO2_SOURCE
+        -250 : "E",  # CO2_SOURCE exposed to a risky concentration
+        -300 : "#",  # IMPERMEABLE_STRUCTURE
+        -400 : "D",  # DOOR
+        -500 : "W",  # WINDOW
+        -600 : "V",  # VENT
+        -700 : "S"   # WORKSTATION
+    }
+    unknownSymbol = "?"
+
+    # Same colours as the images read by the create-model tool
+    colours = {
+        -100 : (255, 255, 255),  # AIR
+        -200 : (0, 255, 255),    # CO2_SOURCE
+        -250 : (255, 0, 255),    # CO2_SOURCE exposed to a risky concentration
+        -300 : (0, 0, 0),        # IMPERMEABLE_STRUCTURE
+        -400 : (0, 255, 0),      # DOOR
+        -500 : (255, 255, 0),    # WINDOW
+        -600 : (0, 0, 255),      # VENT
+        -700 : (255, 0, 0)       # WORKSTATION
+    }
+    unknownColour = (128, 128, 128)
+
+    axes = ["x", "y", "z"]
+
+    # Constructor for the Volume class
+    def __init__ (self, scenario):
+        shape = list(scenario["scenario"]["shape"])
+        self.is3D = (len(shape) == 3)
+        if (not self.is3D):
+            shape += [1]
+        self.shape = shape
+
+        # Cells that are not listed have the default type (AIR if the scenario has no default state)
+        defaultType = scenario["scenario"].get("default_state", {}).get("type", -100)
+        self.types = np.full(shape, defaultType, dtype=np.int32)
+        # Cells whose coordinates do not fit in the shape are ignored
+        for cell in scenario.get("cells", []):
+            index = self.getIndex(cell["cell_id"])
+            if (index is not None):
+                self.types[index] = cell["state"]["type"]
+        for box in scenario.get("cell_boxes", []):
+            start, end = self.getIndex(box["from"]), self.getIndex(box["to"])
+            if (start is not None and end is not None):
+                self.types[tuple(slice(first, last + 1) for first, last in zip(start, end))] = box["state"]["type"]
+
+        # Lookup tables from the types present in the volume to symbols and colours
+        self.codes, self.indices = np.unique(self.types, return_inverse=True)
+        self.indices = self.indices.reshape(shape)
+        self.symbolTable = np.array([Volume.symbols.get(int(code), Volume.unknownSymbol) for code in self.codes])
+        self.colourTable = np.array([Volume.colours.get(int(code), Volume.unknownColour) for code in self.codes], dtype=np.uint8)
+
+    # Function: load
+    # Purpose: create a Volume from a scenario file
+    # Arguments:
+    #     filename: name of the scenario file (compressed with gzip if the name ends with ".gz")
+    # Return:
+    #     Volume instance
+    @staticmethod
+    def load (filename):
+        if (filename.endswith(".gz")):
+            with gzip.open(filename, "rt", encoding="utf-8") as f:
+                return Volume(json.loads(f.read()))
+        with open(filename, "r") as f:
+            return Volume(json.loads(f.read()))
+
+    # Function: getIndex
+    # Purpose: get the index of a cell in the volume
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     coords: coordinates of the cell
+    # Return:
+    #     tuple of 3 coordinates (None if the coordinates do not fit in the shape of the scenario)
+    def getIndex (self, coords):
+        index = tuple(coords) if (self.is3D) else tuple(coords) + (0,)
+        if (len(index) != 3 or any(coord < 0 or coord >= length for coord, length in zip(index, self.shape))):
+            return None
+        return index
+
+    # Function: getNumLayers
+    # Purpose: get the number of slices along an axis
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     axis: "x", "y" or "z" (or 0, 1, 2)
+    # Return:
+    #     number of slices
+    def getNumLayers (self, axis="z"):
+        return self.shape[Volume.getAxis(axis)]
+
+    # Function: getSlice
+    # Purpose: get the positions (in the lookup tables) of the cells of an axis-aligned slice
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     axis: axis perpendicular to the slice, "x", "y" or "z" (or 0, 1, 2)
+    #     index: position of the slice along the axis
+    # Return:
+    #     2D array whose rows follow the second remaining axis and columns follow the first one
+    #     (a layer (axis "z") has one row per Y coordinate and one column per X coordinate)
+    def getSlice (self, axis, index):
+        return np.take(self.indices, index, axis=Volume.getAxis(axis)).T
+
+    # Function: renderText
+    # Purpose: render a slice with one symbol per cell
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     axis: axis perpendicular to the slice
+    #     index: position of the slice along the axis
+    #     separator: string placed between cells (e.g. " " for more accurate proportions)
+    # Return:
+    #     string with one line per row of the slice (each line ends with a newline)
+    def renderText (self, axis, index, separator=""):
+        rows = self.symbolTable[self.getSlice(axis, index)]
+        return "".join(separator.join(row) + separator + "\n" for row in rows.tolist())
+
+    # Function: renderImage
+    # Purpose: render a slice with one colour per cell
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     axis: axis perpendicular to the slice
+    #     index: position of the slice along the axis
+    #     scale: size of a cell in pixels
+    # Return:
+    #     array of RGB values with the shape (rows, columns, 3)
+    def renderImage (self, axis, index, scale=1):
+        image = self.colourTable[self.getSlice(axis, index)]
+        if (scale > 1):
+            image = image.repeat(scale, axis=0).repeat(scale, axis=1)
+        return image
+
+    # Function: exportLayers
+    # Purpose: write every slice along an axis to an image file
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     prefix: beginning of the names of the files (e.g. "out/layer_" gives "out/layer_z0.png", ...)
+    #     axis: axis perpendicular to the slices
+    #     imageFormat: "png" or "ppm"
+    #     scale: size of a cell in pixels
+    # Return:
+    #     list of the names of the files written
+    def exportLayers (self, prefix, axis="z", imageFormat="png", scale=1):
+        filenames = []
+        for index in range(0, self.getNumLayers(axis)):
+            filename = f"{prefix}{Volume.axes[Volume.getAxis(axis)]}{index}.{imageFormat}"
+            Volume.writeImage(filename, self.renderImage(axis, index, scale=scale), imageFormat)
+            filenames.append(filename)
+        return filenames
+
+    # Function: writeImage
+    # Purpose: write an RGB image to a PNG or PPM file (no imaging library is required)
+    # Arguments:
+    #     filename: name of the file to be created
+    #     image: array of RGB values with the shape (rows, columns, 3)
+    #     imageFormat: "png" or "ppm"
+    # Return:
+    #     none
+    @staticmethod
+    def writeImage (filename, image, imageFormat="png"):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        length, width = image.shape[0], image.shape[1]
+        with open(filename, "wb") as f:
+            if (imageFormat == "ppm"):
+                f.write(f"P6\n{width} {length}\n255\n".encode("ascii") + image.tobytes())
+                return
+            if (imageFormat != "png"):
+                raise ValueError(f"Unsupported image format: {imageFormat}")
+
+            # Every row starts with the filter type 0 (no filtering)
+            rows = np.zeros((length, 1 + width * 3), dtype=np.uint8)
+            rows[:, 1:] = image.reshape(length, width * 3)
+            chunk = lambda kind, data: (struct.pack(">I", len(data)) + kind + data
+                                        + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, length, 8, 2, 0, 0, 0)))
+            f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+            f.write(chunk(b"IEND", b""))
+
+    # Function: getAxis
+    # Purpose: get the position of an axis
+    # Arguments:
+    #     axis: "x", "y" or "z" (or 0, 1, 2)
+    # Return:
+    #     position of the axis (0, 1 or 2)
+    @staticmethod
+    def getAxis (axis):
+        if (isinstance(axis, str)):
+            return Volume.axes.index(axis.lower())
+        return axis
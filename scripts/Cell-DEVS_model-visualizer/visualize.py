@@ -1,33 +1,29 @@
-import json
+import argparse
 import sys
+from Volume import Volume
 
-symbols = {
-    -100 : " ",  # AIR
-    -200 : "C",  # CO2_SOURCE
-    -300 : "#",  # IMPERMEABLE_STRUCTURE
-    -400 : "D",  # DOOR
-    -500 : "W",  # WINDOW
-    -600 : "V",  # VENT
-    -700 : "S"   # WORKSTATION
-}
+argParser = argparse.ArgumentParser(description="Visualize CO2 scenarios in the terminal or as images")
+argParser.add_argument("input", help="scenario JSON (\"cells\" and/or \"cell_boxes\", compressed if the name ends with \".gz\")")
+argParser.add_argument("--layer", "-l", type=int, help="show this layer (or slice) and exit instead of prompting for layers")
+argParser.add_argument("--axis", "-a", choices=Volume.axes, default="z", help="axis perpendicular to the layers (default: z)")
+argParser.add_argument("--spacing", "-s", action="store_true", help="add a space after every cell (for more accurate proportions)")
+argParser.add_argument("--export", "-e", metavar="prefix", help="write every layer to an image file named <prefix><axis><layer>.<format> and exit")
+argParser.add_argument("--format", "-f", choices=["png", "ppm"], default="png", help="format of the exported images (default: png)")
+argParser.add_argument("--scale", type=int, default=1, help="size of a cell in pixels in the exported images (default: 1)")
+args = argParser.parse_args()
 
-if (len(sys.argv) != 2):
-    print("Usage: python3 visualizer.py <input file>")
-    sys.exit(0)
-
-config = ""
-with open(sys.argv[1], "r") as f:
-    config = f.read()
-
-config = json.loads(config)
+try:
+    volume = Volume.load(args.input)
+except FileNotFoundError:
+    print("ERROR: Could not load scenario file")
+    sys.exit(1)
 
-# Gather relevant information
-cells = {}  # key is cell_id, value is type
-for cell in config["cells"]:
-    cells[str(cell["cell_id"])] = cell["state"]["type"]
-
-is3D = (len(config["scenario"]["shape"]) == 3)
+if (args.export is not None):
+    filenames = volume.exportLayers(args.export, axis=args.axis, imageFormat=args.format, scale=args.scale)
+    print("Wrote {0} images ({1} ... {2})".format(len(filenames), filenames[0], filenames[-1]))
+    sys.exit(0)
 
+symbols = Volume.symbols
 print("""\"{0}\" -> AIR
 \"{1}\" -> CO2_SOURCE
 \"{2}\" -> IMPERMEABLE_STRUCTURE
@@ -43,42 +39,34 @@ print("""\"{0}\" -> AIR
                                  symbols[-700]))
 print()
 
+separator = " " if args.spacing else ""
+numLayers = volume.getNumLayers(args.axis)
+
+# 2D models (and a layer given on the command line) are displayed once
+if (args.layer is not None or not volume.is3D):
+    layer = args.layer if args.layer is not None else 0
+    if (layer < 0 or layer >= numLayers):
+        print("No information for layer: {0}".format(layer))
+        sys.exit(1)
+    print(volume.renderText(args.axis, layer, separator=separator))
+    sys.exit(0)
+
 response = ""
-layer = 0
 while (response != "q"):
-    prompt = ""
-    if (is3D):
-        prompt = "Show layer (\"q\" to quit): "
-        response = input("Show layer (\"q\" to quit): ")
-        if (response == "q"):
-            continue
-    else:
-        response = "q"
-
-    if (is3D):
-        try:
-            layer = int(response)
-        except ValueError:
-            print("Integer value is required")
-            print()
-            continue
+    response = input("Show layer (\"q\" to quit): ")
+    if (response == "q"):
+        continue
 
-        if (layer < 0 or layer >= config["scenario"]["shape"][2]):
-            print("No information for layer: {0}".format(layer))
-            print()
-            continue
+    try:
+        layer = int(response)
+    except ValueError:
+        print("Integer value is required")
+        print()
+        continue
 
-    result = ""
-    for y in range(0, config["scenario"]["shape"][1]):
-        for x in range(0, config["scenario"]["shape"][0]):
-            coord = [x, y]
-            if (is3D):
-                coord += [layer]
-            if (str(coord) in cells):
-                result += symbols[int(cells[str(coord)])]
-            else:
-                result += symbols[-100]
-            result += ""  # for more accurate visualizations, set this line to add a space
-        result += "\n"
+    if (layer < 0 or layer >= numLayers):
+        print("No information for layer: {0}".format(layer))
+        print()
+        continue
 
-    print(result)
\ No newline at end of file
+    print(volume.renderText(args.axis, layer, separator=separator))
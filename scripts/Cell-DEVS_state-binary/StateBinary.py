@@ -0,0 +1,301 @@
+# Conversion of Cadmium state logs into memory-mapped binary files
+# Carleton University (ARSLab)
+
+import json
+import struct
+import numpy as np
+
+# Class: StateBinary
+# Purpose: convert a Cadmium state log ("state.txt") into a binary file and read that file through a memory map
+# Arguments:
+#     self: enclosing instance (automatic, not user specified)
+#     filename: name of the binary file
+#     shape: dimensions of the cell space
+#     fields: names of the values in each cell's state (e.g. counter, concentration, type)
+#     times: array containing the time of each frame
+#     frames: memory-mapped array with shape (frame, x, y[, z], field)
+#
+# File layout:
+#     magic (8 bytes), header length (4 bytes, little endian), header (JSON), padding up to dataOffset,
+#     frames (int32, one full copy of the cell space per time-step), times (float64, one per frame)
+class StateBinary:
+
+    magic = b"CDSTATE\0"
+    version = 1
+    dataOffset = 4096  # space reserved for the header (frames start here)
+    dtype = np.dtype("<i4")
+    timesDtype = np.dtype("<f8")
+    defaultState = [-1, 500, -100]  # default state of the CO2 model (counter, concentration, type)
+
+    # Constructor for the StateBinary class (use StateBinary.open to read a file)
+    def __init__ (self, filename, shape, fields, times, frames):
+        self.filename = filename
+        self.shape = shape
+        self.fields = fields
+        self.times = times
+        self.frames = frames
+
+    # Function: convert
+    # Purpose: convert a Cadmium state log into a binary file
+    #          (cells that are not logged at a time-step keep their previous state, cells that are not logged yet have the default state)
+    # Arguments:
+    #     logFile: name of the state log
+    #     outFile: name of the binary file to be created
+    #     structureFile: name of the structure file describing the model (optional, provides the shape and field names)
+    #     shape: dimensions of the cell space (optional, overrides the structure file)
+    #     debug: whether or not to show progress messages
+    #     defaultState: values of the state of a cell before it is logged (optional, StateBinary.defaultState by default,
+    #                   or zeros if the log does not have as many values per state)
+    # Return:
+    #     number of frames written
+    @staticmethod
+    def convert (logFile, outFile, structureFile=None, shape=None, debug=False, defaultState=None):
+        fields = None
+        if (structureFile is not None):
+            structure = StateBinary.readStructure(structureFile)
+            fields = structure["fields"]
+            if (shape is None):
+                shape = structure["shape"]
+
+        # Without a shape, the log has to be scanned once to find the extent of the cell space
+        if (shape is None):
+            if (debug): print("Scanning log for the dimensions of the cell space...")
+            shape, numFields = StateBinary.scanShape(logFile)
+            if (fields is None):
+                fields = [f"field{i}" for i in range(numFields)]
+        shape = [int(length) for length in shape]
+
+        frame = None
+        times = []
+        with open(logFile, "rb") as log, open(outFile, "wb") as out:
+            out.write(b"\0" * StateBinary.dataOffset)
+            for line in log:
+                start = line.find(b"(")
+                if (start < 0):
+                    time = StateBinary.getTime(line)
+                    if (time is None):
+                        continue
+                    if (frame is None):
+                        times = [time]  # time-steps before the first logged cell have no frame
+                        continue
+                    # A new time-step starts, so the previous frame is complete
+                    out.write(frame.tobytes())
+                    times.append(time)
+                    continue
+
+                coords = tuple(int(element) for element in line[start + 1:line.find(b")", start)].split(b","))
+                values = [int(element) for element in line[line.rfind(b"<") + 1:line.rfind(b">")].split(b",")]
+                if (frame is None):
+                    if (fields is None):
+                        fields = [f"field{i}" for i in range(len(values))]
+                    shape = StateBinary.matchDimensions(shape, len(coords))
+                    frame = np.empty(shape + [len(fields)], dtype=StateBinary.dtype)
+                    frame[...] = StateBinary.getDefaultState(defaultState, len(fields))
+                    if (len(times) == 0):
+                        times.append(0.0)  # cells logged before the first time-step belong to time 0
+                if (len(coords) != len(shape) or any(coord < 0 or coord >= length for coord, length in zip(coords, shape))):
+                    raise ValueError(f"Cell {list(coords)} is outside of the cell space {shape}")
+                frame[coords] = values
+
+            if (frame is None):
+                times = []  # no cell was logged
+                fields = fields if fields is not None else []
+            else:
+                out.write(frame.tobytes())
+
+            timesOffset = out.tell()
+            out.write(np.array(times, dtype=StateBinary.timesDtype).tobytes())
+
+            header = json.dumps({
+                "version" : StateBinary.version,
+                "shape" : shape,
+                "fields" : fields,
+                "dtype" : StateBinary.dtype.str,
+                "numFrames" : len(times),
+                "framesOffset" : StateBinary.dataOffset,
+                "timesOffset" : timesOffset,
+                "timesDtype" : StateBinary.timesDtype.str
+            }).encode("utf-8")
+            if (len(StateBinary.magic) + 4 + len(header) > StateBinary.dataOffset):
+                raise ValueError("Header does not fit in the space reserved for it")
+            out.seek(0)
+            out.write(StateBinary.magic + struct.pack("<I", len(header)) + header)
+
+        if (debug): print(f"Wrote {len(times)} frames of {shape} cells ({len(fields)} values per cell)")
+        return len(times)
+
+    # Function: matchDimensions
+    # Purpose: match the dimensions of the cell space to the number of coordinates used by the log
+    #          (a structure file may give [38, 57, 1] for a model that logs 2D coordinates, and a 3D model may log
+    #          coordinates for [38, 57, 1] when [38, 57] is given)
+    # Arguments:
+    #     shape: dimensions of the cell space
+    #     numCoords: number of coordinates of the cells in the log
+    # Return:
+    #     dimensions of the cell space (only trailing dimensions of size 1 are removed or added)
+    @staticmethod
+    def matchDimensions (shape, numCoords):
+        shape = list(shape)
+        while (len(shape) > numCoords and shape[-1] == 1):
+            shape.pop()
+        while (len(shape) < numCoords):
+            shape.append(1)
+        return shape
+
+    # Function: getDefaultState
+    # Purpose: get the state of the cells that have not been logged yet
+    # Arguments:
+    #     defaultState: values of the state given to convert (None to use StateBinary.defaultState)
+    #     numFields: number of values per state
+    # Return:
+    #     list of values (one per field)
+    @staticmethod
+    def getDefaultState (defaultState, numFields):
+        if (defaultState is None):
+            return StateBinary.defaultState if len(StateBinary.defaultState) == numFields else [0] * numFields
+        if (len(defaultState) != numFields):
+            raise ValueError(f"The default state {list(defaultState)} does not have {numFields} values")
+        return list(defaultState)
+
+    # Function: open
+    # Purpose: open a binary file created by StateBinary.convert (nothing is read until the frames are accessed)
+    # Arguments:
+    #     filename: name of the binary file
+    # Return:
+    #     StateBinary instance
+    @staticmethod
+    def open (filename):
+        with open(filename, "rb") as f:
+            if (f.read(len(StateBinary.magic)) != StateBinary.magic):
+                raise ValueError(f"Not a state binary file: {filename}")
+            length = struct.unpack("<I", f.read(4))[0]
+            header = json.loads(f.read(length).decode("utf-8"))
+        if (header["version"] != StateBinary.version):
+            raise ValueError(f"Unsupported state binary version: {header['version']}")
+
+        shape = header["shape"]
+        fields = header["fields"]
+        numFrames = header["numFrames"]
+        times = np.fromfile(filename, dtype=np.dtype(header["timesDtype"]), count=numFrames, offset=header["timesOffset"])
+        if (numFrames == 0):
+            frames = np.zeros([0] + shape + [len(fields)], dtype=np.dtype(header["dtype"]))
+        else:
+            frames = np.memmap(filename, dtype=np.dtype(header["dtype"]), mode="r", offset=header["framesOffset"],
+                               shape=tuple([numFrames] + shape + [len(fields)]))
+        return StateBinary(filename, shape, fields, times, frames)
+
+    # Function: getField
+    # Purpose: get one value of every cell's state at every time-step
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     field: name or position of the value
+    # Return:
+    #     array with shape (frame, x, y[, z])
+    def getField (self, field):
+        return self.frames[..., self.getFieldIndex(field)]
+
+    # Function: getCell
+    # Purpose: get the state of a cell at every time-step
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     coords: coordinates of the cell
+    #     field: name or position of a single value to get (optional, all values by default)
+    # Return:
+    #     array with shape (frame, field), or (frame) if a field is given
+    def getCell (self, coords, field=None):
+        cell = self.frames[(slice(None),) + tuple(coords)]
+        if (field is None):
+            return cell
+        return cell[:, self.getFieldIndex(field)]
+
+    # Function: getWindow
+    # Purpose: get the frames whose times are within a range
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     start: first time included
+    #     end: first time excluded (optional, the last frame is included by default)
+    # Return:
+    #     array with shape (frame, x, y[, z], field)
+    def getWindow (self, start, end=None):
+        first = int(np.searchsorted(self.times, start, side="left"))
+        last = len(self.times) if end is None else int(np.searchsorted(self.times, end, side="left"))
+        return self.frames[first:last]
+
+    # Function: getFrameAt
+    # Purpose: get the state of the cell space at a time (the latest frame that is not after the time)
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     time: time being searched for
+    # Return:
+    #     array with shape (x, y[, z], field) (None if the time is before the first frame)
+    def getFrameAt (self, time):
+        position = int(np.searchsorted(self.times, time, side="right")) - 1
+        if (position < 0):
+            return None
+        return self.frames[position]
+
+    # Function: getFieldIndex
+    # Purpose: get the position of a value in each cell's state
+    # Arguments:
+    #     self: enclosing instance (automatic, not user specified)
+    #     field: name or position of the value
+    # Return:
+    #     position of the value
+    def getFieldIndex (self, field):
+        if (isinstance(field, str)):
+            return self.fields.index(field)
+        return field
+
+    # Function: readStructure
+    # Purpose: get the shape and field names of the cell-DEVS model described in a structure file
+    # Arguments:
+    #     structureFile: name of the structure file (as used by the ArsLab converter)
+    # Return:
+    #     dictionary containing the shape and field names (None if the structure file does not describe them)
+    @staticmethod
+    def readStructure (structureFile):
+        with open(structureFile, "r") as f:
+            structure = json.loads(f.read())
+        result = {"shape" : None, "fields" : None}
+        for modelType in structure.get("model_types", []):
+            if ("dim" in modelType):
+                result["shape"] = modelType["dim"]
+                result["fields"] = json.loads(modelType["template"])
+        return result
+
+    # Function: scanShape
+    # Purpose: find the dimensions of the cell space and the number of values per state by scanning a log
+    # Arguments:
+    #     logFile: name of the state log
+    # Return:
+    #     list containing the dimensions and the number of values per state
+    @staticmethod
+    def scanShape (logFile):
+        shape = []
+        numFields = 0
+        with open(logFile, "rb") as f:
+            for line in f:
+                start = line.find(b"(")
+                if (start < 0):
+                    continue
+                coords = [int(element) for element in line[start + 1:line.find(b")", start)].split(b",")]
+                if (len(shape) < len(coords)):
+                    shape += [0] * (len(coords) - len(shape))
+                for axis, coord in enumerate(coords):
+                    shape[axis] = max(shape[axis], coord + 1)
+                if (numFields == 0):
+                    numFields = line[line.rfind(b"<") + 1:line.rfind(b">")].count(b",") + 1
+        return [shape, numFields]
+
+    # Function: getTime
+    # Purpose: get the time from a time-step indicator line
+    # Arguments:
+    #     line: line being checked
+    # Return:
+    #     the time (None if the line is not a time-step indicator)
+    @staticmethod
+    def getTime (line):
+        try:
+            return float(line)
+        except ValueError:
+            return None
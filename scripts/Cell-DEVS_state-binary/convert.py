@@ -0,0 +1,56 @@
+# Program to convert Cadmium state logs into memory-mapped binary files
+# Carleton University (ARSLab)
+
+from StateBinary import StateBinary
+import argparse
+import time
+
+argParser = argparse.ArgumentParser(description="Convert a Cadmium state log into a memory-mapped binary file",
+                                    allow_abbrev=False)
+
+argParser.add_argument("log",
+                       type=str,
+                       action="store",
+                       help="path to the state log (e.g. results/state.txt)")
+
+argParser.add_argument("output",
+                       type=str,
+                       action="store",
+                       help="path to the binary file to be created")
+
+argParser.add_argument("--structure",
+                       "-s",
+                       type=str,
+                       action="store",
+                       help="path to the structure file of the model (provides the dimensions and field names)",
+                       dest="structure")
+
+argParser.add_argument("--dimensions",
+                       "-d",
+                       type=int,
+                       action="store",
+                       nargs="+",
+                       help="dimensions of the cell space (overrides the structure file)",
+                       metavar="int",
+                       dest="dim")
+
+argParser.add_argument("--default-state",
+                       type=int,
+                       action="store",
+                       nargs="+",
+                       help="state of the cells before they are logged (default: -1 500 -100, the default state of the CO2 model)",
+                       metavar="int",
+                       dest="default_state")
+
+argParser.add_argument("--progress-msg",
+                       "-p",
+                       action="store_true",
+                       help="turn on progress messages",
+                       dest="prog_msg")
+
+args = argParser.parse_args()
+
+startTime = time.monotonic()
+StateBinary.convert(args.log, args.output, structureFile=args.structure, shape=args.dim, debug=args.prog_msg,
+                    defaultState=args.default_state)
+if (args.prog_msg): print(f"Time taken: {time.monotonic() - startTime}s")